@@ -0,0 +1,124 @@
+#pragma once
+
+// Doorbells (named FIFOs) around the SHM ring; see SERVER/doorbell.py for
+// the protocol. Each message starts with the ringer's CLOCK_MONOTONIC time
+// in nanoseconds (u64, little-endian), which gives the wake latency.
+
+#include <cerrno>
+#include <cstdint>
+#include <cstring>
+#include <string>
+#include <vector>
+#include <algorithm>
+#include <ctime>
+
+#include <fcntl.h>
+#include <poll.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+namespace shm_ring {
+
+inline std::string doorbell_path(const std::string& shm_name, const std::string& role) {
+    return "/dev/shm/" + shm_name + "." + role + ".wake";
+}
+
+inline uint64_t monotonic_ns() {
+    timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return static_cast<uint64_t>(ts.tv_sec) * 1000000000ull + static_cast<uint64_t>(ts.tv_nsec);
+}
+
+// Waiting side: owns the FIFO and sleeps on it.
+class Doorbell {
+public:
+    ~Doorbell() {
+        if (m_fd >= 0) close(m_fd);
+        if (m_keepalive >= 0) close(m_keepalive);
+    }
+
+    bool listen(const std::string& path) {
+        if (mkfifo(path.c_str(), 0666) == -1 && errno != EEXIST) return false;
+        m_fd = open(path.c_str(), O_RDONLY | O_NONBLOCK);
+        if (m_fd < 0) return false;
+        // Our own write end keeps the FIFO from reporting EOF between ringers.
+        m_keepalive = open(path.c_str(), O_WRONLY | O_NONBLOCK);
+        return m_keepalive >= 0;
+    }
+
+    // Sleeps until rung or `timeout_ms` passes. Returns the rings consumed.
+    size_t wait(int timeout_ms) {
+        size_t n = drain();
+        if (n) return n;
+        pollfd pfd{m_fd, POLLIN, 0};
+        if (poll(&pfd, 1, timeout_ms) <= 0) return 0;
+        return drain();
+    }
+
+    size_t drain() {
+        const uint64_t now = monotonic_ns();
+        size_t count = 0;
+        char buf[4096];
+        while (true) {
+            ssize_t got = read(m_fd, buf, sizeof(buf));
+            if (got <= 0) break;
+            for (ssize_t i = 0; i + 8 <= got; i += 8) {
+                uint64_t stamp;
+                std::memcpy(&stamp, buf + i, 8);
+                record((now - stamp) / 1e6);
+                ++count;
+            }
+        }
+        return count;
+    }
+
+    // Wake latency percentile (ms) over the recent window.
+    double percentile(double q) const {
+        if (m_latencies.empty()) return 0.0;
+        std::vector<double> sorted(m_latencies);
+        std::sort(sorted.begin(), sorted.end());
+        size_t idx = std::min(sorted.size() - 1, static_cast<size_t>(q * sorted.size()));
+        return sorted[idx];
+    }
+
+private:
+    void record(double ms) {
+        if (m_latencies.size() < WINDOW) {
+            m_latencies.push_back(ms);
+        } else {
+            m_latencies[m_next] = ms;
+        }
+        m_next = (m_next + 1) % WINDOW;
+    }
+
+    static constexpr size_t WINDOW = 1024;
+    int m_fd = -1;
+    int m_keepalive = -1;
+    std::vector<double> m_latencies;
+    size_t m_next = 0;
+};
+
+// Ringing side: non-blocking, a no-op while nobody listens.
+class DoorbellRinger {
+public:
+    explicit DoorbellRinger(std::string path) : m_path(std::move(path)) {}
+    ~DoorbellRinger() { if (m_fd >= 0) close(m_fd); }
+
+    void ring() {
+        if (m_fd < 0) {
+            m_fd = open(m_path.c_str(), O_WRONLY | O_NONBLOCK);
+            if (m_fd < 0) return;
+        }
+        const uint64_t stamp = monotonic_ns();
+        if (write(m_fd, &stamp, sizeof(stamp)) < 0 && errno == EPIPE) {
+            close(m_fd);
+            m_fd = -1;
+        }
+    }
+
+private:
+    std::string m_path;
+    int m_fd = -1;
+};
+
+} // namespace shm_ring
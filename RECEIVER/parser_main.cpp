@@ -24,17 +24,16 @@
 #include "stage1_simd.h"
 #include "stage2_processing.h"
 #include "arrow_utils.h"
+#include "shm_ring.h"
+#include "doorbell.h"
+
+#include <csignal>
 
 // --- Shared Memory Configuration ---
 // Python: shm = shared_memory.SharedMemory(name="solana_json_shm", ...)
 // On Linux, this usually maps to /dev/shm/solana_json_shm
+// The segment is a multi-slot ring; see shm_ring.h / SERVER/shm_ring.py.
 const char* SHM_NAME = "solana_json_shm";
-const size_t SHM_SIZE = 10 * 1024 * 1024; // 10MB
-
-// Offsets matches your Python script
-const size_t FLAG_OFFSET = 0;
-const size_t SIZE_OFFSET = 1;
-const size_t DATA_OFFSET = 9;
 
 // --- FLIGHT SERVER CONFIGURATION ---
 // Ensure your Python/Java Flight Server is listening here
@@ -59,50 +58,68 @@ int main(int argc, char *argv[]) {
         std::cerr << "Make sure the Python script is running first!" << std::endl;
         return 1;
     }
-    char* pBuf = (char*)mmap(0, SHM_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, shm_fd, 0);
+    // The producer picks the ring size, so map whatever the segment holds.
+    struct stat shm_stat;
+    if (fstat(shm_fd, &shm_stat) == -1) {
+        std::cerr << "fstat failed: " << strerror(errno) << std::endl;
+        close(shm_fd);
+        return 1;
+    }
+    const size_t shm_size = static_cast<size_t>(shm_stat.st_size);
+    char* pBuf = (char*)mmap(0, shm_size, PROT_READ | PROT_WRITE, MAP_SHARED, shm_fd, 0);
     if (pBuf == MAP_FAILED) {
         std::cerr << "mmap failed: " << strerror(errno) << std::endl;
         close(shm_fd);
         return 1;
     }
     close(shm_fd); // FD not needed after mapping
-    std::cout << "Consumer: Attached to shared memory. Polling..." << std::endl;
-
-    // --- 3. Pointers to Offsets ---
-    // Flag is at offset 0
-    volatile uint8_t* flag_ptr = reinterpret_cast<volatile uint8_t*>(pBuf + FLAG_OFFSET);
 
-    // Data starts at offset 9
-    char* data_start_ptr = pBuf + DATA_OFFSET;
+    // --- 3. Attach Ring Reader ---
+    shm_ring::Reader ring;
+    if (!ring.attach(pBuf, shm_size)) {
+        std::cerr << "SHM segment does not hold a valid ring header (old subscriber?)" << std::endl;
+        munmap(pBuf, shm_size);
+        return 1;
+    }
+    std::cout << "Consumer: Attached to shared memory ring (" << ring.capacity() << " bytes). Waiting..." << std::endl;
+
+    // --- 3b. Doorbells: the producer wakes us per block, we wake it per release ---
+    std::signal(SIGPIPE, SIG_IGN); // A vanished producer must not kill us mid-write
+    shm_ring::Doorbell wake;
+    const bool have_doorbell = wake.listen(shm_ring::doorbell_path(SHM_NAME, "receiver"));
+    if (!have_doorbell) {
+        std::cerr << "Doorbell unavailable (" << strerror(errno) << "), falling back to polling" << std::endl;
+    }
+    shm_ring::DoorbellRinger space_freed(shm_ring::doorbell_path(SHM_NAME, "producer"));
+    size_t blocks_done = 0;
 
     // --- 4. Main Loop ---
     try {
+        shm_ring::Record rec;
         while (true) {
-            // Python writes 1 when data is ready. We wait for 1.
-            if (*flag_ptr == 1) {
+            if (!ring.attached()) {
+                // The producer took us for dead (or re-created the ring); continue at the newest block
+                std::cerr << "Detached by the producer; skipped " << ring.reattach() << " bytes of blocks" << std::endl;
+            }
+            // Drain every block the producers have published, oldest first.
+            while (ring.poll(rec)) {
 
                 auto job_start_time = std::chrono::high_resolution_clock::now();
-                
-                // --- READ SIZE SAFELY ---
-                // Because offset 1 is not 8-byte aligned, we use memcpy to avoid
-                // strict-aliasing violations or bus errors.
-                uint64_t json_size = 0;
-                std::memcpy(&json_size, pBuf + SIZE_OFFSET, 8); // Read 8 bytes from offset 1
-
-                // Safety Check
-                if (json_size > (SHM_SIZE - DATA_OFFSET)) {
-                    std::cerr << "Error: Size in SHM (" << json_size << ") exceeds buffer limit." << std::endl;
-                    *flag_ptr = 0; // Reset and skip
-                    continue;
-                }
-                std::cout << "\n>>> New Data Detected! Size: " << json_size << " bytes" << std::endl;
 
-                // --- PROCESS ONLY THE JSON PART ---
-                // We pass the pointer to offset 9 and the specific size we read
+                const char* data_start_ptr = rec.data;
+                const size_t json_size = rec.size;
+                std::cout << "\n>>> New Data Detected! Slot " << rec.slot << " (seq " << rec.seq
+                          << ") Size: " << json_size << " bytes" << std::endl;
 
                 // 1. Extract Timestamp
-                // This gets the actual blockTime from the JSON (e.g., 1766831972)
-                std::string block_time_str = extract_block_time(std::string_view(data_start_ptr, json_size));
+                // The producer already put blockTime in the record header; only
+                // scan the JSON when it was missing.
+                std::string block_time_str;
+                if (rec.block_time != shm_ring::NO_BLOCK_TIME) {
+                    block_time_str = std::to_string(rec.block_time);
+                } else {
+                    block_time_str = extract_block_time(std::string_view(data_start_ptr, json_size));
+                }
 
                 // 2. Stage 1: SIMD Indexing
                 std::vector<uint64_t> index_list;
@@ -120,11 +137,10 @@ int main(int argc, char *argv[]) {
                 // 5. Stage 2: Parallel Parse AND Send to Flight
                 std::atomic<size_t> pool_tx_counter(0);
 
-                // FIXED: Passing 'block_time_str' extracted from JSON instead of current system time
                 process_transactions_parallel(
                     transaction_views,
                     hot_addresses,
-                    block_time_str,      // <--- Corrected here
+                    block_time_str,
                     FLIGHT_SERVER_URI,
                     pool_tx_counter
                 );
@@ -137,16 +153,29 @@ int main(int argc, char *argv[]) {
                 std::cout << "Done in " << elapsed.count() << " ms." << std::endl;
 
                 // --- SIGNAL COMPLETION ---
-                // Set flag back to 0 so Python knows we are done
-                *flag_ptr = 0;
+                // Advance the tail so the producer can reuse this record's space
+                const uint64_t skipped = ring.release(rec);
+                space_freed.ring();
+                if (skipped) {
+                    std::cerr << "Producer was blocked on us; skipped " << skipped << " bytes of blocks" << std::endl;
+                }
+
+                if (have_doorbell && ++blocks_done % 100 == 0) {
+                    std::cout << "Wake latency p50=" << wake.percentile(0.5) << " ms p99="
+                              << wake.percentile(0.99) << " ms" << std::endl;
+                }
+            }
+            // Sleep until the producer rings (bounded, in case a wake is lost)
+            if (have_doorbell) {
+                wake.wait(100);
+            } else {
+                std::this_thread::sleep_for(std::chrono::microseconds(500));
             }
-            // Sleep briefly to save CPU
-            std::this_thread::sleep_for(std::chrono::microseconds(500));
         }
     } catch (std::exception& e) {
         std::cerr << "Exception: " << e.what() << std::endl;
-        *flag_ptr = 0; // Reset flag on crash
     }
-    munmap(pBuf, SHM_SIZE);
+    ring.detach();
+    munmap(pBuf, shm_size);
     return 0;
 }
@@ -0,0 +1,163 @@
+#pragma once
+
+// Reader for the multi-slot SHM ring written by SERVER/shm_ring.py.
+// The Python module holds the authoritative layout description; the
+// offsets below must be kept in sync with it.
+
+#include <cstdint>
+#include <cstddef>
+#include <cstring>
+#include <unistd.h>
+
+namespace shm_ring {
+
+constexpr uint32_t RING_MAGIC = 0x474E5253; // "SRNG"
+constexpr uint32_t RING_VERSION = 1;
+
+constexpr size_t CONTROL_SIZE = 256;
+constexpr size_t CONSUMERS_OFFSET = 24;     // u32 bit mask of attached consumers
+constexpr size_t HEAD_OFFSET = 64;   // u64, written by the producer
+constexpr size_t SEQ_OFFSET = 72;    // u64, next sequence number
+constexpr size_t TAIL_OFFSET = 128;  // u64, written by the consumer
+constexpr size_t RECEIVER_PID_OFFSET = 136; // u64, process holding the tail
+constexpr size_t RECEIVER_SKIP_OFFSET = 144; // u64, cursor the producer asks us to skip to (0 = none)
+constexpr size_t DATA_START = CONTROL_SIZE;
+
+constexpr size_t RECORD_HEADER_SIZE = 64;
+
+// The producer only holds space for consumers whose bit is set.
+constexpr uint32_t RECEIVER_BIT = 0x1;
+
+constexpr uint32_t KIND_DATA = 1;
+constexpr uint32_t KIND_PAD = 2;
+
+constexpr int64_t NO_BLOCK_TIME = -1;
+
+// On-disk record header (64 bytes, little-endian, 64-byte aligned).
+struct RecordHeader {
+    uint32_t record_len;
+    uint32_t kind;
+    uint64_t seq;
+    uint64_t slot;
+    int64_t  block_time;
+    uint64_t payload_len;
+    uint8_t  reserved[24];
+};
+static_assert(sizeof(RecordHeader) == RECORD_HEADER_SIZE, "RecordHeader layout mismatch");
+
+// One unread block. `data` points straight into the mapping and is followed
+// by at least 64 zero bytes, so SIMD over-reads past `size` are safe.
+struct Record {
+    uint64_t seq;
+    uint64_t slot;
+    int64_t block_time;
+    const char* data;
+    size_t size;
+    uint64_t next_tail;
+};
+
+class Reader {
+public:
+    // `base` is the start of the mapping, `mapped_size` its length in bytes.
+    bool attach(char* base, size_t mapped_size) {
+        if (mapped_size < CONTROL_SIZE) return false;
+        uint32_t magic, version;
+        std::memcpy(&magic, base, 4);
+        std::memcpy(&version, base + 4, 4);
+        std::memcpy(&m_capacity, base + 8, 8);
+        if (magic != RING_MAGIC || version != RING_VERSION) return false;
+        if (DATA_START + m_capacity > mapped_size) return false;
+
+        m_base = base;
+        m_head = reinterpret_cast<uint64_t*>(base + HEAD_OFFSET);
+        m_tail = reinterpret_cast<uint64_t*>(base + TAIL_OFFSET);
+        m_pid = reinterpret_cast<uint64_t*>(base + RECEIVER_PID_OFFSET);
+        m_skip = reinterpret_cast<uint64_t*>(base + RECEIVER_SKIP_OFFSET);
+        m_consumers = reinterpret_cast<uint32_t*>(base + CONSUMERS_OFFSET);
+        if (attached()) {
+            // A receiver the producer has not reaped yet (we restarted): resume at its tail
+            m_cursor = __atomic_load_n(m_tail, __ATOMIC_ACQUIRE);
+            __atomic_store_n(m_pid, static_cast<uint64_t>(getpid()), __ATOMIC_RELEASE);
+        } else {
+            reattach();
+        }
+        return true;
+    }
+
+    // False once the producer stopped holding space for us (it took us for
+    // dead, or re-created the ring); continue with reattach().
+    bool attached() const {
+        return __atomic_load_n(m_consumers, __ATOMIC_ACQUIRE) & RECEIVER_BIT;
+    }
+
+    // Registers as the receiver starting at the current head. Returns the
+    // number of bytes skipped since our cursor.
+    uint64_t reattach() {
+        const uint64_t head = __atomic_load_n(m_head, __ATOMIC_ACQUIRE);
+        const uint64_t skipped = head - m_cursor;
+        m_cursor = head;
+        __atomic_store_n(m_tail, head, __ATOMIC_RELEASE);
+        __atomic_store_n(m_pid, static_cast<uint64_t>(getpid()), __ATOMIC_RELEASE);
+        // Bit last, so the producer never honours a tail that is not set yet
+        __atomic_fetch_or(m_consumers, RECEIVER_BIT, __ATOMIC_ACQ_REL);
+        return skipped;
+    }
+
+    // Stops holding ring space (clean shutdown).
+    void detach() {
+        if (m_consumers) __atomic_fetch_and(m_consumers, ~RECEIVER_BIT, __ATOMIC_ACQ_REL);
+    }
+
+    // Returns true and fills `out` if a block is waiting. PAD records are skipped.
+    bool poll(Record& out) {
+        const uint64_t head = __atomic_load_n(m_head, __ATOMIC_ACQUIRE);
+        while (m_cursor != head) {
+            const char* rec = m_base + DATA_START + (m_cursor % m_capacity);
+            RecordHeader hdr;
+            std::memcpy(&hdr, rec, sizeof(hdr));
+            m_cursor += hdr.record_len;
+            if (hdr.kind == KIND_PAD) continue;
+
+            out.seq = hdr.seq;
+            out.slot = hdr.slot;
+            out.block_time = hdr.block_time;
+            out.data = rec + RECORD_HEADER_SIZE;
+            out.size = static_cast<size_t>(hdr.payload_len);
+            out.next_tail = m_cursor;
+            return true;
+        }
+        return false;
+    }
+
+    // Hands the record's space back to the producer. Call in poll() order.
+    // When the producer has asked us to skip ahead (we kept the ring full
+    // too long), the cursor then jumps to the requested position; returns
+    // the bytes skipped, 0 normally. The record just released was never
+    // touched by the producer.
+    uint64_t release(const Record& rec) {
+        __atomic_store_n(m_tail, rec.next_tail, __ATOMIC_RELEASE);
+        uint64_t skip = __atomic_load_n(m_skip, __ATOMIC_ACQUIRE);
+        if (skip == 0 || !__atomic_compare_exchange_n(m_skip, &skip, 0, false, __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE)) {
+            return 0;
+        }
+        if (skip <= m_cursor) return 0;
+        const uint64_t skipped = skip - m_cursor;
+        m_cursor = skip;
+        __atomic_store_n(m_tail, skip, __ATOMIC_RELEASE);
+        return skipped;
+    }
+
+    uint64_t capacity() const { return m_capacity; }
+
+private:
+    char* m_base = nullptr;
+    uint64_t* m_head = nullptr;
+    uint64_t* m_tail = nullptr;
+    uint64_t* m_pid = nullptr;
+    uint64_t* m_skip = nullptr;
+    uint32_t* m_consumers = nullptr;
+    uint64_t m_capacity = 0;
+    uint64_t m_cursor = 0;
+};
+
+} // namespace shm_ring
@@ -0,0 +1,258 @@
+"""
+Micro-batched sink for enriched balance rows into RisingWave / Postgres.
+
+The Flight server hands every enriched RecordBatch to BalanceSink.submit(),
+which only puts it on a bounded queue. SINK_WORKERS writer threads drain the
+queue: each keeps collecting batches (from all streams) until it has
+SINK_FLUSH_ROWS rows or SINK_FLUSH_INTERVAL has passed since its first
+batch, then writes them in one statement over a pooled connection:
+
+  copy     COPY ... FROM STDIN (csv), the CSV produced by pyarrow from the
+           Arrow buffers (Postgres)
+  insert   INSERT ... SELECT FROM unnest() with one array parameter per
+           column, SINK_INSERT_ROWS rows per statement (RisingWave, which
+           has no COPY FROM STDIN)
+  auto     insert for RisingWave, copy otherwise (from SELECT version())
+
+Backpressure: gRPC handler threads never touch the database. When the queue
+is full, submit() waits at most SINK_SUBMIT_TIMEOUT (slowing the receiver's
+stream through gRPC flow control); after that the batch is dropped and
+counted rather than stalling the handler further.
+
+Balance and price strings (NUMERIC columns) that are not numbers are sent
+as nulls (numeric_strings.py), so one malformed value cannot fail a flush.
+
+A failed write is retried SINK_RETRIES times with backoff, then dropped; a
+batch that cannot be converted (or written as CSV) is dropped and counted
+as failed right away, so one bad batch never stops a writer thread.
+Every SINK_STATS_INTERVAL the sink prints rows/sec, flush latency, queue
+depth and drops.
+
+    SINK_DSN=postgresql://root@localhost:4566/dev python3 flightWithRedisLatest.py
+"""
+
+import io
+import os
+import queue
+import threading
+import time
+
+import psycopg
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from psycopg_pool import ConnectionPool
+
+from numeric_strings import DECIMAL_PATTERN, null_malformed
+
+SINK_DSN = os.environ.get("SINK_DSN", "")  # Empty = no sink
+SINK_TABLE = os.environ.get("SINK_TABLE", "balance_changes")
+SINK_METHOD = os.environ.get("SINK_METHOD", "auto")  # auto | copy | insert
+SINK_WORKERS = 2               # Writer threads, one pooled connection each
+SINK_FLUSH_ROWS = 50000        # Rows per write
+SINK_FLUSH_INTERVAL = 0.5      # Seconds after a writer's first batch before it writes anyway
+SINK_QUEUE_BATCHES = 512       # Bounded queue between the Flight handlers and the writers
+SINK_SUBMIT_TIMEOUT = 0.05     # Seconds a handler waits on a full queue before dropping
+SINK_INSERT_ROWS = 10000       # Rows per INSERT statement
+SINK_RETRIES = 3
+SINK_RETRY_DELAY = 0.2         # Seconds, doubled per attempt
+SINK_STATS_INTERVAL = 30.0
+
+# (enriched batch column, table column, SQL type, Arrow type)
+SINK_COLUMNS = [
+    ("timestamp", "block_time", "BIGINT", pa.int64()),
+    ("wallet", "wallet", "VARCHAR", pa.utf8()),
+    ("signature", "signature", "VARCHAR", pa.utf8()),
+    ("mint", "mint", "VARCHAR", pa.utf8()),
+    ("pre_balance", "pre_balance", "NUMERIC", pa.utf8()),
+    ("post_balance", "post_balance", "NUMERIC", pa.utf8()),
+    ("baseVault", "base_vault", "VARCHAR", pa.utf8()),
+    ("quoteVault", "quote_vault", "VARCHAR", pa.utf8()),
+    ("base_price", "base_price", "NUMERIC", pa.utf8()),
+    ("quote_price", "quote_price", "NUMERIC", pa.utf8()),
+    ("baseMint", "base_mint", "VARCHAR", pa.utf8()),
+    ("quoteMint", "quote_mint", "VARCHAR", pa.utf8()),
+]
+SINK_SCHEMA = pa.schema([(sql_name, arrow_type) for _, sql_name, _, arrow_type in SINK_COLUMNS])
+
+
+def to_sink_batch(batch):
+    """The batch in SINK_SCHEMA column order; columns it lacks and malformed NUMERIC strings become nulls."""
+    names = batch.schema.names
+    arrays = []
+    for name, _, sql_type, arrow_type in SINK_COLUMNS:
+        if name in names:
+            array = batch.column(names.index(name)).cast(arrow_type)
+            if sql_type == "NUMERIC":
+                array, bad = null_malformed(array, DECIMAL_PATTERN)
+                if bad:
+                    print(f"[Sink] {bad} malformed {name} value(s) sent as null")
+            arrays.append(array)
+        else:
+            arrays.append(pa.nulls(batch.num_rows, arrow_type))
+    return pa.RecordBatch.from_arrays(arrays, schema=SINK_SCHEMA)
+
+
+class BalanceSink:
+    def __init__(self, dsn, table=SINK_TABLE, method=SINK_METHOD):
+        self.dsn = dsn
+        self.table = table
+        self.method = method
+        self.queue = queue.Queue(maxsize=SINK_QUEUE_BATCHES)
+        self.pool = None
+        self.threads = []
+        self.lock = threading.Lock()
+
+        self.columns = ", ".join(sql_name for _, sql_name, _, _ in SINK_COLUMNS)
+        arrays = ", ".join(f"%s::{sql_type}[]" for _, _, sql_type, _ in SINK_COLUMNS)
+        self._insert_sql = f"INSERT INTO {table} ({self.columns}) SELECT * FROM unnest({arrays})"
+
+        # --- Stats (under self.lock) ---
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._flushes = []             # (latency s, rows) since the last report
+        self._last_report = time.monotonic()
+        self._max_depth = 0
+
+    def start(self):
+        self.pool = ConnectionPool(self.dsn, min_size=SINK_WORKERS, max_size=SINK_WORKERS, open=True)
+        with self.pool.connection() as conn:
+            version = conn.execute("SELECT version()").fetchone()[0]
+            columns = ", ".join(f"{sql_name} {sql_type}" for _, sql_name, sql_type, _ in SINK_COLUMNS)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ({columns})")
+        if self.method == "auto":
+            self.method = "insert" if "risingwave" in version.lower() else "copy"
+        print(f"[Sink] Writing to {self.table} via {self.method} ({version.split(',')[0]})")
+
+        for i in range(SINK_WORKERS):
+            thread = threading.Thread(target=self._run, name=f"sink-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def submit(self, batch):
+        """Queues one enriched batch. Waits at most SINK_SUBMIT_TIMEOUT; False if it was dropped."""
+        try:
+            self.queue.put(batch, timeout=SINK_SUBMIT_TIMEOUT)
+        except queue.Full:
+            with self.lock:
+                self.dropped += batch.num_rows
+            return False
+        depth = self.queue.qsize()
+        if depth > self._max_depth:
+            self._max_depth = depth
+        return True
+
+    def stop(self):
+        """Writes what is queued, then stops the writers."""
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.pool is not None:
+            self.pool.close()
+        print(f"[Sink] Stopped | {self.describe()}")
+
+    # --- Writer Threads ---
+
+    def _collect(self):
+        """Returns (batches, stop): batches for one write, and whether stop() was called."""
+        first = self.queue.get()
+        if first is None:
+            return [], True
+        batches = [first]
+        rows = first.num_rows
+        deadline = time.monotonic() + SINK_FLUSH_INTERVAL
+        while rows < SINK_FLUSH_ROWS:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if batch is None:
+                return batches, True
+            batches.append(batch)
+            rows += batch.num_rows
+        return batches, False
+
+    def _convert(self, batches):
+        """SINK_SCHEMA batches for the write; a batch that does not convert is dropped and counted."""
+        converted = []
+        for batch in batches:
+            try:
+                converted.append(to_sink_batch(batch))
+            except Exception as e:
+                print(f"[Sink] Dropping a batch of {batch.num_rows} rows: {e!r}")
+                with self.lock:
+                    self.failed += batch.num_rows
+        return converted
+
+    def _run(self):
+        while True:
+            batches, stop = self._collect()
+            converted = self._convert(batches)
+            if converted:
+                self._flush(pa.Table.from_batches(converted, schema=SINK_SCHEMA))
+            if stop:
+                return
+
+    def _flush(self, table):
+        for attempt in range(SINK_RETRIES):
+            start = time.monotonic()
+            try:
+                with self.pool.connection() as conn:
+                    if self.method == "copy":
+                        self._copy(conn, table)
+                    else:
+                        self._insert_rows(conn, table)
+            except psycopg.Error as e:
+                print(f"[Sink] Write error: {e} (attempt {attempt + 1}/{SINK_RETRIES})")
+                time.sleep(SINK_RETRY_DELAY * (2 ** attempt))
+                continue
+            except Exception as e:
+                # Not the database (e.g. CSV encoding): retrying would fail the same way
+                print(f"[Sink] Dropping {table.num_rows} rows: {e!r}")
+                break
+            self._record(time.monotonic() - start, table.num_rows)
+            return
+        with self.lock:
+            self.failed += table.num_rows
+
+    def _copy(self, conn, table):
+        buf = io.BytesIO()
+        pa_csv.write_csv(table, buf, pa_csv.WriteOptions(include_header=False))
+        with conn.cursor() as cur:
+            with cur.copy(f"COPY {self.table} ({self.columns}) FROM STDIN WITH (FORMAT csv)") as copy:
+                copy.write(buf.getbuffer())
+
+    def _insert_rows(self, conn, table):
+        with conn.cursor() as cur:
+            for offset in range(0, table.num_rows, SINK_INSERT_ROWS):
+                chunk = table.slice(offset, SINK_INSERT_ROWS)
+                cur.execute(self._insert_sql, [column.to_pylist() for column in chunk.columns])
+
+    def _record(self, latency, rows):
+        with self.lock:
+            self.written += rows
+            self._flushes.append((latency, rows))
+            if time.monotonic() - self._last_report < SINK_STATS_INTERVAL:
+                return
+            report = self.describe()
+            self._last_report = time.monotonic()
+            self._flushes = []
+            self._max_depth = self.queue.qsize()
+        print(f"[Sink] {report}")
+
+    def describe(self):
+        flushes = sorted(self._flushes)
+        if flushes:
+            span = max(time.monotonic() - self._last_report, 1e-9)
+            rate = sum(rows for _, rows in flushes) / span
+            latency = (f"{rate:,.0f} rows/s | flush p50={flushes[len(flushes) // 2][0] * 1000:.1f}ms "
+                       f"max={flushes[-1][0] * 1000:.1f}ms over {len(flushes)} writes")
+        else:
+            latency = "no writes"
+        return (f"{latency} | queue depth {self.queue.qsize()} (max {self._max_depth}) | "
+                f"written {self.written}, dropped {self.dropped}, failed {self.failed}")
@@ -0,0 +1,345 @@
+"""
+Time-partitioned Parquet history of the enriched balance rows.
+
+The Flight server hands every enriched batch to BalanceStore.submit(); one
+background thread appends it to a hive-partitioned dataset:
+
+    <root>/date=2024-05-01/hour=13/mint_prefix=D/part-<ns>.parquet
+
+  - date / hour come from the block time (UTC), so a time range prunes to
+    the hours it covers,
+  - mint_prefix is the first character of the mint: a bounded number of
+    directories (base58, at most 58) that still prunes most of an hour for
+    queries that know the mints involved,
+  - each partition has one open ParquetWriter, rolled after STORE_ROLL_ROWS
+    rows or STORE_ROLL_SECONDS; until it is closed the file carries a "."
+    prefix, which pyarrow.dataset ignores, so readers never see half a file,
+  - every STORE_COMPACT_INTERVAL the same thread rewrites each closed
+    partition (hour over, no open writer) that still has appended part-*
+    files: everything in it becomes one compacted-* file sorted by wallet
+    and block time, with STORE_ROW_GROUP_ROWS row groups (appends make one
+    small row group per batch), so wallet predicates skip row groups by
+    their min/max statistics.
+
+Balances are stored as uint64 and prices as float64 (the receiver and Redis
+send strings); a value that does not parse is stored as null rather than
+failing its batch. submit() follows the sink's backpressure: a full queue makes
+the handler wait at most STORE_SUBMIT_TIMEOUT, then the batch is dropped
+and counted.
+
+Queries (pyarrow.dataset, partition pruning + predicate pushdown):
+
+    query_balances(root, wallets, t1, t2, mints=None)
+    python3 balance_store.py query <root> <pool_address> <t1> <t2> [--vaults A,B] [--redis HOST]
+    python3 balance_store.py compact <root>
+
+A pool's vaults come from --vaults or the PAIR_TO_BASE_VAULT /
+PAIR_TO_QUOTE_VAULT hashes in Redis; its rows are the balance changes of
+those two vault accounts.
+"""
+
+import argparse
+import calendar
+import os
+import queue
+import sys
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from numeric_strings import cast_lenient
+
+STORE_DIR = os.environ.get("STORE_DIR", "")  # Empty = no store
+STORE_ROLL_ROWS = 500000          # Rows per file before the writer rolls
+STORE_ROLL_SECONDS = 120.0        # Age at which an open file is closed anyway
+STORE_ROW_GROUP_ROWS = 65536      # Row group size of compacted files
+STORE_COMPACT_INTERVAL = 300.0    # Seconds between compaction passes
+STORE_QUEUE_BATCHES = 512
+STORE_SUBMIT_TIMEOUT = 0.05       # Seconds a handler waits on a full queue before dropping
+STORE_COMPRESSION = "zstd"
+
+# (enriched batch column, stored column, Arrow type)
+STORE_COLUMNS = [
+    ("timestamp", "block_time", pa.int64()),
+    ("wallet", "wallet", pa.utf8()),
+    ("signature", "signature", pa.utf8()),
+    ("mint", "mint", pa.utf8()),
+    ("pre_balance", "pre_balance", pa.uint64()),
+    ("post_balance", "post_balance", pa.uint64()),
+    ("baseVault", "base_vault", pa.utf8()),
+    ("quoteVault", "quote_vault", pa.utf8()),
+    ("base_price", "base_price", pa.float64()),
+    ("quote_price", "quote_price", pa.float64()),
+    ("baseMint", "base_mint", pa.utf8()),
+    ("quoteMint", "quote_mint", pa.utf8()),
+]
+STORE_SCHEMA = pa.schema([(name, arrow_type) for _, name, arrow_type in STORE_COLUMNS])
+PARTITION_SCHEMA = pa.schema([("date", pa.string()), ("hour", pa.int32()), ("mint_prefix", pa.string())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor="hive")
+DATASET_SCHEMA = pa.schema(list(STORE_SCHEMA) + list(PARTITION_SCHEMA))
+
+def to_store_table(batch):
+    """The batch in STORE_SCHEMA (typed, missing columns as nulls)."""
+    names = batch.schema.names
+    arrays = []
+    for name, _, arrow_type in STORE_COLUMNS:
+        if name in names:
+            array, bad = cast_lenient(batch.column(names.index(name)), arrow_type)
+            if bad:
+                print(f"[Store] {bad} malformed {name} value(s) stored as null")
+            arrays.append(array)
+        else:
+            arrays.append(pa.nulls(batch.num_rows, arrow_type))
+    return pa.Table.from_arrays(arrays, schema=STORE_SCHEMA)
+
+
+def partition_dir(hour_index, prefix):
+    date = time.strftime("%Y-%m-%d", time.gmtime(hour_index * 3600))
+    hour = time.gmtime(hour_index * 3600).tm_hour
+    return os.path.join(f"date={date}", f"hour={hour}", f"mint_prefix={prefix}")
+
+
+def partition_end(relative):
+    """Unix time at which the hour of a partition dir (date=.../hour=.../...) ends."""
+    fields = dict(part.split("=", 1) for part in relative.split(os.sep) if "=" in part)
+    start = calendar.timegm(time.strptime(fields["date"], "%Y-%m-%d")) + int(fields["hour"]) * 3600
+    return start + 3600
+
+
+def split_partitions(table):
+    """Yields (partition dir, rows) for every hour / mint prefix present in `table`."""
+    hours = pc.divide(pc.fill_null(table.column("block_time"), 0), 3600)
+    prefixes = pc.fill_null(pc.utf8_slice_codeunits(table.column("mint"), 0, 1), "_")
+    keyed = table.append_column("_hour", hours).append_column("_prefix", prefixes)
+    keyed = keyed.sort_by([("_hour", "ascending"), ("_prefix", "ascending")])
+    groups = keyed.group_by(["_hour", "_prefix"]).aggregate([([], "count_all")])
+    groups = groups.sort_by([("_hour", "ascending"), ("_prefix", "ascending")])
+    offset = 0
+    for hour_index, prefix, count in zip(groups.column("_hour").to_pylist(), groups.column("_prefix").to_pylist(),
+                                         groups.column("count_all").to_pylist()):
+        yield partition_dir(hour_index, prefix), keyed.slice(offset, count).select(STORE_SCHEMA.names)
+        offset += count
+
+
+class _OpenFile:
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{time.time_ns()}.parquet"
+        self.tmp_path = os.path.join(directory, "." + name)
+        self.path = os.path.join(directory, name)
+        self.writer = pq.ParquetWriter(self.tmp_path, STORE_SCHEMA, compression=STORE_COMPRESSION)
+        self.rows = 0
+        self.opened = time.monotonic()
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+
+class BalanceStore:
+    def __init__(self, root):
+        self.root = root
+        self.queue = queue.Queue(maxsize=STORE_QUEUE_BATCHES)
+        self.open_files = {}           # partition dir -> _OpenFile (writer thread only)
+        self.thread = None
+        self._stop = object()
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.files = 0
+        self.compacted = 0
+
+    def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        # Files left open by a crash have no footer; they stay hidden (and unread) for inspection
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.startswith(".part-"):
+                    print(f"[Store] Unfinished file from an earlier run: {os.path.join(directory, name)}")
+        self.thread = threading.Thread(target=self._run, name="balance-store", daemon=True)
+        self.thread.start()
+        print(f"[Store] Appending to {self.root}")
+        return self
+
+    def submit(self, batch):
+        """Queues one enriched batch. Waits at most STORE_SUBMIT_TIMEOUT; False if it was dropped."""
+        try:
+            self.queue.put(batch, timeout=STORE_SUBMIT_TIMEOUT)
+        except queue.Full:
+            self.dropped += batch.num_rows
+            return False
+        return True
+
+    def stop(self):
+        """Writes what is queued and closes every open file."""
+        if self.thread is not None:
+            self.queue.put(self._stop)
+            self.thread.join()
+        print(f"[Store] Stopped | {self.describe()}")
+
+    # --- Writer Thread ---
+
+    def _run(self):
+        last_compact = time.monotonic()
+        while True:
+            try:
+                batch = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                batch = None
+            if batch is self._stop:
+                break
+            if batch is not None:
+                try:
+                    self._append(to_store_table(batch))
+                except (pa.ArrowException, OSError) as e:
+                    self.failed += batch.num_rows
+                    print(f"[Store] Append error: {e}")
+            self._roll(expired_only=True)
+            if time.monotonic() - last_compact >= STORE_COMPACT_INTERVAL:
+                last_compact = time.monotonic()
+                self.compact()
+        self._roll(expired_only=False)
+
+    def _append(self, table):
+        for directory, rows in split_partitions(table):
+            open_file = self.open_files.get(directory)
+            if open_file is None:
+                open_file = self.open_files[directory] = _OpenFile(os.path.join(self.root, directory))
+                self.files += 1
+            open_file.writer.write_table(rows)
+            open_file.rows += rows.num_rows
+            self.written += rows.num_rows
+            if open_file.rows >= STORE_ROLL_ROWS:
+                del self.open_files[directory]
+                open_file.close()
+
+    def _roll(self, expired_only):
+        now = time.monotonic()
+        for directory, open_file in list(self.open_files.items()):
+            if not expired_only or now - open_file.opened >= STORE_ROLL_SECONDS:
+                del self.open_files[directory]
+                try:
+                    open_file.close()
+                except OSError as e:
+                    print(f"[Store] Close error in {directory}: {e}")
+
+    # --- Compaction ---
+
+    def compact(self):
+        """Merges the files of every closed partition into one, sorted by wallet and time."""
+        closed_before = time.time() - STORE_ROLL_SECONDS
+        for directory, _, names in os.walk(self.root):
+            parts = sorted(n for n in names if n.endswith(".parquet") and not n.startswith("."))
+            relative = os.path.relpath(directory, self.root)
+            if not any(n.startswith("part-") for n in parts) or relative in self.open_files:
+                continue
+            if partition_end(relative) > closed_before:
+                continue  # The hour is still being written
+            try:
+                compact_partition(directory, parts)
+                self.compacted += len(parts)
+            except (pa.ArrowException, OSError) as e:
+                print(f"[Store] Compaction of {relative} failed: {e}")
+
+    def describe(self):
+        return (f"written {self.written} rows into {self.files} files ({len(self.open_files)} open), "
+                f"compacted {self.compacted} files | dropped {self.dropped}, failed {self.failed}")
+
+
+def compact_partition(directory, parts):
+    paths = [os.path.join(directory, name) for name in parts]
+    table = pa.concat_tables([pq.ParquetFile(path).read() for path in paths])
+    table = table.sort_by([("wallet", "ascending"), ("block_time", "ascending")])
+    name = f"compacted-{time.time_ns()}.parquet"
+    tmp_path = os.path.join(directory, "." + name)
+    pq.write_table(table, tmp_path, row_group_size=STORE_ROW_GROUP_ROWS, compression=STORE_COMPRESSION)
+    # New file first, then the old ones go: a query in between can see rows twice, never lose them
+    os.replace(tmp_path, os.path.join(directory, name))
+    for path in paths:
+        os.remove(path)
+
+
+# --- Queries ---
+
+def _hour_of(unix_time):
+    t = time.gmtime(unix_time)
+    return time.strftime("%Y-%m-%d", t), t.tm_hour
+
+
+def time_filter(start_time, end_time):
+    """Block-time range as a row predicate plus the matching date/hour partition predicate."""
+    d1, h1 = _hour_of(start_time)
+    d2, h2 = _hour_of(end_time)
+    date, hour = ds.field("date"), ds.field("hour")
+    partitions = (((date > d1) | ((date == d1) & (hour >= h1))) &
+                  ((date < d2) | ((date == d2) & (hour <= h2))))
+    return partitions & (ds.field("block_time") >= start_time) & (ds.field("block_time") <= end_time)
+
+
+def query_balances(root, wallets, start_time, end_time, mints=None, columns=None):
+    """
+    Balance rows of `wallets` with start_time <= block_time <= end_time (Unix
+    seconds), oldest first. `mints` (the tokens those accounts hold) narrows
+    the scan to their mint_prefix partitions.
+    """
+    dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING, schema=DATASET_SCHEMA)
+    expression = time_filter(start_time, end_time) & ds.field("wallet").isin(list(wallets))
+    if mints:
+        expression &= ds.field("mint_prefix").isin(sorted({mint[:1] for mint in mints}))
+    table = dataset.to_table(filter=expression, columns=columns or STORE_SCHEMA.names)
+    return table.sort_by([("block_time", "ascending")]) if "block_time" in table.schema.names else table
+
+
+def pool_vaults(redis_client, pool_address):
+    pipe = redis_client.pipeline()
+    pipe.hget("PAIR_TO_BASE_VAULT", pool_address)
+    pipe.hget("PAIR_TO_QUOTE_VAULT", pool_address)
+    return [vault for vault in pipe.execute() if vault]
+
+
+def _parse_time(text):
+    if text.isdigit():
+        return int(text)
+    return calendar.timegm(time.strptime(text, "%Y-%m-%dT%H:%M:%S"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or compact the balance history")
+    commands = parser.add_subparsers(dest="command", required=True)
+    query = commands.add_parser("query", help="vault balance changes of a pool between two times")
+    query.add_argument("root")
+    query.add_argument("pool_address")
+    query.add_argument("start", help="Unix seconds or YYYY-MM-DDTHH:MM:SS (UTC)")
+    query.add_argument("end")
+    query.add_argument("--vaults", help="comma-separated vault accounts (default: looked up in Redis)")
+    query.add_argument("--redis", default=os.environ.get("REDIS_HOST", "localhost"))
+    compact = commands.add_parser("compact", help="merge the files of every partition now")
+    compact.add_argument("root")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        store = BalanceStore(args.root)
+        store.compact()
+        print(f"[Store] {store.describe()}")
+        return
+
+    if args.vaults:
+        vaults = args.vaults.split(",")
+    else:
+        import redis
+        vaults = pool_vaults(redis.Redis(host=args.redis, port=6379, decode_responses=True), args.pool_address)
+    if not vaults:
+        parser.error(f"no vaults known for {args.pool_address}; pass --vaults")
+    table = query_balances(args.root, vaults, _parse_time(args.start), _parse_time(args.end))
+    print(f"[Store] {table.num_rows} balance changes of {', '.join(vaults)}", file=sys.stderr)
+    pa_csv.write_csv(table, sys.stdout.buffer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Per-block coalescing of the small Arrow batches the receiver streams in.
+
+stage2_processing.cpp opens one DoPut per hardware thread per block and
+flushes every BATCH_SIZE_THRESHOLD rows, so one block reaches the Flight
+server as many small batches spread over concurrent streams. Enrichment,
+sink / store submission and printing all have a fixed cost per batch, so
+the handlers no longer do that work themselves: they add() each batch to
+an accumulator keyed by (descriptor path, blockTime) and return to reading.
+
+An accumulator is emitted as one batch (the parts concatenated) when
+  - it reaches COALESCE_MAX_ROWS rows, in the handler thread that added the
+    last part, or
+  - COALESCE_MAX_DELAY has passed since its first part, from the flusher
+    thread (the server cannot tell when the last stream of a block ended).
+
+The receiver only sends blockTime, so slots that share a second are
+coalesced together; enrichment does not care which slot a row came from.
+
+Batch sizes are recorded before and after coalescing in
+flight_batch_rows{stage="received" | "coalesced"}, and the number of parts
+per emitted batch in flight_coalesced_parts, on the slot_trace.py metrics
+endpoint.
+"""
+
+import threading
+import time
+import traceback
+
+import pyarrow as pa
+
+from slot_trace import Histogram, REGISTRY
+
+COALESCE_MAX_ROWS = 65536      # Emit as soon as a block has this many rows
+COALESCE_MAX_DELAY = 0.1       # Seconds after a block's first batch before it is emitted anyway (0 = no coalescing)
+
+ROW_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+PART_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+BATCH_ROWS = Histogram("flight_batch_rows", "Rows per batch as received and after coalescing", "stage",
+                       buckets=ROW_BUCKETS)
+COALESCED_PARTS = Histogram("flight_coalesced_parts", "Received batches per coalesced batch", "stage",
+                            buckets=PART_BUCKETS)
+REGISTRY.extend([BATCH_ROWS, COALESCED_PARTS])
+
+
+def concat_batches(batches):
+    """One RecordBatch from batches with the same schema."""
+    if len(batches) == 1:
+        return batches[0]
+    return pa.Table.from_batches(batches).combine_chunks().to_batches()[0]
+
+
+class BatchCoalescer:
+    def __init__(self, emit, max_rows=COALESCE_MAX_ROWS, max_delay=COALESCE_MAX_DELAY):
+        """`emit(key, batch, parts)` does the per-batch work; it may run on any handler or the flusher."""
+        self.emit = emit
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.pending = {}              # key -> [batches, rows, first seen (monotonic)]
+        self.lock = threading.Lock()
+        self.stopped = False
+        self._thread = None
+
+        self.received = 0
+        self.emitted = 0
+
+    def start(self):
+        if self.max_delay > 0:
+            self._thread = threading.Thread(target=self._run, name="batch-coalescer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the flusher and emits whatever is still pending."""
+        self.stopped = True
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        print(f"[Coalescer] Stopped | {self.describe()}")
+
+    def add(self, key, batch):
+        BATCH_ROWS.observe("received", batch.num_rows)
+        if self.max_delay <= 0:
+            with self.lock:
+                self.received += 1
+            self._emit(key, [batch])
+            return
+        with self.lock:
+            self.received += 1
+            entry = self.pending.get(key)
+            if entry is None:
+                entry = self.pending[key] = [[], 0, time.monotonic()]
+            entry[0].append(batch)
+            entry[1] += batch.num_rows
+            if entry[1] < self.max_rows:
+                return
+            del self.pending[key]
+        self._emit(key, entry[0])
+
+    def flush(self, older_than=None):
+        """Emits the accumulators first seen at least `older_than` seconds ago (all by default)."""
+        now = time.monotonic()
+        with self.lock:
+            due = [key for key, entry in self.pending.items()
+                   if older_than is None or now - entry[2] >= older_than]
+            entries = [(key, self.pending.pop(key)[0]) for key in due]
+        for key, batches in entries:
+            self._emit(key, batches)
+
+    def _emit(self, key, batches):
+        try:
+            batch = concat_batches(batches)
+        except pa.ArrowInvalid as e:
+            # Streams with different schemas under one key: emit the parts as they came
+            print(f"[Coalescer] Cannot concatenate {len(batches)} batches for {key}: {e}")
+            for part in batches:
+                self._emit(key, [part])
+            return
+        BATCH_ROWS.observe("coalesced", batch.num_rows)
+        COALESCED_PARTS.observe("coalesced", len(batches))
+        with self.lock:
+            self.emitted += 1
+        try:
+            self.emit(key, batch, len(batches))
+        except Exception as e:
+            print(f"[Coalescer] Error processing {batch.num_rows} rows for {key}: {e}")
+            traceback.print_exc()
+
+    def _run(self):
+        tick = max(self.max_delay / 4, 0.005)
+        while not self.stopped:
+            time.sleep(tick)
+            self.flush(older_than=self.max_delay)
+
+    def describe(self):
+        with self.lock:
+            pending = sum(entry[1] for entry in self.pending.values())
+            ratio = self.received / self.emitted if self.emitted else 0.0
+            return (f"received {self.received} batches, emitted {self.emitted} "
+                    f"({ratio:.1f} per emitted) | pending {len(self.pending)} blocks, {pending} rows")
@@ -0,0 +1,298 @@
+"""
+Benchmark suite for the hot paths, on synthetic data (synthetic_data.py).
+
+    python3 benchmark.py                          # every case
+    python3 benchmark.py process_block flight     # some cases
+    python3 benchmark.py --quick --no-record      # smaller inputs, nothing written
+
+Cases:
+  process_block   raw getBlock reply -> extract_candidates -> process_block
+                  (combined_subscriber.py), for a few block shapes
+  flight          SolanaFlightServer.do_put (flightWithRedisLatest.py) over
+                  receiver-shaped Arrow batches of one block, coalesced and
+                  enriched (the pending block is flushed at the end of the
+                  run instead of waiting for the deadline), with a fixed
+                  watchlist snapshot in place of the Redis-backed cache
+  price_update    redis_map_editor.apply_price_update against a real Redis
+                  (--redis, default $REDIS_HOST or 127.0.0.1, database
+                  BENCH_REDIS_DB so live maps are never touched)
+
+A case whose dependencies are missing (or whose Redis is unreachable) is
+reported as skipped; the others still run. Stdout of the code under test is
+discarded while timing so its logging is paid for but not shown.
+
+Every run is appended to RESULTS_FILE (git-ignored; per host, not shared
+through the repo) as one JSON line tagged with the git commit (and whether
+the tree was dirty). Each result is compared with the
+latest earlier run on the same host with the same parameters, and a median
+more than REGRESSION_THRESHOLD slower is flagged; `--check` turns flagged
+regressions into a non-zero exit status.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from synthetic_data import make_block, make_watchlist, make_arrow_batch
+
+RESULTS_FILE = os.environ.get("BENCH_RESULTS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results.jsonl"))
+REGRESSION_THRESHOLD = 0.10    # Median slower than the previous run by more than this is flagged
+WARMUP_RUNS = 2
+REPEAT = 20                    # Timed runs per case (--repeat)
+BENCH_REDIS_DB = 15            # Scratch database for the price_update case
+
+
+class BenchSkip(Exception):
+    pass
+
+
+class _Sink:
+    """Stands in for PoolWriter / PoolSender: counts what would be published."""
+    def __init__(self):
+        self.count = 0
+
+    def submit(self, *args, **kwargs):
+        self.count += 1
+
+
+# --- Cases ---
+# Each setup returns [(name, params, fn, units)]: one call of fn processes `units` items.
+
+def setup_process_block(quick):
+    import combined_subscriber as cs
+
+    shapes = [
+        {"tx_count": 1500, "logs_per_tx": 12, "v0_share": 0.6, "target_density": 0.001},
+        {"tx_count": 1500, "logs_per_tx": 12, "v0_share": 0.6, "target_density": 0.02},
+        {"tx_count": 1500, "logs_per_tx": 12, "v0_share": 0.6, "target_density": 0.0},
+        {"tx_count": 4000, "logs_per_tx": 30, "v0_share": 0.9, "target_density": 0.005},
+    ]
+    if quick:
+        shapes = [dict(shape, tx_count=shape["tx_count"] // 5) for shape in shapes]
+
+    loop = asyncio.new_event_loop()
+    cases = []
+    for i, shape in enumerate(shapes):
+        slot = 300000000 + i
+        text, pools = make_block(slot, **shape)
+        sink = _Sink()
+
+        def run(text=text, slot=slot, sink=sink):
+            block_data = cs.extract_candidates(text, cs.MATCHER.markers)
+            if block_data is not None:
+                loop.run_until_complete(
+                    cs.process_block(None, sink, sink, block_data, 0, int(time.time()), slot))
+
+        # A fast detector that misses pools is not a result
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            run()
+        if sink.count != 2 * len(pools):
+            raise RuntimeError(f"process_block published {sink.count // 2} of {len(pools)} pools for {shape}")
+        params = dict(shape, block_mb=round(len(text) / 1e6, 2))
+        cases.append((f"process_block[{i}]", params, run, 1))
+    return cases
+
+
+def setup_flight(quick):
+    import pyarrow as pa
+    from flightWithRedisLatest import SolanaFlightServer
+
+    class _Descriptor:
+        path = [b"benchmark"]
+
+    class _Reader:
+        def __init__(self, chunks):
+            self.chunks = iter(chunks)
+
+        def read_chunk(self):
+            return next(self.chunks)  # StopIteration ends the stream, as with Flight
+
+    server = SolanaFlightServer("grpc+tcp://127.0.0.1:0")
+    cases = []
+    for rows, batches, pools, share in [(2000, 8, 200, 0.05), (20000, 4, 5000, 0.2)]:
+        if quick:
+            rows //= 10
+        watchlist = make_watchlist(pools)
+        chunks = []
+        for seed in range(batches):
+            batch, metadata = make_arrow_batch(rows, watchlist, share, block_time=1700000000, seed=seed)
+            chunks.append((batch, pa.py_buffer(metadata)))
+
+        def run(server=server, chunks=chunks, watchlist=watchlist):
+            if server.watch_cache.snapshot.data is not watchlist:
+                server.watch_cache.replace(watchlist)
+            server.do_put(None, _Descriptor(), _Reader(chunks), None)
+            server.coalescer.flush()
+
+        params = {"rows": rows, "batches": batches, "watchlist_pools": pools, "watched_share": share}
+        cases.append((f"flight_do_put[{rows}x{batches}]", params, run, rows * batches))
+    return cases
+
+
+def setup_price_update(quick, redis_host):
+    import random
+    import redis
+    import redis_map_editor as editor
+
+    r = redis.Redis(host=redis_host, port=editor.REDIS_PORT, db=BENCH_REDIS_DB, decode_responses=True)
+    try:
+        r.ping()
+    except redis.RedisError as e:
+        raise BenchSkip(f"no Redis at {redis_host}: {e}")
+
+    pairs = 500 if quick else 5000
+    events_per_run = 100
+    rng = random.Random(0)
+    pipe = r.pipeline()
+    for i in range(pairs):
+        pipe.hset(editor.KEY_PAIR_TO_BASE, f"pair{i}", f"base_vault{i}")
+        pipe.hset(editor.KEY_PAIR_TO_QUOTE, f"pair{i}", f"quote_vault{i}")
+    pipe.execute()
+    events = [(f"pair{rng.randrange(pairs)}", f"{rng.uniform(0.0001, 5):.8f}", f"{rng.uniform(0.5, 200):.8f}")
+              for _ in range(events_per_run)]
+
+    def run():
+        for pair_id, base_price, quote_price in events:
+            editor.apply_price_update(r, pair_id, base_price, quote_price)
+
+    return [("price_update", {"pairs": pairs, "redis": redis_host}, run, events_per_run)]
+
+
+CASES = {
+    "process_block": lambda args: setup_process_block(args.quick),
+    "flight": lambda args: setup_flight(args.quick),
+    "price_update": lambda args: setup_price_update(args.quick, args.redis),
+}
+
+
+# --- Timing ---
+
+def measure(fn, repeat):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(WARMUP_RUNS):
+            fn()
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples
+
+
+def summarize(params, samples, units):
+    median = statistics.median(samples)
+    return {
+        "params": params,
+        "runs": len(samples),
+        "median_ms": round(median * 1000, 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))] * 1000, 4),
+        "min_ms": round(samples[0] * 1000, 4),
+        "per_sec": round(units / median, 1) if median > 0 else None,
+    }
+
+
+# --- Results ---
+
+def git_state():
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_result(history, host, name, params):
+    for run in reversed(history):
+        result = run["results"].get(name)
+        if run["host"] == host and result and result["params"] == params:
+            return run, result
+    return None, None
+
+
+def compare(history, host, name, result):
+    """Returns (text, regressed) for one result against the previous run."""
+    run, before = previous_result(history, host, name, result["params"])
+    if before is None:
+        return "no previous run", False
+    change = result["median_ms"] / before["median_ms"] - 1 if before["median_ms"] else 0.0
+    regressed = change > REGRESSION_THRESHOLD
+    flag = "  <-- REGRESSION" if regressed else ""
+    return f"{change * 100:+.1f}% vs {run['commit']}{'+' if run['dirty'] else ''} ({before['median_ms']:.2f} ms){flag}", regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the detector, Flight enrichment and price-update paths")
+    parser.add_argument("cases", nargs="*", help=f"cases to run (default: all of {', '.join(CASES)})")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--quick", action="store_true", help="smaller inputs (smoke test; recorded separately by params)")
+    parser.add_argument("--results", default=RESULTS_FILE)
+    parser.add_argument("--no-record", action="store_true")
+    parser.add_argument("--check", action="store_true", help="exit 1 when a regression is flagged")
+    parser.add_argument("--redis", default=os.environ.get("REDIS_HOST", "127.0.0.1"))
+    args = parser.parse_args()
+    unknown = [case for case in args.cases if case not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+
+    commit, dirty = git_state()
+    host = platform.node()
+    history = load_history(args.results)
+    results = {}
+    regressions = []
+
+    print(f"[Bench] commit {commit}{' (dirty)' if dirty else ''} on {host}, {args.repeat} runs per case")
+    for case in args.cases or list(CASES):
+        try:
+            benches = CASES[case](args)
+        except (ImportError, BenchSkip) as e:
+            print(f"[Bench] {case}: skipped ({e})")
+            continue
+        for name, params, fn, units in benches:
+            result = summarize(params, measure(fn, args.repeat), units)
+            results[name] = result
+            text, regressed = compare(history, host, name, result)
+            if regressed:
+                regressions.append(name)
+            print(f"[Bench] {name:<28} median {result['median_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms  "
+                  f"{result['per_sec']:>12,.0f}/s  | {text}")
+
+    if results and not args.no_record:
+        entry = {
+            "commit": commit,
+            "dirty": dirty,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": host,
+            "python": platform.python_version(),
+            "results": results,
+        }
+        with open(args.results, "a") as f:
+            f.write(json.dumps(entry, sort_keys=True) + "\n")
+        print(f"[Bench] Recorded in {args.results}")
+
+    if regressions:
+        print(f"[Bench] {len(regressions)} regression(s): {', '.join(regressions)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Records real getBlock replies for offline replay (see rpc_standin.py).
+
+Every slot becomes one gzip file in the recording directory:
+
+    <dir>/<slot>.json.gz    the raw `result` object of the reply, byte for byte,
+                            or {"error": {...}} for skipped / missing slots
+
+Only the JSON-RPC envelope is dropped (the stand-in writes a new one with the
+caller's request id); the block text itself is what the RPC sent, so a replay
+exercises the same peek_reply / block_scan paths as live traffic.
+
+    python3 block_recorder.py <dir> <first_slot> <count>
+    python3 block_recorder.py <dir> tip <count>      # the <count> slots before the current tip
+
+Slots already in the directory are skipped, so an interrupted recording can
+simply be started again.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import re
+import sys
+import time
+
+import aiohttp
+
+from rpc_pool import RpcPool
+from slot_scheduler import classify_rpc_reply, FETCH_NOT_READY, FETCH_ERROR
+
+RPC_URLS = os.environ.get("RPC_URLS", "https://api.mainnet-beta.solana.com").split(",")
+RECORD_CONCURRENCY = 4         # getBlock requests in flight
+RECORD_RETRIES = 6
+RECORD_BACKOFF = 1.0           # Seconds; doubled per attempt (429s, not-ready slots)
+RECORD_COMPRESSLEVEL = 6       # gzip level: ~8x smaller blocks, still fast to read back
+
+_RESULT_HEAD = re.compile(r'"result"\s*:\s*')
+_decoder = json.JSONDecoder()
+
+
+def recording_path(directory, slot):
+    return os.path.join(directory, f"{slot}.json.gz")
+
+
+def recorded_slots(directory):
+    """Sorted slots that have a recording in `directory`."""
+    slots = []
+    for name in os.listdir(directory):
+        if name.endswith(".json.gz") and name[:-len(".json.gz")].isdigit():
+            slots.append(int(name[:-len(".json.gz")]))
+    return sorted(slots)
+
+
+def load_recording(directory, slot):
+    """Returns the recorded `result` text (or {"error": ...} text), None if not recorded."""
+    try:
+        with gzip.open(recording_path(directory, slot), "rt", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def result_text(reply_text, reply):
+    """Slices the raw `result` value out of a getBlock reply without re-encoding it."""
+    m = _RESULT_HEAD.search(reply_text)
+    if m is None:
+        return json.dumps(reply["result"])
+    _, end = _decoder.raw_decode(reply_text, m.end())
+    return reply_text[m.end():end]
+
+
+def save_recording(directory, slot, text):
+    path = recording_path(directory, slot)
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=RECORD_COMPRESSLEVEL) as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+async def record_slot(session, rpc, directory, slot):
+    payload = {
+        "jsonrpc": "2.0",
+        "id": slot,
+        "method": "getBlock",
+        "params": [slot, {
+            "transactionDetails": "full",
+            "maxSupportedTransactionVersion": 0,
+        }]
+    }
+    for attempt in range(RECORD_RETRIES):
+        try:
+            status, text, elapsed, _ = await rpc.post(session, payload)
+        except Exception as e:
+            print(f"[Recorder] Slot {slot}: {e}")
+            status, text = None, None
+        if status == 200:
+            reply = json.loads(text)
+            outcome = classify_rpc_reply(reply)
+            if outcome not in (FETCH_NOT_READY, FETCH_ERROR):
+                if reply.get("result") is not None:
+                    save_recording(directory, slot, result_text(text, reply))
+                else:
+                    save_recording(directory, slot, json.dumps({"error": reply["error"]}))
+                print(f"[Recorder] Slot {slot}: {outcome} ({len(text) / 1e6:.2f} MB, {elapsed * 1000:.0f} ms)")
+                return True
+        await asyncio.sleep(RECORD_BACKOFF * (2 ** attempt))
+    print(f"[Recorder] Giving up on slot {slot}")
+    return False
+
+
+async def get_tip(session, rpc):
+    status, text, _, _ = await rpc.post(session, {"jsonrpc": "2.0", "id": "tip", "method": "getSlot"})
+    return json.loads(text)["result"]
+
+
+async def record(directory, first_slot, count):
+    os.makedirs(directory, exist_ok=True)
+    rpc = RpcPool(RPC_URLS)
+    slots_in_flight = asyncio.Semaphore(RECORD_CONCURRENCY)
+
+    async with aiohttp.ClientSession() as session:
+        if first_slot is None:
+            # Stay a little behind the tip so every slot is final
+            first_slot = await get_tip(session, rpc) - count - 32
+        done = set(recorded_slots(directory))
+        todo = [s for s in range(first_slot, first_slot + count) if s not in done]
+        print(f"[Recorder] Recording {len(todo)} slot(s) from {first_slot} into {directory} ({count - len(todo)} already there)")
+
+        async def one(slot):
+            async with slots_in_flight:
+                return await record_slot(session, rpc, directory, slot)
+
+        start = time.monotonic()
+        results = await asyncio.gather(*(one(s) for s in todo))
+        print(f"[Recorder] {sum(results)}/{len(todo)} slots recorded in {time.monotonic() - start:.1f}s | RPC: {rpc.describe()}")
+
+
+def main():
+    if len(sys.argv) != 4:
+        print("Usage: python3 block_recorder.py <dir> <first_slot|tip> <count>")
+        sys.exit(1)
+    directory, first, count = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    asyncio.run(record(directory, None if first == "tip" else int(first), count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Cheap inspection of raw getBlock JSON without decoding the whole block.
+
+The Solana RPC serialises objects with their keys in alphabetical order, so
+every element of `transactions` starts with the literal `{"meta":`. Inside
+JSON strings a double quote is always escaped, so that sequence can only
+appear at the start of a transaction object. That lets us:
+
+  - tell whether a block can contain any TARGETS instruction with a few
+    substring searches over the raw text (no decode at all), and
+  - for blocks that can, decode only the transactions around each
+    "Instruction: <name>" hit with `raw_decode`, instead of the full block.
+
+If the layout ever differs (no `{"meta":` marker found) callers fall back to
+`json.loads` on the whole block.
+
+The scanners take `str` replies as well as byte buffers (bytes, or an mmap
+over the SHM ring with `start` / `end` bounds), so the detector can scan a
+block in place; bytes need markers from `encode_markers`.
+"""
+
+import json
+import re
+
+TX_START = '{"meta":'
+TX_START_BYTES = TX_START.encode()
+
+_decoder = json.JSONDecoder()
+_RESULT_HEAD = re.compile(r'"result"\s*:\s*\{')
+_BLOCK_TIME = re.compile(r'"blockTime"\s*:\s*(-?\d+|null)')
+_HEAD_WINDOW = 128
+_BLOCK_TIME_WINDOW = 4096
+
+
+def build_markers(targets):
+    """
+    Turns {program_id: [instruction, ...]} into the substrings a block must
+    contain to be worth decoding: [(program_id, ["Instruction: X", ...]), ...].
+    """
+    return [(prog_id, [f"Instruction: {instr}" for instr in instrs])
+            for prog_id, instrs in targets.items()]
+
+
+def encode_markers(markers):
+    """Byte-string copy of `build_markers` output, for scanning raw buffers."""
+    return [(prog_id.encode(), [m.encode() for m in instr_markers])
+            for prog_id, instr_markers in markers]
+
+
+def block_may_match(data, markers, start=0, end=None):
+    """False only if no target program ID appears next to one of its instruction markers."""
+    if end is None:
+        end = len(data)
+    for prog_id, instr_markers in markers:
+        if data.find(prog_id, start, end) != -1 and any(data.find(m, start, end) != -1 for m in instr_markers):
+            return True
+    return False
+
+
+def candidate_transactions(data, markers, start=0, end=None):
+    """
+    Returns the decoded transactions that contain at least one instruction
+    marker, or None if the raw layout is not the expected one.
+    """
+    if end is None:
+        end = len(data)
+    is_text = isinstance(data, str)
+    tx_start = TX_START if is_text else TX_START_BYTES
+
+    starts = set()
+    for prog_id, instr_markers in markers:
+        if data.find(prog_id, start, end) == -1:
+            continue
+        for marker in instr_markers:
+            pos = data.find(marker, start, end)
+            while pos != -1:
+                tx_pos = data.rfind(tx_start, start, pos)
+                if tx_pos == -1:
+                    return None
+                starts.add(tx_pos)
+                pos = data.find(marker, pos + len(marker), end)
+
+    txs = []
+    for tx_pos in sorted(starts):
+        if is_text:
+            tx, _ = _decoder.raw_decode(data, tx_pos)
+        else:
+            # Decode only up to the next transaction; raw_decode ignores the rest.
+            stop = data.find(tx_start, tx_pos + len(tx_start), end)
+            tx, _ = _decoder.raw_decode(data[tx_pos:end if stop == -1 else stop].decode())
+        txs.append(tx)
+    return txs
+
+
+def peek_reply(json_string):
+    """
+    Classifies a raw getBlock reply without decoding the block.
+    Returns (reply_or_None, block_time): `reply` is the decoded envelope for
+    small non-block replies (errors, null results) and None when the reply
+    carries a block, in which case `block_time` is read straight from the text.
+    """
+    if _RESULT_HEAD.search(json_string, 0, _HEAD_WINDOW):
+        m = _BLOCK_TIME.search(json_string, 0, _BLOCK_TIME_WINDOW) or _BLOCK_TIME.search(json_string)
+        if m is None or m.group(1) == "null":
+            return None, None
+        return None, int(m.group(1))
+    return json.loads(json_string), None
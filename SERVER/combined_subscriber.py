@@ -4,33 +4,68 @@ import time
 import asyncio
 import aiohttp
 import json
-import re
+import os
 from datetime import datetime, timezone
-from multiprocessing import shared_memory, Queue, Process
+from multiprocessing import Queue, Process
 import redis.asyncio as aioredis  # Async Redis for the consumer
 
+from shm_ring import open_ring_segment, open_ring_mmap, ShmRingWriter, ShmRingDetectorView, write_block
+from doorbell import Doorbell, DoorbellRinger, RingSignals, doorbell_path, DESCRIPTOR_FIELDS
+from slot_scheduler import SlotScheduler, classify_rpc_reply, FETCH_OK, FETCH_ERROR, FETCH_DROPPED, FETCH_UNDETECTED
+from slot_ledger import SlotLedger
+from slot_leases import SlotLeases, lease_run_active
+from rpc_pool import RpcPool
+from block_scan import block_may_match, candidate_transactions, peek_reply
+from instruction_matcher import InstructionMatcher
+from pool_decoder import decode_pools
+from lookup_tables import LookupTableCache
+from raydium_lookup import RaydiumPoolLookup
+from pool_writer import RedisPoolWriter, connection_pool
+from pool_sender import PoolUpdateSender, spill_path
+from detector_pool import DetectorShards
+from slot_trace import SlotTrace, mark, serve_metrics
+
 # --- Configuration ---
-REDIS_CMD_HOST = '20.46.50.39' # Listener (Remote Orchestrator)
-REDIS_DATA_HOST = '20.46.50.39' # Writer (Local Data Storage)
+REDIS_HOST = os.environ.get("REDIS_HOST", '20.46.50.39')  # Default for both; REDIS_HOST=127.0.0.1 for offline runs
+REDIS_CMD_HOST = os.environ.get("REDIS_CMD_HOST", REDIS_HOST) # Listener (Remote Orchestrator)
+REDIS_DATA_HOST = os.environ.get("REDIS_DATA_HOST", REDIS_HOST) # Writer (Local Data Storage)
 REDIS_PORT = 6379
 
 # --- NEW: HTTP Server Config ---
 # Ensure this matches the port your Flask server is running on (5000 or 8080)
-POOL_SERVER_URL = "http://20.46.50.39:8080/pool_update"
+# Override with POOL_SERVER=http://127.0.0.1:8899 to report to rpc_standin.py
+POOL_SERVER = os.environ.get("POOL_SERVER", "http://20.46.50.39:8080")
+POOL_SERVER_URL = f"{POOL_SERVER}/pool_update"
+POOL_SERVER_BATCH_URL = f"{POOL_SERVER}/pool_update_batch"  # Falls back to POOL_SERVER_URL if missing
 
 CHANNEL_NAME = 'start-work'
 PUBLISH_CHANNEL = 'pool-monitor'
 
-RPC_URL = "https://api.mainnet-beta.solana.com"
+# Comma-separated override, e.g. RPC_URLS=http://127.0.0.1:8899 for a local stand-in
+RPC_URLS = os.environ.get("RPC_URLS", "https://api.mainnet-beta.solana.com").split(",")
+RPC_HEDGE = len(RPC_URLS) > 1  # Duplicate slow requests to the next-best endpoint
+RPC_SHARED_LIMITS = True  # AIMD concurrency limit per endpoint, shared by all workers on this host
+RPC_BATCH_MODE = True  # Use JSON-RPC batches while catching up / backfilling
 RAYDIUM_API_URL = "https://api-v3.raydium.io/pools/key/ids"
-NUM_WORKERS = 6
+RAYDIUM_CROSS_CHECK = False  # Also look decoded pools up in the Raydium API and log mismatches
+MAX_POOL_AGE = 300  # Seconds; older pool creations are ignored
+SLOT_LEASING = True  # Lease slot ranges through Redis (slot_leases.py) instead of the static stride below
+NUM_WORKERS = 6  # Static stride when SLOT_LEASING is off
 
 # --- Shared Memory Config ---
-SHM_NAME = "solana_json_shm"
-SHM_SIZE = 10 * 1024 * 1024  # 10MB
-FLAG_OFFSET = 0
-SIZE_OFFSET = 1
-DATA_OFFSET = 9
+SHM_NAME = os.environ.get("SHM_NAME", "solana_json_shm")  # One ring per producer; override when several share a host
+SHM_SIZE = 64 * 1024 * 1024  # 64MB ring (layout documented in shm_ring.py)
+DETECTOR_IDLE_TIMEOUT = 5.0  # Upper bound on one doorbell wait in the detector (safety net)
+
+# --- Metrics ---
+# Prometheus text on 127.0.0.1: producer METRICS_PORT + worker_id, its detector METRICS_PORT + 100 + worker_id
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
+
+# --- Detector Config ---
+DETECTOR_PROCESSES = int(os.environ.get("DETECTOR_PROCESSES", "2"))  # Scanning shards per detector; 0/1 = scan in the detector itself
+# Set on producers when one host-wide detector (`combined_subscriber.py detector`) serves their rings
+EXTERNAL_DETECTOR = os.environ.get("EXTERNAL_DETECTOR", "") not in ("", "0")
+DETECTOR_RINGS = os.environ.get("DETECTOR_RINGS", f"{SHM_NAME}:1")  # shm_name:worker_id,... for the host-wide detector
 
 # --- Filter Logic (For Pool Detector) ---
 TARGETS = {
@@ -38,146 +73,320 @@ TARGETS = {
     "CPMMoo8L3F4NbTegBCKVNunggL7H1ZpdTHKxQB5qKP1C": ["Initialize", "InitializeWithPermission"],
     "CAMMCzo5YL8w4VFF8KVHrK22GGUsp5VTaW7grrKgrWqK": ["CreatePool"]
 }
+# Compiled once; also provides the raw markers a block must contain before we decode it
+MATCHER = InstructionMatcher(TARGETS)
+# Lookup-table contents learned from resolved v0 transactions (per scanning process)
+ALT_CACHE = LookupTableCache()
 
 # ==========================================
 # PART 1: POOL DETECTOR (CONSUMER PROCESS)
 # ==========================================
 
-async def check_raydium_api(session, account_keys, worker_id):
-    if not account_keys: return
+def publish_pool(writer, sender, payload, worker_id=None, trace=None):
+    """Hands one new pool to the Redis writer and the pool-server sender; never waits."""
+    # --- A. WRITE TO REDIS (batched by the writer task) ---
+    writer.submit(payload, trace.fork() if trace else None)
+
+    # --- B. SEND TO HTTP SERVER (batched, retried and spilled by the sender task) ---
+    sender.submit(payload, f"proxy{worker_id}" if worker_id is not None else None,
+                  trace.fork() if trace else None)
+
+def payload_from_api(pool):
+    mint_a = pool.get('mintA', {})
+    mint_b = pool.get('mintB', {})
+    vaults = pool.get('vault', {})
+    return {
+        "pool_address": pool.get('id'),
+        "base_mint": mint_a.get('address'),
+        "quote_mint": mint_b.get('address'),
+        "base_vault": vaults.get('A'),
+        "quote_vault": vaults.get('B')
+    }
 
-    ids_param = ",".join(account_keys)
+async def check_raydium_api(lookup, writer, sender, account_keys, worker_id=None):
+    """Slow path for pool creations the local decoder does not understand."""
+    if not account_keys: return
 
     try:
-        async with session.get(f"{RAYDIUM_API_URL}?ids={ids_param}", timeout=5) as resp:
-            data = await resp.json()
-
-            if data.get('data'):
-                # --- 1. CONNECT TO REDIS FOR WRITING ---
-                r_write = aioredis.Redis(host=REDIS_DATA_HOST, port=REDIS_PORT, decode_responses=True)
-                
-                for pool in data['data']:
-                    if pool is None: continue
-
-                    # Age Check
-                    open_time = int(pool.get('openTime', 0))
-                    age_seconds = int(time.time()) - open_time
-                    if age_seconds > 300: continue
-
-                    # Extract Data
-                    mint_a = pool.get('mintA', {})
-                    mint_b = pool.get('mintB', {})
-                    vaults = pool.get('vault', {})
-                    
-                    p_id = pool.get('id')
-                    b_mint = mint_a.get('address')
-                    q_mint = mint_b.get('address')
-                    b_vault = vaults.get('A')
-                    q_vault = vaults.get('B')
-
-                    payload = {
-                        "pool_address": p_id,
-                        "base_mint": b_mint,
-                        "quote_mint": q_mint,
-                        "base_vault": b_vault,
-                        "quote_vault": q_vault
-                    }
-
-                    # --- A. WRITE TO REDIS (Keep Existing Logic) ---
-                    try:
-                        pipeline = r_write.pipeline()
-                        if b_vault: pipeline.sadd("BASE_VAULTS", b_vault)
-                        if q_vault: pipeline.sadd("QUOTE_VAULTS", q_vault)
-                        if b_mint:  pipeline.sadd("BASE_MINTS", b_mint)
-                        if q_mint:  pipeline.sadd("QUOTE_MINTS", q_mint)
-                        if p_id:    pipeline.sadd("PAIR_ADDRESSES", p_id)
-                        pipeline.publish(PUBLISH_CHANNEL, json.dumps(payload))
-                        await pipeline.execute()
-                        print(f"\n[✅ REDIS] {b_mint} / {q_mint}")
-                    except Exception as e:
-                        print(f"[Redis Write Error] {e}")
-
-                    # --- B. SEND TO HTTP SERVER (New Logic) ---
-                    try:
-                        # Construct Header: "proxy1", "proxy2", etc.
-                        machine_name = f"proxy{worker_id}" 
-                        headers = {"X-Machine-Name": machine_name}
-                        
-                        # We reuse the existing 'session' which is efficient
-                        async with session.post(POOL_SERVER_URL, json=payload, headers=headers) as post_resp:
-                            if post_resp.status == 200:
-                                print(f"[✅ HTTP] Sent to server as {machine_name}")
-                            else:
-                                print(f"[❌ HTTP] Failed: {post_resp.status}")
-                    except Exception as e:
-                        print(f"[HTTP Send Error] {e}")
-                
-                await r_write.aclose()
+        # Cached and coalesced with the other lookups of this block
+        for pool in await lookup.lookup(account_keys):
+            if pool is None: continue
+
+            # Age Check
+            open_time = int(pool.get('openTime', 0))
+            age_seconds = int(time.time()) - open_time
+            if age_seconds > MAX_POOL_AGE: continue
+
+            publish_pool(writer, sender, payload_from_api(pool), worker_id)
 
     except Exception as e:
         print(f"[Raydium API Error] {e}")
 
-async def process_block(session, block_data, worker_id):
+async def cross_check_pool(lookup, payload, worker_id):
+    """Compares a locally decoded pool with what the Raydium API reports."""
+    try:
+        pools = await lookup.lookup([payload["pool_address"]])
+        if pools[0] is None:
+            print(f"[Cross-check W{worker_id}] {payload['pool_address']} not (yet) known to the API")
+            return
+        api_payload = payload_from_api(pools[0])
+        diff = {k: (v, api_payload.get(k)) for k, v in payload.items() if api_payload.get(k) != v}
+        if diff:
+            print(f"[Cross-check W{worker_id}] Mismatch for {payload['pool_address']}: {diff}")
+    except Exception as e:
+        print(f"[Cross-check W{worker_id}] API error: {e}")
+
+def is_stale(block_time):
+    # Blocks replayed while catching up can be older than any pool we care about
+    return block_time is not None and time.time() - block_time > MAX_POOL_AGE
+
+def detect_pools(block_data, slot=None):
+    """
+    CPU half of detection (runs in a detector shard). Returns (pools,
+    unresolved): decoded pool payloads, and the account keys of matched
+    transactions the decoder does not understand.
+    """
+    pools, unresolved = [], []
     if not block_data or 'transactions' not in block_data:
-        return
+        return pools, unresolved
 
-    tasks = []
     for tx in block_data['transactions']:
         meta = tx.get('meta')
         if not meta or not meta.get('logMessages'): continue
-        
-        log_str = " ".join(meta['logMessages'])
-        found = False
-        
-        for prog_id, instrs in TARGETS.items():
-            if prog_id in log_str:
-                for instr in instrs:
-                    pattern = rf"Instruction: {instr}\b"
-                    if re.search(pattern, log_str):
-                        found = True
-                        break
-            if found: break
-        
-        if found:
-            # Handle Raw JSON Format (List of strings)
-            keys = tx['transaction']['message']['accountKeys']
-            tasks.append(check_raydium_api(session, keys, worker_id))
+
+        # One pass over the log lines with the precompiled matcher
+        match = MATCHER.match(meta['logMessages'])
+
+        if match:
+            # v0 transactions: static keys + lookup-table addresses
+            keys = ALT_CACHE.account_keys(tx, slot)
+
+            # Pool accounts sit at fixed instruction-account positions; no API call needed
+            decoded = decode_pools(tx, keys)
+            pools.extend(payload for name, payload in decoded)
+            if not decoded:
+                unresolved.append(keys)
+    return pools, unresolved
+
+async def publish_detection(lookup, writer, sender, detection, worker_id, trace=None):
+    """I/O half of detection: publishes decoded pools, then runs the API follow-ups."""
+    pools, unresolved = detection
+    tasks = []
+    for payload in pools:
+        publish_pool(writer, sender, payload, worker_id, trace)
+        if RAYDIUM_CROSS_CHECK:
+            tasks.append(cross_check_pool(lookup, payload, worker_id))
+    for keys in unresolved:
+        tasks.append(check_raydium_api(lookup, writer, sender, keys, worker_id))
 
     if tasks:
         await asyncio.gather(*tasks)
 
-async def async_consumer_loop(mp_queue, worker_id):
-    print(f"[Consumer] 🚀 Pool Detector Started for Worker {worker_id}...")
-    
-    async with aiohttp.ClientSession() as session:
+async def process_block(lookup, writer, sender, block_data, worker_id, block_time=None, slot=None):
+    if is_stale(block_time):
+        return
+    await publish_detection(lookup, writer, sender, detect_pools(block_data, slot), worker_id)
+
+def extract_candidates(data, markers, start=0, end=None):
+    """
+    Returns {"transactions": [...]} with the transactions that may hold a
+    target instruction, or None when the block cannot contain any.
+    """
+    if not block_may_match(data, markers, start, end):
+        return None
+    # Decode only the transactions around each instruction hit
+    txs = candidate_transactions(data, markers, start, end)
+    if txs is not None:
+        return {"transactions": txs}
+    if end is None:
+        end = len(data)
+    block_data = json.loads(data if isinstance(data, str) else data[start:end])
+    return block_data.get("result", block_data)
+
+# --- Detector Shards (see detector_pool.py) ---
+
+_SHARD_RINGS = {}  # shm name -> mmap, opened on first use in each shard process
+
+def scan_ring_record(shm_name, start, end, slot):
+    """Shard job: scans one ring record in place. Returns a detection or None."""
+    ring_map = _SHARD_RINGS.get(shm_name)
+    if ring_map is None:
+        ring_map = _SHARD_RINGS[shm_name] = open_ring_mmap(shm_name)
+    block_data = extract_candidates(ring_map, MATCHER.byte_markers, start, end)
+    return detect_pools(block_data, slot) if block_data is not None else None
+
+def scan_json(json_string, slot):
+    """Shard job for blocks that came through the queue instead of the ring."""
+    block_data = extract_candidates(json_string, MATCHER.markers)
+    return detect_pools(block_data, slot) if block_data is not None else None
+
+class DetectorFrontEnd:
+    """
+    The I/O side of one detector: Raydium lookups, the Redis writer and the
+    pool-server sender, shared by every ring it serves. Blocks are scanned by
+    DETECTOR_PROCESSES shards, or in this process when there are none.
+    """
+
+    def __init__(self, session, worker_id):
+        self.worker_id = worker_id
+        self.lookup = RaydiumPoolLookup(session, RAYDIUM_API_URL)
+        # One long-lived connection pool per detector process
+        r_write = aioredis.Redis(connection_pool=connection_pool(REDIS_DATA_HOST, REDIS_PORT))
+        self.writer = RedisPoolWriter(r_write, PUBLISH_CHANNEL, worker_id)
+        # Pool-server notifications go through their own queue (header: "proxy1", "proxy2", ...)
+        self.sender = PoolUpdateSender(session, POOL_SERVER_URL, POOL_SERVER_BATCH_URL,
+                                       f"proxy{worker_id}", spill_path(worker_id))
+        self.shards = DetectorShards(DETECTOR_PROCESSES) if DETECTOR_PROCESSES > 1 else None
+        self.followups = set()
+        self.blocks_seen = 0
+        self.blocks_decoded = 0
+
+    def start(self):
+        asyncio.create_task(self.writer.run())
+        asyncio.create_task(self.sender.run())
+        if self.shards:
+            self.shards.start()
+
+    async def scan(self, slot, fn, *args):
+        if self.shards:
+            return await self.shards.submit(slot, fn, *args)
+        return fn(*args)
+
+    def publish(self, detection, worker_id, trace=None):
+        """
+        Publishes decoded pools now (callers go in slot order); API lookups
+        and cross-checks continue in the background.
+        """
+        self.blocks_decoded += 1
+        if detection[0]:
+            mark(trace, "detector_matched")
+        task = asyncio.create_task(publish_detection(self.lookup, self.writer, self.sender, detection, worker_id, trace))
+        self.followups.add(task)
+        task.add_done_callback(self.followups.discard)
+
+    def count_block(self, bell):
+        self.blocks_seen += 1
+        if self.blocks_seen % 100 == 0:
+            wake = bell.describe() if bell else "inline queue"
+            shards = f" | Shards: {self.shards.describe()}" if self.shards else ""
+            print(f"[Consumer] {self.blocks_seen} blocks, {self.blocks_decoded} needed decoding | {wake} | API: {self.lookup.describe()} | Redis: {self.writer.describe()} | HTTP: {self.sender.describe()}{shards}")
+
+async def serve_ring(front, shm_name, worker_id):
+    """
+    Feeds the blocks of one producer's SHM ring through the detector. Blocks
+    are scanned concurrently, but records are released and pools published
+    in ring (= slot) order.
+    """
+    while True:
+        try:
+            ring_map = open_ring_mmap(shm_name)
+            ring_view = ShmRingDetectorView(ring_map)
+            break
+        except (FileNotFoundError, ValueError) as e:
+            print(f"[Consumer] Waiting for SHM ring {shm_name} (worker {worker_id}): {e}")
+            await asyncio.sleep(DETECTOR_IDLE_TIMEOUT)
+    bell = Doorbell(doorbell_path(shm_name, "detector"), DESCRIPTOR_FIELDS)
+    space_bell = DoorbellRinger(doorbell_path(shm_name, "producer"))
+    ring_view.attach()
+    print(f"[Consumer] Serving SHM ring {shm_name} for worker {worker_id}")
+
+    # Outstanding records in ring order: (slot, next_tail, scan task or None, trace)
+    in_order = asyncio.Queue()
+
+    async def release_in_order():
         while True:
+            slot, next_tail, job, trace = await in_order.get()
+            detection = None
+            try:
+                if job is not None:
+                    detection = await job
+            except Exception as e:
+                print(f"[Consumer] Error on slot {slot}: {e!r}")
+            # The ring space can be reused once this and every earlier record is done
+            ring_view.release(next_tail)
+            space_bell.ring()
+            if detection is not None:
+                front.publish(detection, worker_id, trace)
+
+    asyncio.create_task(release_in_order())
+
+    while True:
+        # Sleeps in the kernel until the producer hands something over
+        for offset, length, slot, written_ns in await bell.wait(DETECTOR_IDLE_TIMEOUT):
+            front.count_block(bell)
+            if offset < ring_view.start:
+                # Written before we attached; not ours to release
+                continue
             try:
-                json_string = mp_queue.get_nowait()
-                block_data = json.loads(json_string)
-                
-                if "result" in block_data:
-                    block_data = block_data["result"]
-                
-                await process_block(session, block_data, worker_id)
-                
-            except Exception:
-                await asyncio.sleep(0.01)
-
-def consumer_entry_point(mp_queue, worker_id):
+                start, end, block_time, next_tail = ring_view.locate(offset)
+            except Exception as e:
+                print(f"[Consumer] Error on slot {slot}: {e!r}")
+                continue
+            trace = SlotTrace(slot, block_time, written_ns / 1e9).mark("shm_consumed")
+            job = None
+            if end - start != length:
+                print(f"[Consumer] Descriptor for slot {slot} does not match the ring record")
+            elif not is_stale(block_time):
+                job = asyncio.create_task(front.scan(slot, scan_ring_record, shm_name, start, end, slot))
+            in_order.put_nowait((slot, next_tail, job, trace))
+
+async def serve_queue(front, mp_queue, worker_id):
+    """Fallback without shared memory: blocks arrive whole through the queue."""
+    print(f"[Consumer] SHM ring unavailable, expecting inline blocks for worker {worker_id}")
+    while True:
+        slot, json_string, queued_at = await asyncio.to_thread(mp_queue.get)
+        front.count_block(None)
+        try:
+            block_time = peek_reply(json_string)[1]
+            if is_stale(block_time):
+                continue
+            trace = SlotTrace(slot, block_time, queued_at).mark("shm_consumed")
+            detection = await front.scan(slot, scan_json, json_string, slot)
+            if detection is not None:
+                front.publish(detection, worker_id, trace)
+        except Exception as e:
+            print(f"[Consumer] Error on slot {slot}: {e!r}")
+
+async def async_consumer_loop(mp_queue, worker_id, rings=None):
+    """
+    `rings` is a list of (shm_name, worker_id) to serve; None means the ring
+    of this worker, or `mp_queue` when that ring does not exist.
+    """
+    print(f"[Consumer] 🚀 Pool Detector Started for Worker {worker_id} ({max(DETECTOR_PROCESSES, 1)} scanning process(es))...")
+
+    serve_metrics(METRICS_PORT + 100 + worker_id)
+    async with aiohttp.ClientSession() as session:
+        front = DetectorFrontEnd(session, worker_id)
+        front.start()
+
+        if rings is None:
+            rings = [(SHM_NAME, worker_id)] if os.path.exists(os.path.join("/dev/shm", SHM_NAME)) else []
+        if not rings:
+            await serve_queue(front, mp_queue, worker_id)
+            return
+        await asyncio.gather(*(serve_ring(front, shm_name, ring_worker) for shm_name, ring_worker in rings))
+
+def consumer_entry_point(mp_queue, worker_id, rings=None):
     try:
-        asyncio.run(async_consumer_loop(mp_queue, worker_id))
+        asyncio.run(async_consumer_loop(mp_queue, worker_id, rings))
     except KeyboardInterrupt:
         pass
 
+def parse_detector_rings(spec):
+    """DETECTOR_RINGS="solana_json_shm_w1:1,solana_json_shm_w2:2" -> [(shm_name, worker_id), ...]"""
+    rings = []
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        shm_name, _, ring_worker = entry.rpartition(":")
+        rings.append((shm_name, int(ring_worker)))
+    return rings
+
 # ==========================================
 # PART 2: SUBSCRIBER (PRODUCER PROCESS)
 # ==========================================
-# ... (No changes needed in fetch_block or run_worker_inline, 
-#      they just put data into the queue) ...
 
-async def fetch_block(session, slot_num, request_id, worker_id, shm_buf, mp_queue):
+def get_block_request(slot_num, request_id):
     # Standard Raw JSON request
-    payload = {
+    return {
         "jsonrpc": "2.0",
         "id": request_id,
         "method": "getBlock",
@@ -187,63 +396,172 @@ async def fetch_block(session, slot_num, request_id, worker_id, shm_buf, mp_queu
         }]
     }
 
+async def deliver_block(slot_num, json_string, block_time, worker_id, ring, mp_queue, signals, trace=None):
+    """
+    Hands one raw getBlock reply that carries a block to the SHM ring and a
+    descriptor of it to the detector. Returns FETCH_OK, FETCH_DROPPED if the
+    block could not be handed over at all, or FETCH_UNDETECTED if it is in the
+    ring (so the receiver has it) but the detector missed it: refetching it
+    would hand the receiver the same rows twice.
+    """
+    if trace is not None:
+        trace.block_time = block_time
+        trace.mark("queued")
+    if ring is None:
+        # No shared memory: the detector gets the block itself through the queue
+        try:
+            mp_queue.put_nowait((slot_num, json_string, time.time()))
+            return FETCH_OK
+        except Exception:
+            print(f"[W {worker_id}] Detector queue full, dropped slot {slot_num}")
+            return FETCH_DROPPED
+
+    # 1. SHM WRITE (the only copy; receiver and detector both read it in place)
+    json_bytes = json_string.encode('utf-8')
+    seq = await write_block(ring, signals.space, json_bytes, slot_num, block_time, f"[W {worker_id}]")
+    if seq is None:
+        return FETCH_DROPPED
+    mark(trace, "shm_written")
+
+    # 2. DESCRIPTOR FOR THE DETECTOR (its doorbell doubles as the descriptor queue)
+    if ring.detector_attached() and not signals.detector.ring(ring.last_offset, len(json_bytes), slot_num, time.time_ns()):
+        print(f"[W {worker_id}] Detector doorbell full or closed, detector skips slot {slot_num}")
+        return FETCH_UNDETECTED
+    return FETCH_OK
+
+async def fetch_block(session, rpc, slot_num, request_id, worker_id, ring, mp_queue, signals):
+    """Fetches one block with a single getBlock call."""
+    payload = get_block_request(slot_num, request_id)
+    trace = SlotTrace(slot_num).mark("request_sent")
+
     try:
-        start = asyncio.get_event_loop().time()
-        async with session.post(RPC_URL, json=payload) as response:
-            elapsed = (asyncio.get_event_loop().time() - start) * 1000
-            now = datetime.now(timezone.utc)
-            ts = now.strftime("%H:%M:%S") + f":{int(now.microsecond/1000):03d}"
+        status, json_string, elapsed, endpoint = await rpc.post(session, payload)
+        trace.mark("response_received")
+        elapsed *= 1000
+        now = datetime.now(timezone.utc)
+        ts = now.strftime("%H:%M:%S") + f":{int(now.microsecond/1000):03d}"
+
+        if status != 200:
+            print(f"[W {worker_id} | {ts}] HTTP {status} from {endpoint.url}")
+            return FETCH_ERROR
+
+        # Only small error / null replies get decoded; blocks are passed on raw
+        reply, block_time = peek_reply(json_string)
+        if reply is not None:
+            outcome = classify_rpc_reply(reply)
+            if outcome != FETCH_OK:
+                return outcome
+            block_time = reply["result"].get("blockTime")
+
+        print(f"[W {worker_id} | {ts}] Got slot {slot_num} ({elapsed:.1f} ms)")
+        return await deliver_block(slot_num, json_string, block_time, worker_id, ring, mp_queue, signals, trace)
 
-            if response.status == 200:
-                json_string = await response.text()
-                result = json.loads(json_string)
+    except Exception as e:
+        print(f"[W {worker_id}] Error: {e}")
+        return FETCH_ERROR
+
+def split_batch_reply(text):
+    """
+    Splits a JSON-RPC batch reply into (raw_json_string, decoded) pairs, one
+    per element. Each raw string is a slice of the reply, so consumers get the
+    exact bytes a single getBlock would have returned, without re-encoding.
+    """
+    decoder = json.JSONDecoder()
+    items = []
+    idx = text.index('[') + 1
+    end = len(text)
+    while idx < end:
+        ch = text[idx]
+        if ch in ' \t\r\n,':
+            idx += 1
+            continue
+        if ch == ']':
+            break
+        obj, next_idx = decoder.raw_decode(text, idx)
+        items.append((text[idx:next_idx], obj))
+        idx = next_idx
+    return items
+
+async def fetch_block_batch(session, rpc, slots, request_id, worker_id, ring, mp_queue, signals):
+    """
+    Fetches several blocks with one JSON-RPC batch request and delivers each
+    reply on its own. Returns {slot: FETCH_* outcome}.
+    """
+    # Batch element ids encode the slot so replies can arrive in any order.
+    payload = [get_block_request(slot, f"{request_id}:{slot}") for slot in slots]
+    sent_at = time.time()
 
-                # 1. QUEUE WRITE
-                try:
-                    mp_queue.put_nowait(json_string)
-                except Exception:
-                    pass
-
-                # 2. SHM WRITE
-                if result.get("result") is not None:
-                    print(f"[W {worker_id} | {ts}] Got slot {slot_num} ({elapsed:.1f} ms)")
-
-                    if shm_buf is not None:
-                        json_bytes = json_string.encode('utf-8')
-                        data_size = len(json_bytes)
-
-                        if data_size <= (SHM_SIZE - DATA_OFFSET):
-                            retries = 0
-                            while shm_buf[FLAG_OFFSET] == 1:
-                                if retries > 0 and retries % 100 == 0:
-                                    print(f"[W {worker_id}] Waiting for SHM to clear...")
-                                await asyncio.sleep(0.005)
-                                retries += 1
-                            
-                            shm_buf[SIZE_OFFSET:DATA_OFFSET] = data_size.to_bytes(8, 'little')
-                            shm_buf[DATA_OFFSET:DATA_OFFSET + data_size] = json_bytes
-                            shm_buf[FLAG_OFFSET] = 1 
-                        else:
-                            print(f"[W {worker_id}] Error: JSON size {data_size} > SHM limit")
-                else:
-                    pass 
-            else:
-                print(f"[W {worker_id} | {ts}] HTTP {response.status}")
+    try:
+        status, text, elapsed, endpoint = await rpc.post(session, payload)
+        received_at = time.time()
+        elapsed *= 1000
+        now = datetime.now(timezone.utc)
+        ts = now.strftime("%H:%M:%S") + f":{int(now.microsecond/1000):03d}"
+
+        if status != 200:
+            print(f"[W {worker_id} | {ts}] HTTP {status} from {endpoint.url} (batch of {len(slots)})")
+            return {slot: FETCH_ERROR for slot in slots}
+
+        if not text.lstrip().startswith('['):
+            # Providers that reject batches answer with a single error object.
+            print(f"[W {worker_id} | {ts}] Batch rejected: {text[:200]}")
+            return {slot: FETCH_ERROR for slot in slots}
+
+        outcomes = {}
+        for json_string, result in split_batch_reply(text):
+            reply_id = str(result.get("id") or "")
+            if ":" not in reply_id:
+                continue
+            slot_num = int(reply_id.rsplit(":", 1)[1])
+            outcome = classify_rpc_reply(result)
+            if outcome == FETCH_OK:
+                block_time = result["result"].get("blockTime")
+                # One request for the whole batch: every slot shares its send / receive stamps
+                trace = SlotTrace(slot_num).mark("request_sent", sent_at).mark("response_received", received_at)
+                outcome = await deliver_block(slot_num, json_string, block_time, worker_id, ring, mp_queue, signals, trace)
+            outcomes[slot_num] = outcome
+
+        got = sum(1 for o in outcomes.values() if o in (FETCH_OK, FETCH_UNDETECTED))
+        print(f"[W {worker_id} | {ts}] Got {got}/{len(slots)} slots in batch ({elapsed:.1f} ms)")
+        return outcomes
 
     except Exception as e:
-        print(f"[W {worker_id}] Error: {e}")
+        print(f"[W {worker_id}] Batch error: {e}")
+        return {slot: FETCH_ERROR for slot in slots}
+
+async def run_worker_inline(worker_id, slot, ring, mp_queue, signals):
+    """`slot` is the start signal's slot; None joins a leased run already in progress."""
+    print(f"[Worker {worker_id}] Subscriber Loop Started at slot {slot if slot is not None else 'current lease'}")
+    # Shared slot ledger: records every outcome and feeds gaps back for backfill
+    r_ledger = aioredis.Redis(host=REDIS_DATA_HOST, port=REDIS_PORT)
+    ledger = SlotLedger(r_ledger, worker_id)
+
+    # Slot ranges are leased from Redis as this worker needs them
+    leases = None
+    if SLOT_LEASING:
+        leases = SlotLeases(r_ledger, worker_id)
+        if slot is not None:
+            await leases.start_at(slot)
+
+    # Routes each request to the fastest healthy endpoint (optionally hedged)
+    rpc = RpcPool(RPC_URLS, hedge=RPC_HEDGE, shared_limits=RPC_SHARED_LIMITS)
 
-async def run_worker_inline(worker_id, slot, shm_buf, mp_queue):
-    print(f"[Worker {worker_id}] Subscriber Loop Started at slot {slot}")
     async with aiohttp.ClientSession() as session:
-        request_id = 0
-        while True:
-            asyncio.create_task(
-                fetch_block(session, slot, request_id, worker_id, shm_buf, mp_queue)
-            )
-            slot += NUM_WORKERS
-            request_id += 1
-            await asyncio.sleep(2.4)
+        async def fetch(slot_num, request_id):
+            return await fetch_block(session, rpc, slot_num, request_id, worker_id, ring, mp_queue, signals)
+
+        async def fetch_batch(slots, request_id):
+            return await fetch_block_batch(session, rpc, slots, request_id, worker_id, ring, mp_queue, signals)
+
+        # Paces requests to the chain tip and retries slots that are not ready yet
+        scheduler = SlotScheduler(
+            session, rpc, worker_id, slot or 0, 1 if leases else NUM_WORKERS, fetch, ledger,
+            batch_fetch_fn=fetch_batch if RPC_BATCH_MODE else None, leases=leases,
+        )
+        try:
+            await scheduler.run()
+        finally:
+            await r_ledger.aclose()
 
 # ==========================================
 # PART 3: MAIN ENTRY POINT
@@ -251,32 +569,50 @@ async def run_worker_inline(worker_id, slot, shm_buf, mp_queue):
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python3 main_orchestrator.py <worker_id>")
+        print("Usage: python3 main_orchestrator.py <worker_id> | detector")
         sys.exit(1)
 
+    if sys.argv[1] == "detector":
+        # One detector (front end + DETECTOR_PROCESSES shards) for every producer ring on this host
+        rings = parse_detector_rings(DETECTOR_RINGS)
+        print(f"[Detector] Serving {len(rings)} ring(s): {', '.join(name for name, _ in rings)}")
+        consumer_entry_point(None, 0, rings)
+        return
+
     WORKER_ID = int(sys.argv[1])
+    serve_metrics(METRICS_PORT + WORKER_ID)
     
+    # Only used without shared memory (serve_queue): whole blocks as (slot, json_string, queued_at)
     mp_queue = Queue(maxsize=1000)
 
-    # --- CHANGED: Pass WORKER_ID to consumer so it knows its name ---
-    detector_proc = Process(target=consumer_entry_point, args=(mp_queue, WORKER_ID), daemon=True)
-    detector_proc.start()
-
+    # The ring must exist before the detector attaches to it
     shm = None
     try:
-        shm = shared_memory.SharedMemory(name=SHM_NAME, create=True, size=SHM_SIZE)
-        shm.buf[FLAG_OFFSET] = 0
-    except FileExistsError:
-        try:
-            shm = shared_memory.SharedMemory(name=SHM_NAME, create=False)
-        except:
-            pass
+        shm = open_ring_segment(SHM_NAME, SHM_SIZE)
+    except Exception as e:
+        print(f"[Worker {WORKER_ID}] SHM ring unavailable: {e}")
+
+    # Doorbells wake the receiver / detector per block and us when space frees up
+    signals = RingSignals(SHM_NAME) if shm else None
+    ring = ShmRingWriter(shm.buf, on_publish=signals.receiver.ring) if shm else None
 
-    shm_buf = shm.buf if shm else None
+    # --- CHANGED: Pass WORKER_ID to consumer so it knows its name ---
+    if EXTERNAL_DETECTOR and shm:
+        print(f"[Worker {WORKER_ID}] Pool detection handled by the host detector")
+    else:
+        # Not daemonic: the detector starts its own scanning processes
+        detector_proc = Process(target=consumer_entry_point, args=(mp_queue, WORKER_ID))
+        detector_proc.start()
 
     # Wait for Redis Start Signal
     try:
         r = redis.Redis(host=REDIS_CMD_HOST, port=REDIS_PORT)
+        if SLOT_LEASING and lease_run_active(redis.Redis(host=REDIS_DATA_HOST, port=REDIS_PORT)):
+            # Other workers hold live leases: join the run without a start signal
+            print(f"[Worker {WORKER_ID}] Joining the leased run in progress")
+            asyncio.run(run_worker_inline(WORKER_ID, None, ring, mp_queue, signals))
+            return
+
         p = r.pubsub()
         p.subscribe(CHANNEL_NAME)
         print(f"[Worker {WORKER_ID}] Waiting for start signal on {REDIS_CMD_HOST}...")
@@ -300,15 +636,20 @@ def main():
                     starting_slot = 0
                     start_time = time.time()
 
-                my_slot = starting_slot + WORKER_ID
-                wait_time = (start_time + WORKER_ID * 0.4) - time.time()
+                if SLOT_LEASING:
+                    # Ranges are handed out from the start slot on; no per-worker offset
+                    my_slot = starting_slot
+                    wait_time = start_time - time.time()
+                else:
+                    my_slot = starting_slot + WORKER_ID
+                    wait_time = (start_time + WORKER_ID * 0.4) - time.time()
 
                 if wait_time > 0:
                     print(f"Sleeping {wait_time:.2f}s...")
                     time.sleep(wait_time)
 
                 asyncio.run(run_worker_inline(
-                    WORKER_ID, my_slot, shm_buf, mp_queue
+                    WORKER_ID, my_slot, ring, mp_queue, signals
                 ))
                 break
 
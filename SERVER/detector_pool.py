@@ -0,0 +1,136 @@
+"""
+Process pool for the CPU-bound half of pool detection.
+
+The detector front end (one asyncio process per host or per worker) keeps all
+network I/O: doorbells, Redis, the pool server and the Raydium API. Scanning
+and decoding blocks is handed to DETECTOR_PROCESSES shard processes:
+
+  - a block goes to shard `slot % shards`, so consecutive slots spread over
+    all cores while a single block is still scanned by one process (per-block
+    latency stays what it was),
+  - a job is a module-level function plus its arguments; for ring records
+    only the record bounds travel, the shard maps the SHM segment and reads
+    the block in place,
+  - `submit()` returns when the shard answers; callers that need ordering
+    (ring release, publishing in slot order) await results in their own order.
+
+A shard that dies fails its pending jobs and is started again.
+"""
+
+import asyncio
+import itertools
+import time
+from multiprocessing import Pipe, Process
+
+SHARD_MAX_INFLIGHT = 32        # Jobs queued per shard before submit() waits
+
+
+def _shard_main(conn):
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if job is None:
+            return
+        token, fn, args = job
+        start = time.perf_counter()
+        try:
+            result = ("ok", fn(*args))
+        except Exception as e:
+            result = ("error", repr(e))
+        conn.send((token, result, time.perf_counter() - start))
+
+
+class _Shard:
+    def __init__(self, index):
+        self.index = index
+        self.pending = {}              # token -> Future
+        self.slots = asyncio.Semaphore(SHARD_MAX_INFLIGHT)
+        self.jobs = 0
+        self.busy = 0.0
+        self.restarts = 0
+        self._spawn()
+
+    def _spawn(self):
+        self.conn, child = Pipe()
+        self.proc = Process(target=_shard_main, args=(child,), daemon=True)
+        self.proc.start()
+        child.close()
+
+
+class DetectorShards:
+    def __init__(self, count):
+        self.count = count
+        self.shards = []
+        self.stopped = False
+        self._tokens = itertools.count()
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        for i in range(self.count):
+            shard = _Shard(i)
+            self.shards.append(shard)
+            loop.add_reader(shard.conn.fileno(), self._on_readable, shard)
+
+    def _on_readable(self, shard):
+        try:
+            while shard.conn.poll():
+                token, (status, value), elapsed = shard.conn.recv()
+                future = shard.pending.pop(token, None)
+                shard.jobs += 1
+                shard.busy += elapsed
+                if future is None or future.done():
+                    continue
+                if status == "ok":
+                    future.set_result(value)
+                else:
+                    future.set_exception(RuntimeError(f"Shard {shard.index}: {value}"))
+        except (EOFError, OSError):
+            self._restart(shard)
+
+    def _restart(self, shard):
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(shard.conn.fileno())
+        shard.conn.close()
+        if self.stopped:
+            return
+        for future in shard.pending.values():
+            if not future.done():
+                future.set_exception(RuntimeError(f"Shard {shard.index} exited"))
+        shard.pending.clear()
+        shard.restarts += 1
+        shard.proc.join(1)
+        print(f"[Detector] Shard {shard.index} exited (code {shard.proc.exitcode}); restarting")
+        shard._spawn()
+        loop.add_reader(shard.conn.fileno(), self._on_readable, shard)
+
+    async def submit(self, slot, fn, *args):
+        """Runs fn(*args) on the shard that owns `slot` and returns its result."""
+        shard = self.shards[slot % self.count]
+        async with shard.slots:
+            token = next(self._tokens)
+            future = asyncio.get_running_loop().create_future()
+            shard.pending[token] = future
+            try:
+                shard.conn.send((token, fn, args))
+            except (BrokenPipeError, OSError):
+                self._restart(shard)
+                raise
+            return await future
+
+    def describe(self):
+        parts = []
+        for shard in self.shards:
+            avg = shard.busy / shard.jobs * 1000 if shard.jobs else 0.0
+            restarts = f", {shard.restarts} restarts" if shard.restarts else ""
+            parts.append(f"#{shard.index}: {shard.jobs} blocks avg {avg:.1f}ms, {len(shard.pending)} queued{restarts}")
+        return "; ".join(parts)
+
+    def stop(self):
+        self.stopped = True
+        for shard in self.shards:
+            try:
+                shard.conn.send(None)
+            except OSError:
+                pass
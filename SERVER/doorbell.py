@@ -0,0 +1,191 @@
+"""
+Cross-process wakeups for the SHM ring handoffs.
+
+A doorbell is a named FIFO next to the ring segment, one per waiting role:
+
+    /dev/shm/<shm_name>.receiver.wake   producer -> C++ receiver (RECEIVER/doorbell.h)
+    /dev/shm/<shm_name>.detector.wake   producer -> pool detector
+    /dev/shm/<shm_name>.producer.wake   consumers -> producer ("space freed")
+
+The waiting side owns the FIFO (`Doorbell`): it blocks on the read end, with
+the fd registered on the asyncio loop, so an idle process sleeps in the
+kernel instead of polling. Whoever hands something over calls
+`DoorbellRinger.ring()`, which writes the current CLOCK_MONOTONIC time as
+one 8-byte message. Writes are non-blocking: with nobody listening the ring
+is a no-op, and a full pipe already means a wakeup is pending.
+
+A doorbell can also carry a few fixed-size fields after the timestamp. The
+detector's doorbell carries the ring descriptor (offset, length, slot,
+written time) of every block, so it doubles as the descriptor queue. Messages are far below
+PIPE_BUF, so each one is written atomically.
+
+The waiter reads the timestamps back, which gives the wake latency of every
+handoff (ring -> waiter running again).
+"""
+
+import asyncio
+import errno
+import os
+import stat
+import struct
+import tempfile
+import time
+from collections import deque
+
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+RECONNECT_INTERVAL = 1.0       # Seconds between attempts to open a missing FIFO
+LATENCY_WINDOW = 1024          # Wake latency samples kept
+
+DESCRIPTOR_FIELDS = "QQQQ"      # offset, length, slot of a ring record, wall time written (ns, for tracing)
+
+
+def doorbell_path(shm_name, role):
+    return os.path.join(SHM_DIR, f"{shm_name.lstrip('/')}.{role}.wake")
+
+
+def _make_fifo(path):
+    try:
+        os.mkfifo(path, 0o666)
+    except FileExistsError:
+        if not stat.S_ISFIFO(os.stat(path).st_mode):
+            os.remove(path)
+            os.mkfifo(path, 0o666)
+
+
+def _message(fields):
+    return struct.Struct("<Q" + fields)
+
+
+class Doorbell:
+    """Waiting side. Create it in the process that sleeps."""
+
+    def __init__(self, path, fields=""):
+        self.path = path
+        self.message = _message(fields)
+        self._partial = b""
+        _make_fifo(path)
+        self.fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        # Hold a write end ourselves so the FIFO never reports EOF when the
+        # last ringer goes away (that would make the fd readable forever).
+        self._keepalive = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.wakeups = 0
+        self.timeouts = 0
+
+    def drain(self, record=True):
+        """
+        Consumes pending rings and returns their fields, oldest first (empty
+        tuples for plain wakeups). `record=False` discards stale rings
+        without counting their latency.
+        """
+        now = time.monotonic_ns()
+        data = self._partial
+        while True:
+            try:
+                chunk = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            data += chunk
+        size = self.message.size
+        usable = len(data) - len(data) % size
+        self._partial = data[usable:]
+
+        messages = []
+        for stamp, *fields in self.message.iter_unpack(data[:usable]):
+            if record:
+                self.latencies.append((now - stamp) / 1e6)
+            messages.append(tuple(fields))
+        return messages
+
+    async def wait(self, timeout=None):
+        """
+        Sleeps until the doorbell rings (or `timeout` seconds pass) and drains
+        it. Returns the drained messages (empty on timeout).
+        """
+        messages = self.drain()
+        if messages:
+            self.wakeups += 1
+            return messages
+
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        loop.add_reader(self.fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await asyncio.wait_for(ready, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return []
+        finally:
+            loop.remove_reader(self.fd)
+        self.wakeups += 1
+        return self.drain()
+
+    def describe(self):
+        if not self.latencies:
+            return f"wake: no samples ({self.timeouts} timeouts)"
+        ordered = sorted(self.latencies)
+        p50 = ordered[len(ordered) // 2]
+        p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+        return f"wake p50={p50:.3f}ms p99={p99:.3f}ms ({self.wakeups} wakeups, {self.timeouts} timeouts)"
+
+    def close(self):
+        os.close(self.fd)
+        os.close(self._keepalive)
+
+
+class DoorbellRinger:
+    """Ringing side. Cheap enough to call on every handoff."""
+
+    def __init__(self, path, fields=""):
+        self.path = path
+        self.message = _message(fields)
+        self.fd = None
+        self._next_attempt = 0.0
+
+    def _connect(self):
+        now = time.monotonic()
+        if now < self._next_attempt:
+            return False
+        self._next_attempt = now + RECONNECT_INTERVAL
+        try:
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            # ENOENT: no FIFO yet; ENXIO: FIFO exists but nobody is listening.
+            if e.errno not in (errno.ENOENT, errno.ENXIO):
+                raise
+            return False
+        return True
+
+    def ring(self, *fields):
+        """
+        Returns True if the message was delivered. False means nobody is
+        listening, or the pipe is full (for plain wakeups a wake is then
+        already pending).
+        """
+        if self.fd is None and not self._connect():
+            return False
+        try:
+            os.write(self.fd, self.message.pack(time.monotonic_ns(), *fields))
+        except BlockingIOError:
+            return False
+        except BrokenPipeError:
+            os.close(self.fd)
+            self.fd = None
+            return False
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class RingSignals:
+    """The doorbells around one SHM ring, as seen by its producer."""
+
+    def __init__(self, shm_name, detector=True):
+        self.receiver = DoorbellRinger(doorbell_path(shm_name, "receiver"))
+        self.detector = DoorbellRinger(doorbell_path(shm_name, "detector"), DESCRIPTOR_FIELDS) if detector else None
+        self.space = Doorbell(doorbell_path(shm_name, "producer"))
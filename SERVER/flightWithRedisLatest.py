@@ -1,9 +1,105 @@
+import os
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.flight as flight
-import pandas as pd
 import sys
 import redis
 
+from batch_coalescer import BatchCoalescer
+from slot_trace import SlotTrace, serve_metrics
+from watchlist_cache import WatchlistCache
+
+METRICS_PORT = 9300  # Prometheus text (slot_trace.py): flight_enriched age per batch, batch sizes (batch_coalescer.py)
+
+PRINT_ROWS = 10  # Rows of every enriched (coalesced) batch echoed to the console (only without a sink or store)
+SINK_DSN = os.environ.get("SINK_DSN", "")  # Postgres-wire DSN (RisingWave / Postgres); see balance_sink.py
+STORE_DIR = os.environ.get("STORE_DIR", "")  # Partitioned Parquet history; see balance_store.py
+DISPLAY_COLS = [
+    'timestamp', 'wallet', 'signature', 'mint',
+    'pre_balance', 'post_balance',
+    'baseVault', 'quoteVault',
+    'base_price', 'quote_price'
+]
+
+_NULL_UTF8 = pa.scalar(None, pa.utf8())
+
+
+class ArrowWatchlist:
+    """
+    The Redis watchlists and price maps as Arrow arrays, so enrichment runs in
+    pyarrow.compute without touching Python objects per row. Built from the
+    tuple _get_redis_data() returns; prices stay the strings Redis holds.
+
+    Every watched wallet (vaults and priced wallets) is one entry of
+    `wallet_keys`, with its vault flags and prices at the same position, so a
+    batch needs a single index_in per column (one hash-table build) and the
+    rest are takes. Mints work the same way.
+    """
+    def __init__(self, base_vaults, quote_vaults, base_mints, quote_mints, base_prices, quote_prices):
+        wallets = list(dict.fromkeys([*base_vaults, *quote_vaults, *base_prices, *quote_prices]))
+        self.wallet_keys = pa.array(wallets, pa.utf8())
+        self.is_base_vault = pa.array([w in base_vaults for w in wallets], pa.bool_())
+        self.is_quote_vault = pa.array([w in quote_vaults for w in wallets], pa.bool_())
+        self.base_prices = pa.array([base_prices.get(w) for w in wallets], pa.utf8())
+        self.quote_prices = pa.array([quote_prices.get(w) for w in wallets], pa.utf8())
+
+        mints = list(dict.fromkeys([*base_mints, *quote_mints]))
+        self.mint_keys = pa.array(mints, pa.utf8())
+        self.is_base_mint = pa.array([m in base_mints for m in mints], pa.bool_())
+        self.is_quote_mint = pa.array([m in quote_mints for m in mints], pa.bool_())
+
+        self.counts = (len(base_vaults), len(base_prices))
+
+    def describe(self):
+        return f"Vaults: {self.counts[0]} | Base Prices: {self.counts[1]}"
+
+
+def _tag(values, index, flags):
+    # The value itself where its key has the flag, null elsewhere (null index -> null flag -> null)
+    return pc.if_else(flags.take(index), values, _NULL_UTF8)
+
+
+def enrich_batch(batch, ts_val, watch):
+    """
+    Returns `batch` plus timestamp, baseVault/quoteVault, base_price/quote_price
+    and baseMint/quoteMint columns, all computed on the Arrow buffers.
+    """
+    names = list(batch.schema.names)
+    arrays = list(batch.columns)
+    names.append('timestamp')
+    arrays.append(pa.repeat(pa.scalar(ts_val, pa.int64()), batch.num_rows))
+
+    if 'wallet' in names:
+        wallet = batch.column(names.index('wallet'))
+        index = pc.index_in(wallet, value_set=watch.wallet_keys)
+        # A. Tag Vaults
+        names += ['baseVault', 'quoteVault']
+        arrays += [_tag(wallet, index, watch.is_base_vault), _tag(wallet, index, watch.is_quote_vault)]
+        # B. Attach Prices (null for wallets that are not priced vaults)
+        names += ['base_price', 'quote_price']
+        arrays += [watch.base_prices.take(index), watch.quote_prices.take(index)]
+
+    if 'mint' in names:
+        mint = batch.column(names.index('mint'))
+        index = pc.index_in(mint, value_set=watch.mint_keys)
+        names += ['baseMint', 'quoteMint']
+        arrays += [_tag(mint, index, watch.is_base_mint), _tag(mint, index, watch.is_quote_mint)]
+
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+def format_rows(batch, columns, limit):
+    """Plain-text table of the first `limit` rows (only these rows become Python objects)."""
+    columns = [c for c in columns if c in batch.schema.names]
+    head = batch.slice(0, limit)
+    cells = [[str(v) for v in head.column(batch.schema.names.index(c)).to_pylist()] for c in columns]
+    widths = [max([len(c)] + [len(v) for v in col]) for c, col in zip(columns, cells)]
+    lines = [" ".join(c.rjust(w) for c, w in zip(columns, widths))]
+    for row in zip(*cells):
+        lines.append(" ".join(v.rjust(w) for v, w in zip(row, widths)))
+    return "\n".join(lines)
+
+
 class SolanaFlightServer(flight.FlightServerBase):
     def __init__(self, location, **kwargs):
         super(SolanaFlightServer, self).__init__(location, **kwargs)
@@ -22,34 +118,47 @@ class SolanaFlightServer(flight.FlightServerBase):
             "quote_prices": "QUOTE_VAULT_TO_PRICE"
         }
 
+        # Local copy of the sets and price maps, kept current by keyspace notifications
+        # (watchlist_cache.py); every version is turned into an ArrowWatchlist once
+        self.watch_cache = WatchlistCache(self.redis_client, [
+            (self.REDIS_KEYS["base_vaults"], "set"),
+            (self.REDIS_KEYS["quote_vaults"], "set"),
+            (self.REDIS_KEYS["base_mints"], "set"),
+            (self.REDIS_KEYS["quote_mints"], "set"),
+            (self.REDIS_KEYS["base_prices"], "hash"),
+            (self.REDIS_KEYS["quote_prices"], "hash"),
+        ], build=ArrowWatchlist)
+
+        # Enriched batches go to the streaming DB, micro-batched off the handler threads
+        self.sink = None
+        if SINK_DSN:
+            from balance_sink import BalanceSink
+            self.sink = BalanceSink(SINK_DSN)
+        self.store = None
+        if STORE_DIR:
+            from balance_store import BalanceStore
+            self.store = BalanceStore(STORE_DIR)
+
+        # Handlers only hand batches over; enrichment and output run once per block (batch_coalescer.py)
+        self.coalescer = BatchCoalescer(self._process)
+
         print(f"Server running at: {location}")
         print(f"Connected to Redis at localhost:6379")
 
-    def _get_redis_data(self):
-        """
-        Fetches Sets (Watchlists) AND Hashes (Prices) in a single pipeline.
-        Returns: (base_v_set, quote_v_set, base_m_set, quote_m_set, base_price_map, quote_price_map)
-        """
+    def serve(self):
+        self.watch_cache.start()
+        for output in (self.sink, self.store):
+            if output is not None:
+                output.start()
+        self.coalescer.start()
         try:
-            pipe = self.redis_client.pipeline()
-            
-            # 1. Fetch Watchlist Sets
-            pipe.smembers(self.REDIS_KEYS["base_vaults"])
-            pipe.smembers(self.REDIS_KEYS["quote_vaults"])
-            pipe.smembers(self.REDIS_KEYS["base_mints"])
-            pipe.smembers(self.REDIS_KEYS["quote_mints"])
-            
-            # 2. Fetch Price Maps (Hash Maps)
-            pipe.hgetall(self.REDIS_KEYS["base_prices"])
-            pipe.hgetall(self.REDIS_KEYS["quote_prices"])
-
-            # Execute all at once
-            results = pipe.execute()
-
-            return results[0], results[1], results[2], results[3], results[4], results[5]
-        except Exception as e:
-            print(f" ✗ Redis connection failed: {e}")
-            return set(), set(), set(), set(), {}, {}
+            super(SolanaFlightServer, self).serve()
+        finally:
+            # Pending blocks go out before the outputs drain
+            self.coalescer.stop()
+            for output in (self.sink, self.store):
+                if output is not None:
+                    output.stop()
 
     def do_put(self, context, descriptor, reader, writer):
         print(f"\n[NEW STREAM] Path: {descriptor.path}")
@@ -81,60 +190,8 @@ class SolanaFlightServer(flight.FlightServerBase):
                         except Exception:
                             pass 
 
-                    # --- STEP 2: Convert to Pandas ---
-                    df = batch.to_pandas()
-                    df['timestamp'] = ts_val
-
-                    # --- STEP 3: Derived Logic (Redis) ---
-                    # Fetch Sets and Price Maps
-                    base_v_set, quote_v_set, base_m_set, quote_m_set, base_p_map, quote_p_map = self._get_redis_data()
-
-                    if 'wallet' in df.columns:
-                        # A. Tag Vaults (Existing Logic)
-                        mask_base_v = df['wallet'].isin(base_v_set)
-                        df['baseVault'] = df['wallet'].where(mask_base_v, None)
-
-                        mask_quote_v = df['wallet'].isin(quote_v_set)
-                        df['quoteVault'] = df['wallet'].where(mask_quote_v, None)
-
-                        # B. Attach Prices (New Logic)
-                        # Pandas .map() is efficient: 
-                        # If wallet is in the map (it's a vault), it gets the price.
-                        # If wallet is NOT in the map (regular user), it gets NaN/None.
-                        df['base_price'] = df['wallet'].map(base_p_map)
-                        df['quote_price'] = df['wallet'].map(quote_p_map)
-
-                    if 'mint' in df.columns:
-                        mask_base_m = df['mint'].isin(base_m_set)
-                        df['baseMint'] = df['mint'].where(mask_base_m, None)
-
-                        mask_quote_m = df['mint'].isin(quote_m_set)
-                        df['quoteMint'] = df['mint'].where(mask_quote_m, None)
-
-                    # --- STEP 4: Print the Data ---
-                    final_cols = [
-                        'timestamp', 'wallet', 'signature', 'mint', 
-                        'pre_balance', 'post_balance', 
-                        'baseVault', 'quoteVault', 
-                        'base_price', 'quote_price'  # <--- Added for display
-                    ]
-
-                    # Select existing columns only to avoid key errors if schema changes slightly
-                    print_cols = [c for c in final_cols if c in df.columns]
-                    print_df = df[print_cols]
-
-                    print("-" * 60)
-                    print(f"Chunk {chunk_count} | Rows: {len(print_df)} | Timestamp: {ts_val}")
-                    # Debug: Show we have prices loaded
-                    print(f"Redis Cache -> Vaults: {len(base_v_set)} | Base Prices: {len(base_p_map)}")
-                    print("-" * 60)
-
-                    # Printing first 10 rows
-                    pd.set_option('display.max_columns', None) # Ensure all cols show
-                    pd.set_option('display.width', 1000)
-                    print(print_df.head(10).to_string(index=False))
-                    print("-" * 60)
-                    sys.stdout.flush()
+                    # --- STEP 2: Add to the block's accumulator (steps 3-4 run in _process) ---
+                    self.coalescer.add((tuple(descriptor.path), ts_val), batch)
 
                 except StopIteration:
                     print("  → StopIteration caught, ending stream")
@@ -152,7 +209,36 @@ class SolanaFlightServer(flight.FlightServerBase):
             import traceback
             traceback.print_exc()
 
+    def _process(self, key, batch, parts):
+        """Enriches and stores (or prints) one coalesced batch of `parts` received batches."""
+        ts_val = key[1]
+
+        # --- STEP 3: Enrich on the Arrow batch (cached watchlists and price maps, no Redis call) ---
+        snapshot = self.watch_cache.snapshot
+        enriched = enrich_batch(batch, ts_val, snapshot.built)
+
+        # Batches only carry blockTime, so this stage has an age but no delta
+        SlotTrace(None, ts_val or None).mark("flight_enriched")
+
+        # --- STEP 4: Store (or print) the Data ---
+        if self.sink is not None:
+            self.sink.submit(enriched)
+        if self.store is not None:
+            self.store.submit(enriched)
+        if self.sink is not None or self.store is not None:
+            return
+
+        print("-" * 60)
+        print(f"Block {ts_val} | Rows: {enriched.num_rows} from {parts} batches | Path: {list(key[0])}")
+        # Debug: Show we have prices loaded
+        print(f"Redis Cache -> {snapshot.built.describe()} | v{snapshot.version}")
+        print("-" * 60)
+        print(format_rows(enriched, DISPLAY_COLS, PRINT_ROWS))
+        print("-" * 60)
+        sys.stdout.flush()
+
 if __name__ == '__main__':
     location = "grpc+tcp://0.0.0.0:8815"
+    serve_metrics(METRICS_PORT)
     server = SolanaFlightServer(location)
     server.serve()
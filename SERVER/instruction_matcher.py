@@ -0,0 +1,71 @@
+"""
+Precompiled matcher for pool-creation instructions in transaction logs.
+
+Built once from a {program_id: [instruction, ...]} map. Each log line is
+looked at once: "Program <id> invoke [n]" / "Program <id> success|failed"
+lines maintain the call stack, and one alternation regex over every target
+instruction name finds "Instruction: <name>" lines. A hit counts when the
+program on top of the stack owns that instruction name, so the matcher can
+report exactly which program and instruction fired.
+
+Targets can be added at runtime with add_target(); the regex and the raw
+block prefilter markers are rebuilt on the spot.
+"""
+
+import re
+
+from block_scan import build_markers, encode_markers
+
+
+class InstructionMatcher:
+    def __init__(self, targets):
+        self.targets = {prog_id: set(instrs) for prog_id, instrs in targets.items()}
+        self._compile()
+
+    def _compile(self):
+        names = {instr for instrs in self.targets.values() for instr in instrs}
+        # Longest first so "InitializeWithPermission" wins over "Initialize".
+        alternation = "|".join(re.escape(n) for n in sorted(names, key=len, reverse=True))
+        self._instr_re = re.compile(rf"Instruction: ({alternation})\b") if names else None
+        self.markers = build_markers(self.targets)
+        self.byte_markers = encode_markers(self.markers)
+
+    def add_target(self, prog_id, instrs):
+        """Adds (or extends) a target program; takes effect for the next transaction."""
+        self.targets.setdefault(prog_id, set()).update(instrs)
+        self._compile()
+
+    def match(self, log_messages):
+        """Returns (program_id, instruction) for the first target hit, or None."""
+        instr_re = self._instr_re
+        if instr_re is None:
+            return None
+        targets = self.targets
+        stack = []
+
+        for line in log_messages:
+            if line.startswith("Program log: "):
+                if "Instruction: " not in line:
+                    continue
+                m = instr_re.search(line)
+                if m is None:
+                    continue
+                instr = m.group(1)
+                if stack:
+                    if instr in targets.get(stack[-1], ()):
+                        return stack[-1], instr
+                else:
+                    # Truncated logs lose the invoke line; accept any owner.
+                    for prog_id, instrs in targets.items():
+                        if instr in instrs:
+                            return prog_id, instr
+            elif line.startswith("Program "):
+                end = line.find(" ", 8)
+                if end == -1:
+                    continue
+                rest = line[end + 1:]
+                if rest.startswith("invoke ["):
+                    stack.append(line[8:end])
+                elif (rest == "success" or rest.startswith("failed")) and stack:
+                    stack.pop()
+        return None
@@ -0,0 +1,183 @@
+"""
+Account-list resolution for v0 transactions with address lookup tables.
+
+Instruction account indices of a v0 transaction point into
+
+    message.accountKeys + loaded writable + loaded readonly
+
+where the loaded addresses come from the lookup tables named in
+message.addressTableLookups. getBlock normally returns them already resolved
+in meta.loadedAddresses, so the common path is a plain list concatenation.
+
+Every resolved transaction also teaches LookupTableCache which address sits
+at which index of which table. When a transaction arrives without
+meta.loadedAddresses (older nodes, trimmed replays) the cache resolves its
+lookups locally, so the detector never has to fetch a table over RPC.
+
+Tables are append-only while active, but a table can be closed and its
+entries are only trusted for ALT_MAX_AGE_SLOTS after they were last seen;
+a newer observation of an index always overwrites the cached address.
+"""
+
+import time
+from collections import OrderedDict
+
+ALT_MAX_TABLES = 50000         # Tables kept (least recently used evicted first)
+ALT_MAX_AGE_SLOTS = 216000     # ~1 day; entries older than this are not trusted
+
+
+class LookupTableCache:
+    def __init__(self, max_tables=ALT_MAX_TABLES, max_age_slots=ALT_MAX_AGE_SLOTS):
+        self.max_tables = max_tables
+        self.max_age_slots = max_age_slots
+        self.tables = OrderedDict()    # table address -> [last_seen_slot, {index: address}]
+        self.hits = 0
+        self.misses = 0
+
+    # --- Learning ---
+
+    def learn(self, lookups, loaded, slot):
+        """Records the table entries a resolved transaction used."""
+        writable = loaded.get("writable") or ()
+        readonly = loaded.get("readonly") or ()
+        w = r = 0
+        for lookup in lookups:
+            w_idx = lookup.get("writableIndexes") or ()
+            r_idx = lookup.get("readonlyIndexes") or ()
+            if w + len(w_idx) > len(writable) or r + len(r_idx) > len(readonly):
+                return
+            table = self._table(lookup["accountKey"], slot)
+            entries = table[1]
+            for idx in w_idx:
+                entries[idx] = writable[w]
+                w += 1
+            for idx in r_idx:
+                entries[idx] = readonly[r]
+                r += 1
+
+    def _table(self, address, slot):
+        table = self.tables.get(address)
+        if table is None:
+            table = self.tables[address] = [slot, {}]
+            if len(self.tables) > self.max_tables:
+                self.tables.popitem(last=False)
+        else:
+            self.tables.move_to_end(address)
+            if slot is not None and (table[0] is None or slot > table[0]):
+                table[0] = slot
+        return table
+
+    # --- Resolution ---
+
+    def resolve(self, lookups, slot):
+        """Returns {"writable": [...], "readonly": [...]} from the cache, or None on any miss."""
+        writable, readonly = [], []
+        for lookup in lookups:
+            table = self.tables.get(lookup["accountKey"])
+            if table is None or self._stale(table, slot):
+                self.misses += 1
+                return None
+            entries = table[1]
+            try:
+                writable.extend(entries[idx] for idx in lookup.get("writableIndexes") or ())
+                readonly.extend(entries[idx] for idx in lookup.get("readonlyIndexes") or ())
+            except KeyError:
+                self.misses += 1
+                return None
+            self.tables.move_to_end(lookup["accountKey"])
+        self.hits += 1
+        return {"writable": writable, "readonly": readonly}
+
+    def _stale(self, table, slot):
+        seen = table[0]
+        return slot is not None and seen is not None and slot - seen > self.max_age_slots
+
+    def account_keys(self, tx, slot=None):
+        """
+        Full account list for `tx`. Static keys only when lookups cannot be
+        resolved, so positions past the static list simply stay out of range.
+        """
+        message = tx["transaction"]["message"]
+        keys = message["accountKeys"]
+        lookups = message.get("addressTableLookups")
+        if not lookups:
+            return keys
+
+        loaded = (tx.get("meta") or {}).get("loadedAddresses")
+        if loaded:
+            self.learn(lookups, loaded, slot)
+        else:
+            loaded = self.resolve(lookups, slot)
+            if loaded is None:
+                return keys
+        return keys + loaded.get("writable", []) + loaded.get("readonly", [])
+
+    def describe(self):
+        return f"{len(self.tables)} tables, {self.hits} hits / {self.misses} misses"
+
+
+def merged_account_keys(tx):
+    """Static keys plus meta.loadedAddresses, without any cache."""
+    message = tx["transaction"]["message"]
+    keys = message["accountKeys"]
+    loaded = (tx.get("meta") or {}).get("loadedAddresses")
+    if not loaded or not message.get("addressTableLookups"):
+        return keys
+    return keys + loaded.get("writable", []) + loaded.get("readonly", [])
+
+
+# --- Benchmark ---
+
+def _synthetic_v0_block(n_txs=1500, n_tables=200, static_keys=12, per_table=6):
+    import random
+    rng = random.Random(7)
+    tables = [[f"T{t}E{i}" for i in range(256)] for t in range(n_tables)]
+    txs = []
+    for n in range(n_txs):
+        lookups, writable, readonly = [], [], []
+        for t in rng.sample(range(n_tables), 3):
+            idx = rng.sample(range(256), per_table)
+            w_idx, r_idx = idx[:per_table // 2], idx[per_table // 2:]
+            lookups.append({"accountKey": f"TABLE{t}", "writableIndexes": w_idx, "readonlyIndexes": r_idx})
+            writable += [tables[t][i] for i in w_idx]
+            readonly += [tables[t][i] for i in r_idx]
+        txs.append({
+            "meta": {"loadedAddresses": {"writable": writable, "readonly": readonly}},
+            "transaction": {"message": {"accountKeys": [f"S{n}K{k}" for k in range(static_keys)],
+                                        "addressTableLookups": lookups}},
+        })
+    return txs
+
+
+def benchmark(rounds=20):
+    txs = _synthetic_v0_block()
+    stripped = [{"meta": {}, "transaction": tx["transaction"]} for tx in txs]
+    cache = LookupTableCache()
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for tx in txs:
+            merged_account_keys(tx)
+    merged = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for tx in txs:
+            cache.account_keys(tx, 1000)
+    learning = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for tx in stripped:
+            cache.account_keys(tx, 1000)
+    cached = time.perf_counter() - start
+
+    per_block = 1000.0 / rounds
+    print(f"{len(txs)} v0 txs/block, {rounds} rounds")
+    print(f"  meta.loadedAddresses merge : {merged * per_block:.2f} ms/block")
+    print(f"  merge + learn into cache   : {learning * per_block:.2f} ms/block")
+    print(f"  resolve from cache only    : {cached * per_block:.2f} ms/block ({cache.describe()})")
+
+
+if __name__ == "__main__":
+    benchmark()
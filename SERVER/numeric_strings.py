@@ -0,0 +1,52 @@
+"""
+Validation of the numeric strings in the enriched batches.
+
+The receiver sends balances and Redis holds prices as strings. A malformed
+one must not fail the batch (Parquet store) or the whole flush (SQL sink)
+it arrives in, so values that do not parse become nulls and the caller logs
+how many there were.
+"""
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Strings accepted per target type; anything else becomes null
+INTEGER_PATTERN = r"^[0-9]+$"
+DECIMAL_PATTERN = r"^[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][+-]?[0-9]+)?$"
+NUMBER_PATTERNS = {
+    pa.uint64(): INTEGER_PATTERN,
+    pa.float64(): DECIMAL_PATTERN,
+}
+
+
+def _parse_or_none(value, arrow_type):
+    try:
+        return pa.scalar(value).cast(arrow_type).as_py()
+    except (pa.ArrowInvalid, TypeError):
+        return None
+
+
+def null_malformed(column, pattern):
+    """Returns (column, bad): the string column with values not matching `pattern` nulled, and their count."""
+    valid = pc.fill_null(pc.match_substring_regex(column, pattern), False)
+    cleaned = pc.if_else(valid, column, pa.scalar(None, column.type))
+    return cleaned, cleaned.null_count - column.null_count
+
+
+def cast_lenient(column, arrow_type):
+    """
+    Returns (column, bad): `column` as `arrow_type`, with strings that do not
+    parse (or overflow) as nulls, and how many values that nulled.
+    """
+    try:
+        return column.cast(arrow_type), 0
+    except pa.ArrowInvalid:
+        if arrow_type not in NUMBER_PATTERNS or not pa.types.is_string(column.type):
+            raise
+    cleaned, _ = null_malformed(column, NUMBER_PATTERNS[arrow_type])
+    try:
+        result = cleaned.cast(arrow_type)
+    except pa.ArrowInvalid:
+        # Well-formed but out of range (uint64 overflow); rare enough to go value by value
+        result = pa.array([_parse_or_none(v, arrow_type) for v in cleaned.to_pylist()], arrow_type)
+    return result, result.null_count - column.null_count
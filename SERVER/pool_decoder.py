@@ -0,0 +1,96 @@
+"""
+Local decoding of Raydium pool-creation instructions.
+
+A pool-creation instruction already names every account the detector needs
+(pool state, both mints, both vaults) at fixed positions of its account list,
+so the payload can be read straight out of the transaction instead of asking
+the Raydium API. Transactions come from getBlock with the default "json"
+encoding: each instruction is {"programIdIndex", "accounts", "data"}, where
+the indices point into the transaction's account list (static keys plus
+lookup-table addresses for v0, see lookup_tables.py) and `data` is base58.
+
+An instruction is recognised by its program ID and its leading data bytes
+(the AMM v4 instruction tag, or the 8-byte Anchor discriminator for CPMM and
+CLMM). Instructions without a known layout are left to the caller.
+"""
+
+from lookup_tables import merged_account_keys
+
+# --- Program IDs ---
+AMM_V4_PROGRAM = "675kPX9MHTjS2zt1qfr1NYHuzeLXfQM9H24wFSUt1Mp8"
+CPMM_PROGRAM = "CPMMoo8L3F4NbTegBCKVNunggL7H1ZpdTHKxQB5qKP1C"
+CLMM_PROGRAM = "CAMMCzo5YL8w4VFF8KVHrK22GGUsp5VTaW7grrKgrWqK"
+
+# program_id -> [(instruction name, data prefix, {payload field: account position})]
+POOL_LAYOUTS = {
+    AMM_V4_PROGRAM: [
+        # initialize2: amm, ..., coin_mint, pc_mint, coin_vault, pc_vault
+        ("initialize2", bytes([1]),
+         {"pool_address": 4, "base_mint": 8, "quote_mint": 9, "base_vault": 10, "quote_vault": 11}),
+    ],
+    CPMM_PROGRAM: [
+        # initialize: creator, amm_config, authority, pool_state, token_0_mint, token_1_mint, ...
+        ("Initialize", bytes([175, 175, 109, 31, 13, 152, 155, 237]),
+         {"pool_address": 3, "base_mint": 4, "quote_mint": 5, "base_vault": 10, "quote_vault": 11}),
+    ],
+    CLMM_PROGRAM: [
+        # create_pool: pool_creator, amm_config, pool_state, token_mint_0, token_mint_1, vault_0, vault_1, ...
+        ("CreatePool", bytes([233, 146, 209, 142, 207, 104, 64, 188]),
+         {"pool_address": 2, "base_mint": 3, "quote_mint": 4, "base_vault": 5, "quote_vault": 6}),
+    ],
+}
+
+_B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_B58_INDEX = {c: i for i, c in enumerate(_B58_ALPHABET)}
+
+
+def b58decode(text):
+    n = 0
+    for c in text:
+        n = n * 58 + _B58_INDEX[c]
+    body = n.to_bytes((n.bit_length() + 7) // 8, "big") if n else b""
+    pad = len(text) - len(text.lstrip("1"))
+    return b"\x00" * pad + body
+
+
+def _instructions(tx):
+    yield from tx["transaction"]["message"].get("instructions", ())
+    for inner in (tx.get("meta") or {}).get("innerInstructions") or ():
+        yield from inner.get("instructions", ())
+
+
+def decode_pools(tx, keys=None):
+    """
+    Returns [(instruction name, payload), ...] for every recognised pool
+    creation in `tx`, outer and inner (CPI) instructions alike. `payload` has
+    the pool_address/base_mint/quote_mint/base_vault/quote_vault fields.
+    `keys` is the resolved account list (defaults to static + loaded keys).
+    """
+    if keys is None:
+        keys = merged_account_keys(tx)
+    found = []
+    seen = set()
+    for ix in _instructions(tx):
+        index = ix.get("programIdIndex")
+        if index is None or index >= len(keys):
+            continue
+        layouts = POOL_LAYOUTS.get(keys[index])
+        if not layouts:
+            continue
+        try:
+            data = b58decode(ix.get("data", ""))
+        except KeyError:
+            continue
+        accounts = ix.get("accounts", ())
+        for name, prefix, positions in layouts:
+            if not data.startswith(prefix):
+                continue
+            try:
+                payload = {field: keys[accounts[pos]] for field, pos in positions.items()}
+            except IndexError:
+                break
+            if payload["pool_address"] not in seen:
+                seen.add(payload["pool_address"])
+                found.append((name, payload))
+            break
+    return found
@@ -0,0 +1,227 @@
+"""
+Outbound queue for pool updates sent to the pool server (POOL_SERVER_URL).
+
+Detection only calls PoolUpdateSender.submit(), which appends to an
+in-process queue; it never waits on the pool server. The sender task:
+
+  - groups queued pools per X-Machine-Name into batches of up to
+    SENDER_MAX_BATCH, collected for SENDER_BATCH_WINDOW,
+  - POSTs each batch as {"pools": [...]} to the batch endpoint, with at most
+    SENDER_CONCURRENCY requests in flight; if the server has no batch
+    endpoint (404 / 405 / 501) it switches to one POST per pool for good,
+  - retries failed sends with jittered exponential backoff,
+  - appends pools that still fail (or arrive while the queue is full) to a
+    JSON-lines spill file; while the server looks down only one spilled pool
+    is retried per SPILL_REPLAY_INTERVAL, once it answers the rest follows
+    (spill file I/O runs in a worker thread, serialized by a lock),
+  - tracks delivery latency (submit -> 200) per machine name.
+"""
+
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from collections import deque
+
+from slot_trace import mark
+
+SENDER_BATCH_WINDOW = 0.05     # Seconds to collect pools after the first one
+SENDER_MAX_BATCH = 50
+SENDER_CONCURRENCY = 4         # POSTs in flight at once
+SENDER_QUEUE_MAX = 10000       # Beyond this, pools go straight to the spill file
+SENDER_RETRIES = 4
+SENDER_BACKOFF = 0.25          # Seconds; attempt n waits uniform(0, SENDER_BACKOFF * 2**n)
+SENDER_TIMEOUT = 5
+SPILL_REPLAY_INTERVAL = 10.0   # Seconds between attempts to replay the spill file
+LATENCY_WINDOW = 256
+SENDER_STATS_INTERVAL = 60.0
+
+BATCH_UNSUPPORTED = (404, 405, 501)
+
+
+def spill_path(worker_id):
+    return os.path.join(tempfile.gettempdir(), f"pool_updates_spill_w{worker_id}.jsonl")
+
+
+def _append_lines(path, lines):
+    with open(path, "a") as f:
+        f.writelines(lines)
+
+
+class PoolUpdateSender:
+    def __init__(self, session, url, batch_url, machine_name, spill_file):
+        self.session = session
+        self.url = url
+        self.batch_url = batch_url
+        self.machine_name = machine_name
+        self.spill_file = spill_file
+        self.queue = asyncio.Queue(maxsize=SENDER_QUEUE_MAX)
+        self.slots = asyncio.Semaphore(SENDER_CONCURRENCY)
+        self.batch_supported = batch_url is not None
+        self.spill_lock = asyncio.Lock()
+        self.tasks = set()             # Send / spill / replay tasks, referenced until they finish
+
+        self.latencies = {}            # machine name -> deque of seconds
+        self.sent = 0
+        self.retries = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.last_success = 0.0
+        self.last_failure = 0.0
+
+    def submit(self, payload, machine_name=None, trace=None):
+        """Queues one pool update; never blocks. `trace` is stamped on delivery."""
+        item = (machine_name or self.machine_name, payload, time.monotonic(), trace)
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self._spawn(self._spill([item]))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[Sender] Task failed: {task.exception()!r}")
+
+    # --- Sending ---
+
+    async def _post(self, url, body, machine_name):
+        headers = {"X-Machine-Name": machine_name}
+        async with self.session.post(url, json=body, headers=headers, timeout=SENDER_TIMEOUT) as resp:
+            await resp.read()
+            return resp.status
+
+    async def _deliver(self, machine_name, items):
+        """One attempt; returns the items that were not accepted."""
+        if self.batch_supported and len(items) > 1:
+            status = await self._post(self.batch_url, {"pools": [p for _, p, _, _ in items]}, machine_name)
+            if status == 200:
+                return []
+            if status not in BATCH_UNSUPPORTED:
+                return items
+            print(f"[Sender] {self.batch_url} answered {status}; sending pools one by one")
+            self.batch_supported = False
+
+        statuses = await asyncio.gather(*(self._post(self.url, p, machine_name) for _, p, _, _ in items),
+                                        return_exceptions=True)
+        return [item for item, status in zip(items, statuses) if status != 200]
+
+    async def _send(self, machine_name, items):
+        async with self.slots:
+            for attempt in range(SENDER_RETRIES):
+                try:
+                    remaining = await self._deliver(machine_name, items)
+                except Exception as e:
+                    print(f"[HTTP Send Error] {e}")
+                    remaining = items
+                failed = {id(i) for i in remaining}
+                self._delivered(machine_name, [i for i in items if id(i) not in failed])
+                items = remaining
+                if not items:
+                    return
+                self.last_failure = time.monotonic()
+                self.retries += 1
+                await asyncio.sleep(random.uniform(0, SENDER_BACKOFF * (2 ** attempt)))
+            await self._spill(items)
+
+    def _delivered(self, machine_name, items):
+        if not items:
+            return
+        now = time.monotonic()
+        self.last_success = now
+        window = self.latencies.setdefault(machine_name, deque(maxlen=LATENCY_WINDOW))
+        for _, _, queued_at, trace in items:
+            window.append(now - queued_at)
+            mark(trace, "http_delivered")
+        self.sent += len(items)
+        print(f"[✅ HTTP] Sent {len(items)} pool(s) to server as {machine_name}")
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + SENDER_BATCH_WINDOW
+        while len(batch) < SENDER_MAX_BATCH:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        self._spawn(self._replay_spill())
+        last_report = time.monotonic()
+        while True:
+            batch = await self._collect()
+            by_machine = {}
+            for item in batch:
+                by_machine.setdefault(item[0], []).append(item)
+            for machine_name, items in by_machine.items():
+                self._spawn(self._send(machine_name, items))
+
+            if time.monotonic() - last_report >= SENDER_STATS_INTERVAL:
+                last_report = time.monotonic()
+                print(f"[Sender] {self.describe()}")
+
+    # --- Spill File ---
+
+    async def _spill(self, items):
+        lines = [json.dumps({"machine": machine_name, "payload": payload}) + "\n"
+                 for machine_name, payload, _, _ in items]
+        async with self.spill_lock:
+            await asyncio.to_thread(_append_lines, self.spill_file, lines)
+        self.spilled += len(items)
+        print(f"[Sender] Server unreachable, spilled {len(items)} pool(s) to {self.spill_file}")
+
+    def _take_spill(self, probe_only):
+        """Reads and removes the spill file (worker thread). With `probe_only`, all but one entry go back."""
+        if not os.path.exists(self.spill_file):
+            return []
+        replay = self.spill_file + ".replay"
+        os.replace(self.spill_file, replay)
+        with open(replay) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        os.remove(replay)
+        if probe_only and len(entries) > 1:
+            entries, rest = entries[:1], entries[1:]
+            _append_lines(self.spill_file, [json.dumps(entry) + "\n" for entry in rest])
+        return entries
+
+    async def _replay_spill(self):
+        while True:
+            await asyncio.sleep(SPILL_REPLAY_INTERVAL)
+            if not self.queue.empty():
+                continue
+            # Server still looks down: send one pool as a probe, keep the rest
+            probe_only = self.last_failure > self.last_success
+            try:
+                async with self.spill_lock:
+                    entries = await asyncio.to_thread(self._take_spill, probe_only)
+            except Exception as e:
+                print(f"[Sender] Spill replay skipped: {e}")
+                continue
+            if not entries:
+                continue
+            for entry in entries:
+                self.submit(entry["payload"], entry["machine"])
+            self.replayed += len(entries)
+            print(f"[Sender] Replaying {len(entries)} spilled pool(s)")
+
+    def describe(self):
+        parts = []
+        for machine_name, window in self.latencies.items():
+            ordered = sorted(window)
+            p50 = ordered[len(ordered) // 2] * 1000
+            p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000
+            parts.append(f"{machine_name} p50={p50:.0f}ms p95={p95:.0f}ms")
+        latency = ", ".join(parts) or "no deliveries"
+        return (f"{latency} | sent {self.sent}, retries {self.retries}, queued {self.queue.qsize()}, "
+                f"spilled {self.spilled}, replayed {self.replayed}")
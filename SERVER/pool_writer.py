@@ -0,0 +1,117 @@
+"""
+Batched Redis writer for detected pools.
+
+The detector hands payloads to RedisPoolWriter.submit(), which only appends
+to an in-process queue. One writer task per detector process drains it: it
+waits for the first payload, keeps collecting for WRITER_BATCH_WINDOW (so all
+pools of a block end up together) and sends the SADDs and PUBLISHes of the
+whole batch in one pipeline over a long-lived connection pool.
+
+Every WRITER_STATS_INTERVAL it prints flush latency and queue depth.
+"""
+
+import asyncio
+import json
+import time
+
+import redis.asyncio as aioredis
+
+from slot_trace import mark
+
+WRITER_BATCH_WINDOW = 0.005    # Seconds to keep collecting after the first payload
+WRITER_MAX_BATCH = 256         # Payloads per pipeline
+WRITER_MAX_CONNECTIONS = 4
+WRITER_RETRIES = 3             # Attempts per batch before it is dropped
+WRITER_RETRY_DELAY = 0.2       # Seconds, doubled per attempt
+WRITER_STATS_INTERVAL = 60.0
+
+SET_FIELDS = (
+    ("base_vault", "BASE_VAULTS"),
+    ("quote_vault", "QUOTE_VAULTS"),
+    ("base_mint", "BASE_MINTS"),
+    ("quote_mint", "QUOTE_MINTS"),
+    ("pool_address", "PAIR_ADDRESSES"),
+)
+
+
+def connection_pool(host, port):
+    return aioredis.ConnectionPool(host=host, port=port, decode_responses=True,
+                                   max_connections=WRITER_MAX_CONNECTIONS)
+
+
+class RedisPoolWriter:
+    def __init__(self, redis_client, channel, worker_id):
+        self.redis = redis_client
+        self.channel = channel
+        self.worker_id = worker_id
+        self.queue = asyncio.Queue()
+
+        self.written = 0
+        self.failed = 0
+        self._flushes = []             # Flush latencies (s) since the last report
+        self._max_depth = 0
+
+    def submit(self, payload, trace=None):
+        """Queues one pool; never waits on Redis. `trace` is stamped once it is published."""
+        self.queue.put_nowait((payload, trace))
+        self._max_depth = max(self._max_depth, self.queue.qsize())
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + WRITER_BATCH_WINDOW
+        while len(batch) < WRITER_MAX_BATCH:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch):
+        pipe = self.redis.pipeline(transaction=False)
+        for payload, _ in batch:
+            for field, key in SET_FIELDS:
+                if payload.get(field):
+                    pipe.sadd(key, payload[field])
+            pipe.publish(self.channel, json.dumps(payload))
+        await pipe.execute()
+
+    async def run(self):
+        last_report = time.monotonic()
+        while True:
+            batch = await self._collect()
+            for attempt in range(WRITER_RETRIES):
+                start = time.monotonic()
+                try:
+                    await self._flush(batch)
+                except Exception as e:
+                    print(f"[Redis Write Error] {e} (attempt {attempt + 1}/{WRITER_RETRIES})")
+                    await asyncio.sleep(WRITER_RETRY_DELAY * (2 ** attempt))
+                    continue
+                self._flushes.append(time.monotonic() - start)
+                self.written += len(batch)
+                for payload, trace in batch:
+                    mark(trace, "redis_published")
+                    print(f"\n[✅ REDIS] {payload.get('base_mint')} / {payload.get('quote_mint')}")
+                break
+            else:
+                self.failed += len(batch)
+
+            if time.monotonic() - last_report >= WRITER_STATS_INTERVAL:
+                last_report = time.monotonic()
+                print(f"[RedisWriter W{self.worker_id}] {self.describe()}")
+                self._flushes = []
+                self._max_depth = self.queue.qsize()
+
+    def describe(self):
+        flushes = sorted(self._flushes)
+        if flushes:
+            p50 = flushes[len(flushes) // 2] * 1000
+            worst = flushes[-1] * 1000
+            latency = f"flush p50={p50:.1f}ms max={worst:.1f}ms over {len(flushes)} pipelines"
+        else:
+            latency = "no flushes"
+        return (f"{latency} | queue depth {self.queue.qsize()} (max {self._max_depth}) | "
+                f"written {self.written}, failed {self.failed}")
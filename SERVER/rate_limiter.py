@@ -0,0 +1,215 @@
+"""
+AIMD concurrency limiter per RPC endpoint, shared by every worker process
+on the host.
+
+The allowed number of concurrent requests to an endpoint grows additively
+(about +1 per limit's worth of healthy replies, like TCP congestion
+avoidance) and is cut multiplicatively on HTTP 429, 5xx, transport errors or
+a latency spike. Cuts are rate-limited to one per CUT_COOLDOWN so a burst of
+429s from the same congestion event only halves the limit once.
+
+State lives in a small file under /dev/shm (one per endpoint URL) guarded by
+flock, so all worker processes on the host obey the same limit:
+
+    0   f64  limit            current concurrency limit
+    8   f64  last_cut         unix time of the last multiplicative decrease
+    16  i64  magic
+    24  ...  PROCESS_SLOTS x (i64 pid, i64 inflight)
+
+Each process keeps its own in-flight count in its slot; slots of processes
+that died are reclaimed (checked only when the limit is reached), so a crash
+never leaks capacity.
+
+Waiting for a slot is event driven within a process: release() wakes one
+local waiter. Slots freed by other processes are only seen by polling, so a
+waiter nobody wakes re-checks after ACQUIRE_POLL, backing off to
+ACQUIRE_POLL_MAX while the endpoint stays saturated.
+"""
+
+import asyncio
+import collections
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+INITIAL_LIMIT = 4.0
+MIN_LIMIT = 1.0
+MAX_LIMIT = 64.0
+DECREASE_FACTOR = 0.5
+CUT_COOLDOWN = 1.0             # Seconds between two multiplicative decreases
+LATENCY_SPIKE_FACTOR = 3.0     # Reply slower than this x p50 counts as congestion
+LATENCY_SPIKE_MIN_SAMPLES = 16
+ACQUIRE_POLL = 0.01            # First re-check for slots freed by other processes (s)
+ACQUIRE_POLL_MAX = 0.2         # Backoff ceiling for that re-check
+
+PROCESS_SLOTS = 64
+_MAGIC = 0x41494D44            # "AIMD"
+_HEADER = struct.Struct("<ddq")
+_SLOT = struct.Struct("<qq")
+_STATE_SIZE = _HEADER.size + PROCESS_SLOTS * _SLOT.size
+
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def _state_path(url):
+    digest = hashlib.sha1(url.encode()).hexdigest()[:16]
+    return os.path.join(SHM_DIR, f"rpc_aimd_{digest}")
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedAimdLimiter:
+    def __init__(self, url):
+        self.url = url
+        self.pid = os.getpid()
+        self.fd = os.open(_state_path(url), os.O_RDWR | os.O_CREAT, 0o666)
+        with self._locked():
+            if os.fstat(self.fd).st_size < _STATE_SIZE:
+                os.ftruncate(self.fd, _STATE_SIZE)
+        self.buf = mmap.mmap(self.fd, _STATE_SIZE)
+        with self._locked():
+            _, _, magic = _HEADER.unpack_from(self.buf, 0)
+            if magic != _MAGIC:
+                self.buf[:] = bytes(_STATE_SIZE)
+                _HEADER.pack_into(self.buf, 0, INITIAL_LIMIT, 0.0, _MAGIC)
+            self.slot = self._claim_slot()
+
+        self._waiters = collections.deque()   # Futures of local acquire() calls, oldest first
+        self.increases = 0
+        self.decreases = 0
+
+    def _locked(self):
+        return _FileLock(self.fd)
+
+    def _claim_slot(self):
+        free = None
+        for i in range(PROCESS_SLOTS):
+            pid, _ = _SLOT.unpack_from(self.buf, _HEADER.size + i * _SLOT.size)
+            if pid == self.pid:
+                return i
+            if free is None and (pid == 0 or not _alive(pid)):
+                free = i
+        if free is None:
+            raise RuntimeError(f"No free AIMD process slot for {self.url}")
+        _SLOT.pack_into(self.buf, _HEADER.size + free * _SLOT.size, self.pid, 0)
+        return free
+
+    def _total_inflight(self, reap=False):
+        """In-flight requests of all processes; `reap` first frees the slots of dead ones."""
+        total = 0
+        for i in range(PROCESS_SLOTS):
+            offset = _HEADER.size + i * _SLOT.size
+            pid, inflight = _SLOT.unpack_from(self.buf, offset)
+            if pid == 0:
+                continue
+            if reap and pid != self.pid and not _alive(pid):
+                _SLOT.pack_into(self.buf, offset, 0, 0)
+                continue
+            total += inflight
+        return total
+
+    def _add_inflight(self, delta):
+        offset = _HEADER.size + self.slot * _SLOT.size
+        pid, inflight = _SLOT.unpack_from(self.buf, offset)
+        _SLOT.pack_into(self.buf, offset, self.pid, max(0, inflight + delta))
+
+    # --- Public API ---
+
+    def limit(self):
+        return _HEADER.unpack_from(self.buf, 0)[0]
+
+    def inflight(self):
+        with self._locked():
+            return self._total_inflight(reap=True)
+
+    def try_acquire(self):
+        with self._locked():
+            limit = int(self.limit())
+            # Dead processes are only looked for when they could be what holds us back
+            if self._total_inflight() >= limit and self._total_inflight(reap=True) >= limit:
+                return False
+            self._add_inflight(1)
+            return True
+
+    async def acquire(self):
+        delay = ACQUIRE_POLL
+        while not self.try_acquire():
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, delay)
+                delay = ACQUIRE_POLL
+            except asyncio.TimeoutError:
+                # No local release; capacity can still come back from another process
+                delay = min(delay * 2, ACQUIRE_POLL_MAX)
+
+    def _wake_one(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def release(self, congested):
+        """
+        Frees one request slot and adjusts the shared limit. `congested` is
+        True / False for a finished request, None to leave the limit alone
+        (e.g. a cancelled hedge).
+        """
+        self._wake_one()    # The waiter resumes after this returns, with the slot already freed
+        with self._locked():
+            self._add_inflight(-1)
+            if congested is None:
+                return
+            limit, last_cut, magic = _HEADER.unpack_from(self.buf, 0)
+            now = time.time()
+            if congested:
+                if now - last_cut < CUT_COOLDOWN:
+                    return
+                limit = max(MIN_LIMIT, limit * DECREASE_FACTOR)
+                last_cut = now
+                self.decreases += 1
+            else:
+                limit = min(MAX_LIMIT, limit + 1.0 / limit)
+                self.increases += 1
+            _HEADER.pack_into(self.buf, 0, limit, last_cut, magic)
+
+    def close(self):
+        with self._locked():
+            _SLOT.pack_into(self.buf, _HEADER.size + self.slot * _SLOT.size, 0, 0)
+        self.buf.close()
+        os.close(self.fd)
+
+
+def is_congested(status, elapsed, endpoint):
+    """True for replies that should shrink the limit."""
+    if status is None or status == 429 or status >= 500:
+        return True
+    if len(endpoint.latencies) >= LATENCY_SPIKE_MIN_SAMPLES:
+        return elapsed > LATENCY_SPIKE_FACTOR * endpoint.percentile(0.5)
+    return False
+
+
+class _FileLock:
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        return False
@@ -0,0 +1,145 @@
+"""
+Caching, coalescing front end for the Raydium `pools/key/ids` API.
+
+Each detector process keeps one RaydiumPoolLookup:
+
+  - answers (pool objects and "not a pool" misses alike) are cached in a
+    bounded LRU with separate TTLs; misses get a shorter TTL because a key
+    can become a pool moments after we first asked about it,
+  - a key that is already being looked up is not asked again; callers
+    await the same future,
+  - new keys are collected for LOOKUP_BATCH_WINDOW and sent as few `ids=`
+    requests as possible, each kept below MAX_URL_LENGTH.
+
+The API returns `data` in the order of the requested ids, with null for keys
+that are not pools.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+
+LOOKUP_BATCH_WINDOW = 0.02     # Seconds to collect keys before sending
+MAX_URL_LENGTH = 4000          # Conservative bound for proxies / CDNs
+CACHE_MAX_ENTRIES = 100000
+POSITIVE_TTL = 600.0           # Seconds a pool answer stays valid
+NEGATIVE_TTL = 30.0            # Seconds a "not a pool" answer stays valid
+REQUEST_TIMEOUT = 5
+
+
+class RaydiumPoolLookup:
+    def __init__(self, session, api_url):
+        self.session = session
+        self.api_url = api_url
+        self.cache = OrderedDict()     # key -> (expires_at, pool_or_None)
+        self.inflight = {}             # key -> Future
+        self.queued = []
+        self._flush_task = None
+
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+
+    # --- Cache ---
+
+    def _cached(self, key, now):
+        entry = self.cache.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] < now:
+            del self.cache[key]
+            return False, None
+        self.cache.move_to_end(key)
+        return True, entry[1]
+
+    def _store(self, key, pool, now):
+        ttl = POSITIVE_TTL if pool is not None else NEGATIVE_TTL
+        self.cache[key] = (now + ttl, pool)
+        self.cache.move_to_end(key)
+        if len(self.cache) > CACHE_MAX_ENTRIES:
+            self.cache.popitem(last=False)
+
+    # --- Public API ---
+
+    async def lookup(self, keys):
+        """
+        Returns [pool_or_None, ...] for `keys`, in order. Raises the first
+        API error if any key could not be looked up (the keys that could are
+        cached all the same).
+        """
+        now = time.monotonic()
+        loop = asyncio.get_running_loop()
+        results = {}
+        waits = {}
+        for key in dict.fromkeys(keys):
+            found, pool = self._cached(key, now)
+            if found:
+                self.hits += 1
+                results[key] = pool
+                continue
+            future = self.inflight.get(key)
+            if future is None:
+                self.misses += 1
+                future = self.inflight[key] = loop.create_future()
+                self.queued.append(key)
+            waits[key] = future
+
+        if waits:
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_later())
+            # Every future is awaited, so a failed request never leaves the others unretrieved
+            outcomes = await asyncio.gather(*(asyncio.shield(f) for f in waits.values()), return_exceptions=True)
+            errors = [o for o in outcomes if isinstance(o, BaseException)]
+            if errors:
+                raise errors[0]
+            results.update(zip(waits, outcomes))
+        return [results[key] for key in keys]
+
+    # --- Batching ---
+
+    def _chunks(self, keys):
+        budget = MAX_URL_LENGTH - len(self.api_url) - len("?ids=")
+        chunk, used = [], 0
+        for key in keys:
+            cost = len(key) + (1 if chunk else 0)
+            if chunk and used + cost > budget:
+                yield chunk
+                chunk, used = [], 0
+                cost = len(key)
+            chunk.append(key)
+            used += cost
+        if chunk:
+            yield chunk
+
+    async def _flush_later(self):
+        await asyncio.sleep(LOOKUP_BATCH_WINDOW)
+        queued, self.queued = self.queued, []
+        self._flush_task = None
+        await asyncio.gather(*(self._fetch(chunk) for chunk in self._chunks(queued)))
+
+    async def _fetch(self, keys):
+        self.requests += 1
+        try:
+            async with self.session.get(f"{self.api_url}?ids={','.join(keys)}", timeout=REQUEST_TIMEOUT) as resp:
+                data = await resp.json()
+            pools = data.get('data')
+            if not data.get('success', True) or pools is None or len(pools) != len(keys):
+                raise RuntimeError(f"Unexpected Raydium API reply for {len(keys)} ids")
+        except Exception as e:
+            # Errors are not cached; the next caller asks again.
+            for key in keys:
+                future = self.inflight.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        now = time.monotonic()
+        for key, pool in zip(keys, pools):
+            self._store(key, pool, now)
+            future = self.inflight.pop(key)
+            if not future.done():
+                future.set_result(pool)
+
+    def describe(self):
+        return (f"{len(self.cache)} cached, {self.hits} hits / {self.misses} misses, "
+                f"{self.requests} API requests")
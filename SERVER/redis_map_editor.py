@@ -15,6 +15,34 @@ KEY_PAIR_TO_QUOTE = "PAIR_TO_QUOTE_VAULT"
 KEY_BASE_PRICE_MAP = "BASE_VAULT_TO_PRICE"
 KEY_QUOTE_PRICE_MAP = "QUOTE_VAULT_TO_PRICE"
 
+def apply_price_update(r, pair_id, base_price, quote_price):
+    """
+    Writes one pair's prices into the vault price maps (also driven by benchmark.py).
+    Returns (base_vault, quote_vault), or None if the pair has no vault mapping.
+    """
+    # --- A. Lookup Vaults ---
+    # We need to find which vaults correspond to this pair
+    # Using a pipeline for speed
+    pipe_lookup = r.pipeline()
+    pipe_lookup.hget(KEY_PAIR_TO_BASE, pair_id)
+    pipe_lookup.hget(KEY_PAIR_TO_QUOTE, pair_id)
+    base_vault, quote_vault = pipe_lookup.execute()
+
+    if not base_vault or not quote_vault:
+        return None
+
+    # --- B. Update Price Maps ---
+    pipe_update = r.pipeline()
+
+    if base_price is not None:
+        pipe_update.hset(KEY_BASE_PRICE_MAP, base_vault, base_price)
+
+    if quote_price is not None:
+        pipe_update.hset(KEY_QUOTE_PRICE_MAP, quote_vault, quote_price)
+
+    pipe_update.execute()
+    return base_vault, quote_vault
+
 def start_subscriber():
     # 1. Connect to Redis
     try:
@@ -48,28 +76,11 @@ def start_subscriber():
                     print(f"[Warn] Received event without pair ID: {event}")
                     continue
 
-                # --- A. Lookup Vaults ---
-                # We need to find which vaults correspond to this pair
-                # Using a pipeline for speed
-                pipe_lookup = r.pipeline()
-                pipe_lookup.hget(KEY_PAIR_TO_BASE, pair_id)
-                pipe_lookup.hget(KEY_PAIR_TO_QUOTE, pair_id)
-                base_vault, quote_vault = pipe_lookup.execute()
-
-                if not base_vault or not quote_vault:
+                vaults = apply_price_update(r, pair_id, base_price, quote_price)
+                if vaults is None:
                     print(f"[Skip] No vault mapping found for pair: {pair_id}")
                     continue
-
-                # --- B. Update Price Maps ---
-                pipe_update = r.pipeline()
-                
-                if base_price is not None:
-                    pipe_update.hset(KEY_BASE_PRICE_MAP, base_vault, base_price)
-                
-                if quote_price is not None:
-                    pipe_update.hset(KEY_QUOTE_PRICE_MAP, quote_vault, quote_price)
-                
-                pipe_update.execute()
+                base_vault, quote_vault = vaults
 
                 # --- C. Logging ---
                 print(f"[{time.strftime('%H:%M:%S')}] Update for {pair_id[:8]}...")
@@ -0,0 +1,204 @@
+"""
+Latency-aware pool of Solana JSON-RPC endpoints.
+
+Every endpoint keeps a rolling window of response times and an error rate
+(HTTP 429 / 5xx / connection errors). Requests go to the endpoint with the
+best score, i.e. the lowest median latency after an error penalty; endpoints
+that fail several times in a row sit out a short cooldown.
+
+A request that fails (transport error or non-200 reply) is retried on the
+next-best endpoint, each endpoint at most once. With hedging on, a request
+that has not finished after the primary endpoint's p95 latency (counted from
+when it got its limiter slot) is sent again to the next-best endpoint, and
+whichever 200 reply arrives first wins (the other request is cancelled).
+
+With shared_limits on, every endpoint also gets an AIMD concurrency limiter
+(rate_limiter.py) shared by all worker processes on the host; requests wait
+for a free slot, and hedges are only sent when the second endpoint has one.
+
+URLs are plain strings, so local stand-in servers (http://127.0.0.1:PORT)
+work the same way as real providers.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+from rate_limiter import SharedAimdLimiter, is_congested
+
+LATENCY_WINDOW = 64            # Samples kept per endpoint
+ERROR_EWMA_ALPHA = 0.1         # Weight of the newest request in the error rate
+ERROR_PENALTY = 4.0            # score = p50 * (1 + ERROR_PENALTY * error_rate)
+COOLDOWN_AFTER_ERRORS = 3      # Consecutive errors before an endpoint is benched
+COOLDOWN_SECONDS = 5.0
+DEFAULT_LATENCY = 0.5          # Assumed latency (s) for endpoints without samples
+HEDGE_MIN_DELAY = 0.05         # Never hedge earlier than this (s)
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.error_rate = 0.0
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.limiter = None
+
+    def percentile(self, q):
+        if not self.latencies:
+            return DEFAULT_LATENCY
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def score(self):
+        return self.percentile(0.5) * (1.0 + ERROR_PENALTY * self.error_rate)
+
+    def healthy(self, now):
+        return now >= self.cooldown_until
+
+    def observe(self, elapsed, ok):
+        self.requests += 1
+        self.error_rate += ERROR_EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latencies.append(elapsed)
+            self.consecutive_errors = 0
+            return
+        self.errors += 1
+        self.consecutive_errors += 1
+        if self.consecutive_errors >= COOLDOWN_AFTER_ERRORS:
+            self.cooldown_until = time.monotonic() + COOLDOWN_SECONDS
+            self.consecutive_errors = 0
+
+
+class RpcPool:
+    def __init__(self, urls, hedge=False, shared_limits=False):
+        if not urls:
+            raise ValueError("RpcPool needs at least one endpoint URL")
+        self.endpoints = [Endpoint(url) for url in urls]
+        if shared_limits:
+            for endpoint in self.endpoints:
+                endpoint.limiter = SharedAimdLimiter(endpoint.url)
+        self.hedge = hedge
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def ranked(self):
+        """Endpoints best-first; benched endpoints go last."""
+        now = time.monotonic()
+        return sorted(self.endpoints, key=lambda e: (not e.healthy(now), e.score()))
+
+    async def _request(self, session, endpoint, payload, started):
+        """One POST to `endpoint`; the caller has already taken its limiter slot."""
+        started.append(True)
+        limiter = endpoint.limiter
+        start = time.monotonic()
+        try:
+            async with session.post(endpoint.url, json=payload) as resp:
+                text = await resp.text()
+                status = resp.status
+        except asyncio.CancelledError:
+            # A hedge loser: its latency is at least this long, so keep a
+            # sample to stop a slow endpoint from looking fast forever.
+            endpoint.latencies.append(time.monotonic() - start)
+            if limiter is not None:
+                limiter.release(None)
+            raise
+        except Exception:
+            endpoint.observe(time.monotonic() - start, False)
+            if limiter is not None:
+                limiter.release(True)
+            raise
+        elapsed = time.monotonic() - start
+        if limiter is not None:
+            # Judge the spike against the window before adding this sample.
+            limiter.release(is_congested(status, elapsed, endpoint))
+        endpoint.observe(elapsed, status == 200)
+        return status, text, elapsed, endpoint
+
+    def _start(self, session, endpoint, payload):
+        """
+        _request as a task, on the limiter slot the caller has taken. A task
+        cancelled before its first step never enters _request, so that slot
+        is given back here instead.
+        """
+        started = []
+        task = asyncio.create_task(self._request(session, endpoint, payload, started))
+        if endpoint.limiter is not None:
+            task.add_done_callback(lambda _: started or endpoint.limiter.release(None))
+        return task
+
+    async def _attempt(self, session, primary, backup, payload):
+        """
+        One request to `primary`, hedged to `backup` (None = no hedge) once
+        it has run for the primary's p95. Returns (result, error, hedged):
+        the 200 reply if there was one, else the last reply / transport error.
+        """
+        if primary.limiter is not None:
+            await primary.limiter.acquire()
+        # The hedge clock starts here: time queued in the limiter is not the endpoint's latency
+        first = self._start(session, primary, payload)
+        pending = {first}
+        hedged = False
+        result, error = None, None
+        try:
+            if backup is not None:
+                done, _ = await asyncio.wait(pending, timeout=max(HEDGE_MIN_DELAY, primary.percentile(0.95)))
+                # A backup at its limit is not hedged to; that would only add load
+                if not done and (backup.limiter is None or backup.limiter.try_acquire()):
+                    self.hedges_sent += 1
+                    hedged = True
+                    pending.add(self._start(session, backup, payload))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    result = task.result()
+                    if result[0] == 200:
+                        if task is not first:
+                            self.hedges_won += 1
+                        return result, None, hedged
+        finally:
+            for task in pending:
+                task.cancel()
+        return result, error, hedged
+
+    async def post(self, session, payload, hedge=None):
+        """
+        POSTs `payload` as JSON and returns (status, text, elapsed_s, endpoint).
+        Endpoints are tried best-first: a transport error or non-200 reply
+        fails over to the next one (an endpoint already used as a hedge is
+        not tried again). When none answers 200, returns the last reply, or
+        raises the last transport error if there was no reply at all.
+        """
+        hedge = self.hedge if hedge is None else hedge
+        remaining = self.ranked()
+        result, error = None, None
+        while remaining:
+            primary = remaining.pop(0)
+            backup = remaining[0] if hedge and remaining else None
+            attempt_result, attempt_error, hedged = await self._attempt(session, primary, backup, payload)
+            if attempt_result is not None and attempt_result[0] == 200:
+                return attempt_result
+            if hedged:
+                remaining.pop(0)
+            result = attempt_result or result
+            error = attempt_error or error
+        if result is not None:
+            return result
+        raise error
+
+    def describe(self):
+        now = time.monotonic()
+        parts = []
+        for e in self.endpoints:
+            state = "" if e.healthy(now) else " BENCHED"
+            if e.limiter is not None:
+                state += f" limit={e.limiter.limit():.1f} inflight={e.limiter.inflight()}"
+            parts.append(f"{e.url} p50={e.percentile(0.5) * 1000:.0f}ms p95={e.percentile(0.95) * 1000:.0f}ms "
+                         f"err={e.error_rate:.2f} ({e.errors}/{e.requests}){state}")
+        hedges = f" | hedges {self.hedges_won}/{self.hedges_sent} won" if self.hedge else ""
+        return "; ".join(parts) + hedges
@@ -0,0 +1,306 @@
+"""
+Local JSON-RPC stand-in that replays a block recording (block_recorder.py).
+
+Point the pipeline at it and benchmark offline:
+
+    python3 rpc_standin.py <dir> --speed 4 --latency-ms 40 --rate-429 0.02 --missing 0.01
+    RPC_URLS=http://127.0.0.1:8899 POOL_SERVER=http://127.0.0.1:8899 python3 combined_subscriber.py 1
+    # then publish the first recorded slot on `start-work` (printed at startup)
+
+Timeline: the first recorded slot is "produced" when the stand-in starts and
+every following slot SLOT_TIME / speed later, so getSlot returns a moving tip
+and getBlock answers "not available" (-32004) for slots past it, like a real
+node. `--speed max` makes the whole recording available at once.
+
+Served blocks get their blockTime moved to the moment they were produced, so
+the detector's MAX_POOL_AGE filter treats old recordings as fresh.
+
+Fault injection (deterministic per slot where it matters, so runs repeat):
+  --latency-ms / --jitter-ms   added to every reply
+  --rate-429                   fraction of requests answered with HTTP 429
+  --missing                    fraction of recorded slots answered as skipped (-32009)
+
+The stand-in also accepts the pool server's /pool_update(_batch) calls. A
+pool is matched to the first served block that contains its address, which
+gives detection latency (block served -> pool update received). The
+addresses in a block are indexed once, when it is first served (sorted
+64-bit hashes, kept for the last DETECTION_WINDOW served slots), so a report
+is a lookup per slot instead of a search through every block's text. The report
+(printed every REPORT_INTERVAL, on exit, and at GET /report) has blocks/sec,
+fetch delay (produced -> served), detection latency and drop counts.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from block_recorder import recorded_slots, load_recording
+
+SLOT_TIME = 0.4                # Seconds per slot at --speed 1
+CACHE_BLOCKS = 64              # Decompressed blocks kept in memory
+DETECTION_WINDOW = 600         # Most recently served slots whose addresses are kept for reported pools
+REPORT_INTERVAL = 10.0
+
+NOT_READY = {"code": -32004, "message": "Block not available for slot"}
+SKIPPED = {"code": -32009, "message": "Slot was skipped, or missing in long-term storage"}
+
+_BLOCK_TIME = re.compile(r'"blockTime"\s*:\s*(-?\d+|null)')
+_BLOCK_TIME_WINDOW = 4096
+_B58 = "1-9A-HJ-NP-Za-km-z"
+_ADDRESS = re.compile(f"(?<![{_B58}])[{_B58}]{{32,44}}(?![{_B58}])")
+
+
+def _percentiles(values):
+    if not values:
+        return "n/a"
+    ordered = sorted(values)
+    p50 = ordered[len(ordered) // 2] * 1000
+    p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000
+    return f"p50={p50:.0f}ms p95={p95:.0f}ms max={ordered[-1] * 1000:.0f}ms"
+
+
+def _address_index(text):
+    """Sorted hashes of every base58 address in a block's text."""
+    return array("q", sorted({hash(address) for address in _ADDRESS.findall(text)}))
+
+
+def _indexed(index, address):
+    h = hash(address)
+    i = bisect_left(index, h)
+    return i < len(index) and index[i] == h
+
+
+class Replay:
+    def __init__(self, directory, speed, latency, jitter, rate_429, missing):
+        self.directory = directory
+        self.slots = recorded_slots(directory)
+        if not self.slots:
+            raise ValueError(f"No recorded slots in {directory}")
+        self.recorded = set(self.slots)
+        self.first, self.last = self.slots[0], self.slots[-1]
+        self.speed = speed             # None = max speed
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.missing = missing
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()     # slot -> result text
+        self.start = time.time()
+
+        # --- Stats ---
+        self.served = OrderedDict()    # slot -> wall time first served (block replies only)
+        self.addresses = OrderedDict() # slot -> _address_index, last DETECTION_WINDOW served slots
+        self.requests = 0
+        self.duplicates = 0
+        self.throttled = 0
+        self.injected_missing = set()
+        self.not_ready = 0
+        self.pools = []                # (pool_address, slot or None, latency or None)
+
+    # --- Timeline ---
+
+    def produced_at(self, slot):
+        if self.speed is None:
+            return self.start
+        return self.start + (slot - self.first) * SLOT_TIME / self.speed
+
+    def tip(self):
+        if self.speed is None:
+            return self.last
+        elapsed = time.time() - self.start
+        return min(self.last, self.first + int(elapsed * self.speed / SLOT_TIME))
+
+    def is_missing(self, slot):
+        # Same slots on every run: hash, not random()
+        return (zlib.crc32(str(slot).encode()) % 10000) < self.missing * 10000
+
+    # --- Blocks ---
+
+    def block_text(self, slot):
+        with self.lock:
+            text = self.cache.get(slot)
+            if text is not None:
+                self.cache.move_to_end(slot)
+                return text
+        text = load_recording(self.directory, slot)
+        if not text.startswith('{"error":'):
+            head = _BLOCK_TIME.sub(f'"blockTime":{int(self.produced_at(slot))}', text[:_BLOCK_TIME_WINDOW], count=1)
+            text = head + text[_BLOCK_TIME_WINDOW:]
+        with self.lock:
+            self.cache[slot] = text
+            while len(self.cache) > CACHE_BLOCKS:
+                self.cache.popitem(last=False)
+        return text
+
+    def get_block(self, slot):
+        """Returns ("result" | "error", raw JSON text of the value)."""
+        if slot > self.tip():
+            with self.lock:
+                self.not_ready += 1
+            return "error", json.dumps(NOT_READY)
+        if slot not in self.recorded or self.is_missing(slot):
+            if slot in self.recorded:
+                with self.lock:
+                    self.injected_missing.add(slot)
+            return "error", json.dumps(SKIPPED)
+        text = self.block_text(slot)
+        if text.startswith('{"error":'):
+            return "error", json.dumps(json.loads(text)["error"])
+        with self.lock:
+            if slot in self.served:
+                self.duplicates += 1
+                return "result", text
+            self.served[slot] = time.time()
+        index = _address_index(text)
+        with self.lock:
+            self.addresses[slot] = index
+            while len(self.addresses) > DETECTION_WINDOW:
+                self.addresses.popitem(last=False)
+        return "result", text
+
+    def answer(self, request):
+        method = request.get("method")
+        if method == "getSlot":
+            kind, value = "result", str(self.tip())
+        elif method == "getBlock":
+            kind, value = self.get_block(int(request["params"][0]))
+        else:
+            kind, value = "error", json.dumps({"code": -32601, "message": f"Method not found: {method}"})
+        return f'{{"jsonrpc":"2.0","{kind}":{value},"id":{json.dumps(request.get("id"))}}}'
+
+    def throttle(self):
+        """True if this request should get an HTTP 429."""
+        if self.rate_429 and random.random() < self.rate_429:
+            with self.lock:
+                self.throttled += 1
+            return True
+        return False
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    # --- Detection Latency ---
+
+    def pool_reported(self, pool_address):
+        now = time.time()
+        with self.lock:
+            recent = sorted(self.addresses.items())
+            # The creation block is the first block that mentions the new account
+            for slot, index in recent:
+                if _indexed(index, pool_address):
+                    self.pools.append((pool_address, slot, now - self.served[slot]))
+                    return
+            self.pools.append((pool_address, None, None))
+
+    # --- Report ---
+
+    def recorded_skip(self, slot):
+        # Slots that were already skipped when recorded are not drops
+        return self.block_text(slot).startswith('{"error":')
+
+    def report(self):
+        with self.lock:
+            served = dict(self.served)
+            pools = list(self.pools)
+            tip = self.tip()
+            expected = [s for s in self.slots if s <= tip and not self.is_missing(s)]
+        blocks = len(served)
+        span = (max(served.values()) - min(served.values())) if blocks > 1 else 0.0
+        rate = blocks / span if span > 0 else 0.0
+        fetch_delays = [t - self.produced_at(s) for s, t in served.items()]
+        never = [s for s in expected if s not in served and not self.recorded_skip(s)]
+        latencies = [lat for _, _, lat in pools if lat is not None]
+        return "\n".join([
+            f"[Stand-in] tip {tip} ({tip - self.first + 1}/{len(self.slots)} recorded slots produced), {self.requests} requests",
+            f"[Stand-in] blocks served {blocks} at {rate:.1f} blocks/s | fetch delay {_percentiles(fetch_delays)}",
+            f"[Stand-in] detection: {len(latencies)} pool(s) matched, {len(pools) - len(latencies)} unmatched | latency {_percentiles(latencies)}",
+            f"[Stand-in] drops: {len(never)} produced slot(s) never served | duplicates {self.duplicates} | "
+            f"injected: {self.throttled} x 429, {len(self.injected_missing)} missing slots | not-ready replies {self.not_ready}",
+        ])
+
+
+def make_handler(replay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, body, content_type="application/json"):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/report":
+                self._send(200, replay.report() + "\n", "text/plain")
+            else:
+                self._send(404, "{}")
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+            if self.path.startswith("/pool_update"):
+                pools = body.get("pools", []) if self.path.endswith("_batch") else [body]
+                for pool in pools:
+                    replay.pool_reported(pool.get("pool_address") or "")
+                self._send(200, "{}")
+                return
+
+            with replay.lock:
+                replay.requests += 1
+            replay.delay()
+            if replay.throttle():
+                self._send(429, '{"jsonrpc":"2.0","error":{"code":429,"message":"Too many requests"},"id":null}')
+                return
+            if isinstance(body, list):
+                self._send(200, "[" + ",".join(replay.answer(r) for r in body) + "]")
+            else:
+                self._send(200, replay.answer(body))
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded getBlock replies as a local JSON-RPC node")
+    parser.add_argument("directory")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--speed", default="1", help="replay speed factor (1 = real time) or 'max'")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--missing", type=float, default=0.0)
+    args = parser.parse_args()
+
+    replay = Replay(args.directory, None if args.speed == "max" else float(args.speed),
+                    args.latency_ms / 1000, args.jitter_ms / 1000, args.rate_429, args.missing)
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), make_handler(replay))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print(f"[Stand-in] Serving slots {replay.first}..{replay.last} ({len(replay.slots)} recorded) on :{args.port}, speed {args.speed}")
+    print(f"[Stand-in] Start the workers with: PUBLISH start-work {replay.first}")
+    try:
+        while True:
+            time.sleep(REPORT_INTERVAL)
+            print(replay.report())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(replay.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+"""
+Multi-slot shared-memory ring for handing raw getBlock JSON from the
+subscriber (producer) to the C++ receiver and the pool detector (consumers).
+Both consumers read the same bytes in place; a block is written once.
+
+Layout of the segment (all integers little-endian, offsets in bytes):
+
+    CONTROL BLOCK (256 bytes)
+      0   u32  magic            0x474E5253 ("SRNG")
+      4   u32  version          1
+      8   u64  capacity         size of the data area (multiple of 64)
+      16  u32  record_header    size of a record header (64)
+      20  u32  alignment        record alignment (64)
+      24  u32  consumers        bit mask of attached consumers (bit 0 = receiver, bit 1 = detector)
+      64  u64  head             producer cursor (own cache line)
+      72  u64  next_seq         next record sequence number
+      128 u64  tail             receiver cursor (own cache line)
+      136 u64  receiver_pid     process holding tail
+      144 u64  receiver_skip    cursor the producer asks the receiver to skip to (0 = none)
+      192 u64  detector_tail    pool detector cursor (own cache line)
+      200 u64  detector_pid     process holding detector_tail
+
+    DATA AREA (capacity bytes, starts at offset 256)
+      A sequence of records, each starting on a 64-byte boundary:
+
+      0   u32  record_len       total bytes: header + payload + padding
+      4   u32  kind             1 = DATA, 2 = PAD (skip to end of ring)
+      8   u64  seq
+      16  u64  slot
+      24  i64  block_time       -1 when the block carried no blockTime
+      32  u64  payload_len
+      40  ...  reserved (zero)
+      64  payload bytes, followed by >= 64 zero bytes (AVX over-read slack)
+
+Cursors are monotonically increasing byte counts; the position of a cursor
+in the data area is `cursor % capacity`. The ring is empty when
+head == tail and holds `head - tail` bytes otherwise.
+
+A record is always contiguous. When it does not fit before the end of the
+data area the producer writes a PAD record covering the remainder and wraps
+to offset 0, so a block may use any amount of free space up to `capacity`.
+
+Protocol (one producer process, up to two consumers):
+  - The producer writes the record, then publishes it by storing `head`.
+  - The receiver loads `head`, reads records from `tail` up to it, and
+    frees them by storing `tail` once it is done with the payload.
+  - C++ readers must use acquire loads on `head` and release stores on
+    `tail` (see RECEIVER/shm_ring.h).
+  - The pool detector does not scan the ring: the producer sends it a small
+    descriptor (offset, length, slot, written time) per record over its doorbell FIFO
+    (doorbell.py), where `offset` is the record's cursor. The detector
+    reads the payload in place and frees it by storing `detector_tail`.
+  - Waiting is event driven: the producer rings the receiver's doorbell
+    after each publish, and consumers ring the producer's after a release.
+  - Each consumer attaches by storing its pid and setting its bit in
+    `consumers`; space is only reused once the cursors of all attached
+    consumers have moved past it, i.e. each record stays alive until every
+    attached consumer has released it. A consumer that is not attached
+    holds no space, so detection keeps running without a receiver and the
+    receiver without a detector.
+  - A consumer whose process died is detached by the producer the next
+    time the ring is full. A receiver that is alive but holds the ring full
+    for longer than the producer is willing to wait is asked to skip
+    (request_receiver_skip stores the current head in `receiver_skip`): it
+    finishes and releases the record it is reading, then jumps its cursor
+    to that head, dropping the blocks in between. The producer never
+    reuses the space of the record the receiver is reading.
+"""
+
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+RING_MAGIC = 0x474E5253
+RING_VERSION = 1
+
+CONTROL_SIZE = 256
+HEAD_OFFSET = 64
+SEQ_OFFSET = 72
+TAIL_OFFSET = 128
+RECEIVER_PID_OFFSET = 136
+RECEIVER_SKIP_OFFSET = 144
+DETECTOR_TAIL_OFFSET = 192
+DETECTOR_PID_OFFSET = 200
+CONSUMERS_OFFSET = 24
+RECEIVER_BIT = 0x1
+DETECTOR_BIT = 0x2
+DATA_START = CONTROL_SIZE
+
+RECORD_HEADER_SIZE = 64
+RECORD_ALIGN = 64
+RECORD_TAIL_PAD = 64
+
+KIND_DATA = 1
+KIND_PAD = 2
+
+NO_BLOCK_TIME = -1
+
+RING_FULL_TIMEOUT = 1.0        # Seconds to wait for freed ring space before checking on the consumers
+RECEIVER_STALL_TIMEOUT = 10.0  # Seconds a live receiver may hold the ring full before it is asked to skip ahead
+
+_CONTROL = struct.Struct("<IIQII")
+_RECORD = struct.Struct("<IIQQqQ")
+_U64 = struct.Struct("<Q")
+_U32 = struct.Struct("<I")
+
+RingRecord = namedtuple("RingRecord", ["seq", "slot", "block_time", "payload", "next_tail"])
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _align(n):
+    return (n + RECORD_ALIGN - 1) & ~(RECORD_ALIGN - 1)
+
+
+def record_size(payload_len):
+    """Bytes a payload of `payload_len` occupies in the data area."""
+    return _align(RECORD_HEADER_SIZE + payload_len + RECORD_TAIL_PAD)
+
+
+def open_ring_segment(name, size):
+    """
+    Create the named segment (or attach to an existing one) and make sure it
+    carries a valid ring header. Returns the SharedMemory object.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        shm = shared_memory.SharedMemory(name=name, create=False)
+
+    magic, version, capacity, _, _ = _CONTROL.unpack_from(shm.buf, 0)
+    expected_capacity = (shm.size - DATA_START) & ~(RECORD_ALIGN - 1)
+    if magic != RING_MAGIC or version != RING_VERSION or capacity != expected_capacity:
+        init_ring(shm.buf, shm.size)
+    return shm
+
+
+def init_ring(buf, size):
+    """Write a fresh (empty) ring header into `buf`."""
+    capacity = (size - DATA_START) & ~(RECORD_ALIGN - 1)
+    if capacity < RECORD_HEADER_SIZE + RECORD_TAIL_PAD:
+        raise ValueError(f"SHM size {size} too small for a ring")
+
+    buf[0:CONTROL_SIZE] = bytes(CONTROL_SIZE)
+    _U64.pack_into(buf, HEAD_OFFSET, 0)
+    _U64.pack_into(buf, SEQ_OFFSET, 0)
+    _U64.pack_into(buf, TAIL_OFFSET, 0)
+    # Magic goes in last so a half-initialised header is never accepted.
+    _CONTROL.pack_into(buf, 0, 0, RING_VERSION, capacity, RECORD_HEADER_SIZE, RECORD_ALIGN)
+    struct.pack_into("<I", buf, 0, RING_MAGIC)
+
+
+class ShmRingWriter:
+    """Producer side of the ring. Not safe for concurrent use across processes."""
+
+    def __init__(self, buf, on_publish=None):
+        self.buf = buf
+        magic, _, self.capacity, _, _ = _CONTROL.unpack_from(buf, 0)
+        if magic != RING_MAGIC:
+            raise ValueError("SHM segment does not hold a ring header")
+        self.on_publish = on_publish   # Called after each record is published (e.g. a doorbell)
+        self.last_offset = None
+        # Consumers left attached by an earlier run must not hold space forever.
+        self.reap_receiver()
+        self.reap_detector()
+
+    def _tail(self):
+        """Oldest cursor any attached consumer still needs (head when none is attached)."""
+        mask = _U32.unpack_from(self.buf, CONSUMERS_OFFSET)[0]
+        tail = _U64.unpack_from(self.buf, HEAD_OFFSET)[0]
+        if mask & RECEIVER_BIT:
+            tail = min(tail, _U64.unpack_from(self.buf, TAIL_OFFSET)[0])
+        if mask & DETECTOR_BIT:
+            tail = min(tail, _U64.unpack_from(self.buf, DETECTOR_TAIL_OFFSET)[0])
+        return tail
+
+    def _attached(self, bit):
+        return bool(_U32.unpack_from(self.buf, CONSUMERS_OFFSET)[0] & bit)
+
+    def _detach(self, bit):
+        mask = _U32.unpack_from(self.buf, CONSUMERS_OFFSET)[0]
+        _U32.pack_into(self.buf, CONSUMERS_OFFSET, mask & ~bit)
+
+    def _reap(self, bit, pid_offset):
+        if not self._attached(bit):
+            return False
+        pid = _U64.unpack_from(self.buf, pid_offset)[0]
+        if pid and _alive(pid):
+            return False
+        self._detach(bit)
+        return True
+
+    def receiver_attached(self):
+        return self._attached(RECEIVER_BIT)
+
+    def detector_attached(self):
+        return self._attached(DETECTOR_BIT)
+
+    def reap_receiver(self):
+        """Detaches the receiver if its process is gone. Returns True if it did."""
+        return self._reap(RECEIVER_BIT, RECEIVER_PID_OFFSET)
+
+    def reap_detector(self):
+        """Detaches the detector if its process is gone. Returns True if it did."""
+        return self._reap(DETECTOR_BIT, DETECTOR_PID_OFFSET)
+
+    def receiver_lagging(self):
+        """True if the receiver's cursor is the one holding the oldest space."""
+        if not self.receiver_attached():
+            return False
+        tail = _U64.unpack_from(self.buf, TAIL_OFFSET)[0]
+        return not self.detector_attached() or tail <= _U64.unpack_from(self.buf, DETECTOR_TAIL_OFFSET)[0]
+
+    def request_receiver_skip(self):
+        """
+        Asks a live but stalled receiver to jump to the current head once it
+        has released the record it is reading (that record stays intact).
+        """
+        _U64.pack_into(self.buf, RECEIVER_SKIP_OFFSET, _U64.unpack_from(self.buf, HEAD_OFFSET)[0])
+
+    def max_payload(self):
+        return self.capacity - RECORD_HEADER_SIZE - RECORD_TAIL_PAD
+
+    def fits(self, payload_len):
+        """True if a payload of this size can ever be stored in the ring."""
+        return record_size(payload_len) <= self.capacity
+
+    def used_bytes(self):
+        head = _U64.unpack_from(self.buf, HEAD_OFFSET)[0]
+        return head - self._tail()
+
+    def try_write(self, payload, slot, block_time=None):
+        """
+        Append one record. Returns its sequence number, or None if the ring
+        does not currently have room (a consumer has not caught up yet).
+        Raises ValueError if the payload can never fit. The record's cursor
+        (the descriptor offset) is left in `last_offset`.
+        """
+        buf = self.buf
+        cap = self.capacity
+        payload_len = len(payload)
+        rec_len = record_size(payload_len)
+        if rec_len > cap:
+            raise ValueError(f"payload {payload_len} bytes > ring capacity {cap}")
+
+        head = _U64.unpack_from(buf, HEAD_OFFSET)[0]
+        free = cap - (head - self._tail())
+
+        pos = head % cap
+        contiguous = cap - pos
+        need = rec_len if rec_len <= contiguous else rec_len + contiguous
+        if need > free:
+            return None
+
+        seq = _U64.unpack_from(buf, SEQ_OFFSET)[0]
+
+        if rec_len > contiguous:
+            _RECORD.pack_into(buf, DATA_START + pos, contiguous, KIND_PAD, seq, 0, NO_BLOCK_TIME, 0)
+            head += contiguous
+            pos = 0
+
+        base = DATA_START + pos
+        if block_time is None:
+            block_time = NO_BLOCK_TIME
+        _RECORD.pack_into(buf, base, rec_len, KIND_DATA, seq, slot, block_time, payload_len)
+        start = base + RECORD_HEADER_SIZE
+        end = start + payload_len
+        buf[start:end] = payload
+        buf[end:base + rec_len] = bytes(base + rec_len - end)
+
+        # Publish: sequence first, head last.
+        _U64.pack_into(buf, SEQ_OFFSET, seq + 1)
+        _U64.pack_into(buf, HEAD_OFFSET, head + rec_len)
+        self.last_offset = head
+        if self.on_publish is not None:
+            self.on_publish()
+        return seq
+
+
+async def write_block(ring, space, payload, slot, block_time=None, log_prefix="[Ring]"):
+    """
+    Appends one block to the ring for the subscribers, waiting while the
+    whole ring is full; consumers ring the producer's `space` doorbell when
+    they free space. Dead consumers are detached, and a receiver that keeps
+    the ring full for RECEIVER_STALL_TIMEOUT is asked to skip to the newest
+    block once it is done with its current one: the producer (and pool
+    detection) must not wait on the receiver's backlog.
+    Returns the record's seq, or None if the payload can never fit.
+    """
+    if not ring.fits(len(payload)):
+        print(f"{log_prefix} Error: JSON size {len(payload)} > SHM ring capacity {ring.capacity}")
+        return None
+
+    seq = ring.try_write(payload, slot, block_time)
+    if seq is not None:
+        return seq
+
+    # Releases that happened while nobody was waiting are stale
+    space.drain(record=False)
+    full_since = time.monotonic()
+    skip_requested = False
+    while True:
+        seq = ring.try_write(payload, slot, block_time)
+        if seq is not None:
+            return seq
+        if await space.wait(RING_FULL_TIMEOUT):
+            continue
+        if ring.reap_detector():
+            print(f"{log_prefix} Detector process is gone; no longer holding ring space for it")
+            continue
+        if ring.reap_receiver():
+            print(f"{log_prefix} Receiver process is gone; no longer holding ring space for it")
+            continue
+        if not skip_requested and time.monotonic() - full_since >= RECEIVER_STALL_TIMEOUT and ring.receiver_lagging():
+            ring.request_receiver_skip()
+            skip_requested = True
+            print(f"{log_prefix} Receiver stalled for {RECEIVER_STALL_TIMEOUT:.0f}s; "
+                  f"asked it to skip to the newest block after its current one")
+            continue
+        print(f"{log_prefix} SHM ring full ({ring.used_bytes()} bytes pending), waiting...")
+
+
+class ShmRingReader:
+    """
+    Receiver side of the ring (the Python twin of RECEIVER/shm_ring.h).
+    `poll()` hands out records without copying (the payload is a memoryview
+    into the segment); `release()` frees them. Records must be released in
+    the order they were polled.
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        magic, _, self.capacity, _, _ = _CONTROL.unpack_from(buf, 0)
+        if magic != RING_MAGIC:
+            raise ValueError("SHM segment does not hold a ring header")
+        self.attach()
+
+    def attach(self):
+        """
+        Registers this process as the receiver. Resumes at `tail` if a
+        receiver is still attached (a restart the producer has not reaped),
+        otherwise starts at the current head. Returns the cursor.
+        """
+        if _U32.unpack_from(self.buf, CONSUMERS_OFFSET)[0] & RECEIVER_BIT:
+            self._cursor = _U64.unpack_from(self.buf, TAIL_OFFSET)[0]
+        else:
+            self._cursor = _U64.unpack_from(self.buf, HEAD_OFFSET)[0]
+            _U64.pack_into(self.buf, TAIL_OFFSET, self._cursor)
+        _U64.pack_into(self.buf, RECEIVER_PID_OFFSET, os.getpid())
+        # Mask last, so the producer never honours a cursor that is not set yet.
+        mask = _U32.unpack_from(self.buf, CONSUMERS_OFFSET)[0]
+        _U32.pack_into(self.buf, CONSUMERS_OFFSET, mask | RECEIVER_BIT)
+        return self._cursor
+
+    def attached(self):
+        """False once the producer detached us (took us for dead); call attach() to continue at head."""
+        return bool(_U32.unpack_from(self.buf, CONSUMERS_OFFSET)[0] & RECEIVER_BIT)
+
+    def detach(self):
+        mask = _U32.unpack_from(self.buf, CONSUMERS_OFFSET)[0]
+        _U32.pack_into(self.buf, CONSUMERS_OFFSET, mask & ~RECEIVER_BIT)
+
+    def pending_bytes(self):
+        return _U64.unpack_from(self.buf, HEAD_OFFSET)[0] - self._cursor
+
+    def poll(self):
+        """Return the next unread RingRecord, or None if the ring is empty."""
+        buf = self.buf
+        head = _U64.unpack_from(buf, HEAD_OFFSET)[0]
+        cursor = self._cursor
+
+        while cursor != head:
+            base = DATA_START + cursor % self.capacity
+            rec_len, kind, seq, slot, block_time, payload_len = _RECORD.unpack_from(buf, base)
+            cursor += rec_len
+            if kind == KIND_PAD:
+                continue
+
+            self._cursor = cursor
+            start = base + RECORD_HEADER_SIZE
+            payload = buf[start:start + payload_len]
+            if block_time == NO_BLOCK_TIME:
+                block_time = None
+            return RingRecord(seq, slot, block_time, payload, cursor)
+
+        self._cursor = cursor
+        return None
+
+    def release(self, record):
+        """
+        Give the space used by `record` (and anything before it) back to the
+        producer. Returns the bytes skipped if the producer asked us to skip
+        ahead (request_receiver_skip), else 0.
+        """
+        record.payload.release()
+        _U64.pack_into(self.buf, TAIL_OFFSET, record.next_tail)
+        skip = _U64.unpack_from(self.buf, RECEIVER_SKIP_OFFSET)[0]
+        if not skip:
+            return 0
+        _U64.pack_into(self.buf, RECEIVER_SKIP_OFFSET, 0)
+        if skip <= self._cursor:
+            return 0
+        skipped = skip - self._cursor
+        self._cursor = skip
+        _U64.pack_into(self.buf, TAIL_OFFSET, skip)
+        return skipped
+
+
+class ShmRingDetectorView:
+    """
+    Pool detector side of the ring. Records are located through descriptors
+    instead of being polled; `buf` may be any buffer over the segment
+    (an mmap gives `find` / `rfind` over the payload without copying).
+    Records must be released in the order the descriptors arrive.
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        magic, _, self.capacity, _, _ = _CONTROL.unpack_from(buf, 0)
+        if magic != RING_MAGIC:
+            raise ValueError("SHM segment does not hold a ring header")
+
+    def attach(self):
+        """Registers this process as the detector, starting at the current head."""
+        head = _U64.unpack_from(self.buf, HEAD_OFFSET)[0]
+        _U64.pack_into(self.buf, DETECTOR_TAIL_OFFSET, head)
+        _U64.pack_into(self.buf, DETECTOR_PID_OFFSET, os.getpid())
+        # Mask last, so the producer never honours a cursor that is not set yet.
+        mask = _U32.unpack_from(self.buf, CONSUMERS_OFFSET)[0]
+        _U32.pack_into(self.buf, CONSUMERS_OFFSET, mask | DETECTOR_BIT)
+        self.start = head
+        return head
+
+    def detach(self):
+        mask = _U32.unpack_from(self.buf, CONSUMERS_OFFSET)[0]
+        _U32.pack_into(self.buf, CONSUMERS_OFFSET, mask & ~DETECTOR_BIT)
+
+    def locate(self, offset):
+        """
+        Returns (start, end, block_time, next_tail) for the record at cursor
+        `offset`: the payload is buf[start:end].
+        """
+        base = DATA_START + offset % self.capacity
+        rec_len, kind, _, _, block_time, payload_len = _RECORD.unpack_from(self.buf, base)
+        if kind != KIND_DATA:
+            raise ValueError(f"No data record at ring offset {offset}")
+        start = base + RECORD_HEADER_SIZE
+        if block_time == NO_BLOCK_TIME:
+            block_time = None
+        return start, start + payload_len, block_time, offset + rec_len
+
+    def release(self, next_tail):
+        _U64.pack_into(self.buf, DETECTOR_TAIL_OFFSET, next_tail)
+
+
+def open_ring_mmap(name):
+    """
+    Maps an existing segment created by open_ring_segment() as an mmap
+    object (POSIX shared memory lives under /dev/shm on Linux).
+    """
+    fd = os.open(os.path.join("/dev/shm", name.lstrip("/")), os.O_RDWR)
+    try:
+        return mmap.mmap(fd, os.fstat(fd).st_size)
+    finally:
+        os.close(fd)
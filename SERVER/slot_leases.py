@@ -0,0 +1,252 @@
+"""
+Slot-range leases shared by every subscriber worker, stored in Redis.
+
+Instead of a fixed `starting_slot + WORKER_ID` / NUM_WORKERS stride, the slot
+space is cut into ranges of LEASE_SLOTS consecutive slots (range r covers
+[r * LEASE_SLOTS, (r + 1) * LEASE_SLOTS)) and workers lease ranges as they
+need them:
+
+  - a worker keeps LEASE_AHEAD unfinished ranges in hand and claims the next
+    one when it runs low, so faster workers (or more of them) simply take
+    more ranges,
+  - leases expire after LEASE_TTL unless the holder heartbeats; the heartbeat
+    also records how far into each range the holder got,
+  - claims prefer expired leases, resuming at the recorded position, so the
+    ranges of a dead worker are picked up by the live ones,
+  - ranges that ended more than MAX_LAG_SLOTS / 2 behind the tip are not
+    claimed any more; the slot ledger backfills whatever they are missing,
+  - workers that start while leases are live join without a start signal.
+
+Keys (all prefixed with LEASE_PREFIX):
+  :next        next range index never handed out
+  :expiry      sorted set range -> lease expiry (Redis time, ms)
+  :holder      hash range -> worker_id
+  :progress    hash range -> first slot of the range not yet requested
+
+Every claim / heartbeat / release is one Lua script, so two workers can never
+hold the same range, and expiry uses the Redis clock rather than each host's.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+from slot_scheduler import MAX_LAG_SLOTS
+
+LEASE_PREFIX = "SLOT_LEASES"
+LEASE_SLOTS = 16                   # Slots per range (~6 s of chain time)
+LEASE_AHEAD = 2                    # Unfinished ranges a worker keeps in hand
+LEASE_TTL = 10.0                   # Seconds a lease lives without a heartbeat
+LEASE_HEARTBEAT_INTERVAL = 2.0
+LEASE_POLL_INTERVAL = 0.5          # Seconds between claim checks when nothing asks sooner
+
+# KEYS: next, expiry, holder, progress | ARGV: worker_id, ttl_ms, floor_range
+_CLAIM = """
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local ttl = tonumber(ARGV[2])
+local floor = tonumber(ARGV[3])
+while true do
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now, 'LIMIT', 0, 1)
+    if #expired == 0 then break end
+    local r = expired[1]
+    if tonumber(r) >= floor then
+        redis.call('ZADD', KEYS[2], now + ttl, r)
+        redis.call('HSET', KEYS[3], r, ARGV[1])
+        return {tonumber(r), tonumber(redis.call('HGET', KEYS[4], r) or -1), 1}
+    end
+    redis.call('ZREM', KEYS[2], r)
+    redis.call('HDEL', KEYS[3], r)
+    redis.call('HDEL', KEYS[4], r)
+end
+local r = redis.call('INCR', KEYS[1]) - 1
+if r < floor then
+    r = floor
+    redis.call('SET', KEYS[1], floor + 1)
+end
+redis.call('ZADD', KEYS[2], now + ttl, r)
+redis.call('HSET', KEYS[3], r, ARGV[1])
+return {r, -1, 0}
+"""
+
+# KEYS: expiry, holder, progress | ARGV: worker_id, ttl_ms, range, progress, range, progress, ...
+_HEARTBEAT = """
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local lost = {}
+for i = 3, #ARGV, 2 do
+    local r = ARGV[i]
+    if redis.call('HGET', KEYS[2], r) == ARGV[1] then
+        redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), r)
+        redis.call('HSET', KEYS[3], r, ARGV[i + 1])
+    else
+        table.insert(lost, tonumber(r))
+    end
+end
+return lost
+"""
+
+# KEYS: expiry, holder, progress | ARGV: worker_id, range, range, ...
+_RELEASE = """
+for i = 2, #ARGV do
+    local r = ARGV[i]
+    if redis.call('HGET', KEYS[2], r) == ARGV[1] then
+        redis.call('ZREM', KEYS[1], r)
+        redis.call('HDEL', KEYS[2], r)
+        redis.call('HDEL', KEYS[3], r)
+    end
+end
+return 1
+"""
+
+# KEYS: next | ARGV: range
+_START_AT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or -1)
+if current < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+# KEYS: next, expiry | live leases by the Redis clock (0 when no run was ever started)
+_RUN_ACTIVE = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+return redis.call('ZCOUNT', KEYS[2], now, '+inf')
+"""
+
+NEXT_KEY = f"{LEASE_PREFIX}:next"
+EXPIRY_KEY = f"{LEASE_PREFIX}:expiry"
+HOLDER_KEY = f"{LEASE_PREFIX}:holder"
+PROGRESS_KEY = f"{LEASE_PREFIX}:progress"
+
+
+def lease_run_active(redis_client):
+    """
+    True while other workers hold live leases, i.e. a worker starting now
+    can join the run without waiting for a start signal. Works with the
+    blocking client (the start-signal path is synchronous). Expiries are
+    compared on the Redis clock, like the claim script sets them.
+    """
+    return int(redis_client.eval(_RUN_ACTIVE, 2, NEXT_KEY, EXPIRY_KEY)) > 0
+
+
+class SlotLeases:
+    def __init__(self, redis_client, worker_id):
+        self.redis = redis_client
+        self.worker_id = worker_id
+        self.owned = deque()        # [range, next_slot, end] in slot order
+        self._finished = []         # Ranges fully requested, release pending
+        self._need = asyncio.Event()
+
+        self._claim = redis_client.register_script(_CLAIM)
+        self._heartbeat = redis_client.register_script(_HEARTBEAT)
+        self._release = redis_client.register_script(_RELEASE)
+        self._start_at = redis_client.register_script(_START_AT)
+
+        self.claimed = 0
+        self.taken_over = 0
+        self.lost = 0
+        self.abandoned = 0
+
+    # --- Scheduler Side (no I/O) ---
+
+    def peek(self):
+        """Next slot to request live, or None while no leased range is in hand."""
+        while self.owned and self.owned[0][1] >= self.owned[0][2]:
+            self._finished.append(self.owned.popleft()[0])
+        if len(self.owned) < LEASE_AHEAD:
+            self._need.set()
+        return self.owned[0][1] if self.owned else None
+
+    def take(self):
+        """Marks the slot returned by peek() as requested."""
+        self.owned[0][1] += 1
+
+    def skip_before(self, slot):
+        """Gives up owned slots below `slot` (live fetching fell too far behind)."""
+        skipped = 0
+        for entry in self.owned:
+            if entry[1] < slot:
+                skipped += min(slot, entry[2]) - entry[1]
+                entry[1] = min(slot, entry[2])
+        self.abandoned += skipped
+        return skipped
+
+    # --- Redis Side ---
+
+    async def start_at(self, slot):
+        """Makes sure no range below `slot` is handed out as new (start signal; never moves back)."""
+        await self._start_at(keys=[NEXT_KEY], args=[slot // LEASE_SLOTS])
+
+    async def claim(self, floor_slot):
+        r, progress, expired = await self._claim(
+            keys=[NEXT_KEY, EXPIRY_KEY, HOLDER_KEY, PROGRESS_KEY],
+            args=[self.worker_id, int(LEASE_TTL * 1000), max(0, floor_slot) // LEASE_SLOTS],
+        )
+        r, progress = int(r), int(progress)
+        start = r * LEASE_SLOTS
+        end = start + LEASE_SLOTS
+        next_slot = min(max(progress, start), end) if progress >= 0 else start
+        self.claimed += 1
+        if expired:
+            self.taken_over += 1
+            print(f"[Lease W{self.worker_id}] Took over expired range {start}..{end - 1} at slot {next_slot}")
+        self.owned.append([r, next_slot, end])
+        # Taken-over ranges can be older than the ones in hand
+        self.owned = deque(sorted(self.owned))
+        return r
+
+    async def heartbeat(self):
+        held = list(self.owned)
+        if not held:
+            return
+        args = [self.worker_id, int(LEASE_TTL * 1000)]
+        for r, next_slot, _ in held:
+            args += [r, next_slot]
+        lost = {int(r) for r in await self._heartbeat(keys=[EXPIRY_KEY, HOLDER_KEY, PROGRESS_KEY], args=args)}
+        if lost:
+            # We stalled past LEASE_TTL and someone else resumed these ranges
+            self.lost += len(lost)
+            self.owned = deque(entry for entry in self.owned if entry[0] not in lost)
+            print(f"[Lease W{self.worker_id}] Lost {len(lost)} range(s) to other workers: {sorted(lost)}")
+
+    async def release_finished(self):
+        if not self._finished:
+            return
+        finished, self._finished = self._finished, []
+        await self._release(keys=[EXPIRY_KEY, HOLDER_KEY, PROGRESS_KEY], args=[self.worker_id, *finished])
+
+    async def run(self, scheduler):
+        """Keeps LEASE_AHEAD ranges in hand for the scheduler and their leases alive."""
+        last_heartbeat = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self._need.wait(), LEASE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._need.clear()
+            try:
+                await self.release_finished()
+                if scheduler.tip is not None:
+                    floor_slot = scheduler.tip - MAX_LAG_SLOTS // 2
+                    claimed = False
+                    while len(self.owned) < LEASE_AHEAD:
+                        await self.claim(floor_slot)
+                        claimed = True
+                    if claimed:
+                        scheduler.notify()
+
+                if time.monotonic() - last_heartbeat >= LEASE_HEARTBEAT_INTERVAL:
+                    last_heartbeat = time.monotonic()
+                    await self.heartbeat()
+            except Exception as e:
+                print(f"[Lease W{self.worker_id}] Error: {e}")
+
+    def describe(self):
+        ranges = ", ".join(f"{nxt}..{end - 1}" for _, nxt, end in self.owned) or "none"
+        return (f"in hand: {ranges} | claimed {self.claimed}, taken over {self.taken_over}, "
+                f"lost {self.lost}, abandoned slots {self.abandoned}")
@@ -0,0 +1,218 @@
+"""
+Slot ledger shared by every subscriber worker, stored in Redis.
+
+Keys (all prefixed with LEDGER_PREFIX):
+  :done:<chunk>      bitmap, one bit per slot (CHUNK_SLOTS slots per key),
+                     set once a slot was delivered (even if only to the
+                     receiver, see FETCH_UNDETECTED) or confirmed skipped
+  :skipped:<chunk>   bitmap, set for slots the cluster skipped
+  :missing           sorted set of slots waiting for backfill (score = slot)
+  :frontier          hash worker_id -> "next_live_slot:unix_time" of that worker
+  :scan_cursor       lowest slot the gap scanner has not looked at yet
+  :stats:<window>    hash of per-outcome counters for one STATS_WINDOW
+
+Live fetching marks outcomes through `record()`; the marks are buffered and
+written in one pipeline per LEDGER_FLUSH_INTERVAL. `run_backfill_feeder()`
+periodically scans the done bitmap behind the slowest worker for gaps (lost
+slots, dropped blocks, ranges abandoned after a stall), moves them into the
+missing set and hands claimed slots to the scheduler's low-priority queue.
+"""
+
+import asyncio
+import time
+
+from slot_scheduler import FETCH_OK, FETCH_SKIPPED, FETCH_UNDETECTED
+
+DONE_OUTCOMES = (FETCH_OK, FETCH_SKIPPED, FETCH_UNDETECTED)  # Never backfilled
+
+LEDGER_PREFIX = "SLOT_LEDGER"
+CHUNK_SLOTS = 1 << 20              # 128 KB of bitmap per key
+STATS_WINDOW = 60                  # Seconds per coverage window
+STATS_TTL = 24 * 3600              # Keep a day of windows
+
+LEDGER_FLUSH_INTERVAL = 0.5        # Seconds between ledger pipeline flushes
+BACKFILL_POLL_INTERVAL = 2.0       # Seconds between gap scans / claims
+GAP_SCAN_MARGIN = 300              # Stay this many slots behind the slowest worker (~2 min)
+FRONTIER_STALE_AFTER = 30          # Seconds before a silent worker stops holding the scan back
+GAP_SCAN_MAX_SLOTS = 20000         # Upper bound on slots inspected per scan
+BACKFILL_CLAIM_BATCH = 16          # Slots claimed from the missing set at once
+
+
+def _key(kind, slot):
+    return f"{LEDGER_PREFIX}:{kind}:{slot // CHUNK_SLOTS}", slot % CHUNK_SLOTS
+
+
+class SlotLedger:
+    def __init__(self, redis_client, worker_id):
+        self.redis = redis_client
+        self.worker_id = worker_id
+        self._pending = []          # (slot, outcome, backfill)
+
+        self.missing_key = f"{LEDGER_PREFIX}:missing"
+        self.frontier_key = f"{LEDGER_PREFIX}:frontier"
+        self.cursor_key = f"{LEDGER_PREFIX}:scan_cursor"
+
+    # --- Recording (hot path, no I/O) ---
+
+    def record(self, slot, outcome, backfill=False):
+        """Buffers the final outcome of a slot (after any live retries)."""
+        self._pending.append((slot, outcome, backfill))
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        window = int(time.time()) // STATS_WINDOW * STATS_WINDOW
+        stats_key = f"{LEDGER_PREFIX}:stats:{window}"
+
+        pipe = self.redis.pipeline(transaction=False)
+        for slot, outcome, backfill in pending:
+            if outcome in DONE_OUTCOMES:
+                key, bit = _key("done", slot)
+                pipe.setbit(key, bit, 1)
+                if outcome == FETCH_SKIPPED:
+                    key, bit = _key("skipped", slot)
+                    pipe.setbit(key, bit, 1)
+            else:
+                # Failed / dropped slots go straight to the backfill set.
+                pipe.zadd(self.missing_key, {slot: slot})
+            field = f"backfill_{outcome}" if backfill else outcome
+            pipe.hincrby(stats_key, field, 1)
+        pipe.expire(stats_key, STATS_TTL)
+        await pipe.execute()
+
+    async def run_flusher(self):
+        while True:
+            await asyncio.sleep(LEDGER_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[Ledger W{self.worker_id}] Flush error: {e}")
+
+    # --- Gap Detection ---
+
+    async def publish_frontier(self, next_slot):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(self.frontier_key, self.worker_id, f"{next_slot}:{int(time.time())}")
+        pipe.setnx(self.cursor_key, next_slot)
+        await pipe.execute()
+
+    async def find_gaps(self, lo, hi):
+        """Slots in [lo, hi) whose done bit is still clear."""
+        gaps = []
+        slot = lo
+        while slot < hi:
+            key, bit = _key("done", slot)
+            chunk_end = min(hi, slot - bit + CHUNK_SLOTS)
+            last_bit = bit + (chunk_end - slot) - 1
+            raw = await self.redis.getrange(key, bit // 8, last_bit // 8)
+            if isinstance(raw, str):
+                raw = raw.encode("latin-1")
+            base = bit // 8 * 8
+            for b in range(bit, last_bit + 1):
+                byte_index = (b - base) >> 3
+                byte = raw[byte_index] if byte_index < len(raw) else 0
+                if not byte & (0x80 >> (b & 7)):
+                    gaps.append(slot - bit + b)
+            slot = chunk_end
+        return gaps
+
+    async def scan_for_gaps(self):
+        """Moves gaps behind the slowest live worker into the missing set."""
+        entries = await self.redis.hvals(self.frontier_key)
+        cursor = await self.redis.get(self.cursor_key)
+        now = time.time()
+        frontiers = []
+        for entry in entries:
+            if isinstance(entry, bytes):
+                entry = entry.decode()
+            slot, seen = entry.split(":")
+            if now - int(seen) <= FRONTIER_STALE_AFTER:
+                frontiers.append(int(slot))
+        if not frontiers or cursor is None:
+            return 0
+        lo = int(cursor)
+        hi = min(frontiers) - GAP_SCAN_MARGIN
+        hi = min(hi, lo + GAP_SCAN_MAX_SLOTS)
+        if hi <= lo:
+            return 0
+
+        gaps = await self.find_gaps(lo, hi)
+        pipe = self.redis.pipeline(transaction=False)
+        if gaps:
+            pipe.zadd(self.missing_key, {s: s for s in gaps}, nx=True)
+        # Concurrent scanners may overlap; ZADD NX keeps that harmless.
+        pipe.set(self.cursor_key, hi)
+        await pipe.execute()
+        return len(gaps)
+
+    async def claim_missing(self, count):
+        """Atomically takes up to `count` of the oldest missing slots."""
+        popped = await self.redis.zpopmin(self.missing_key, count)
+        slots = [int(float(member)) for member, _ in popped]
+        if not slots:
+            return []
+        # Drop slots that a live retry filled in the meantime.
+        pipe = self.redis.pipeline(transaction=False)
+        for slot in slots:
+            key, bit = _key("done", slot)
+            pipe.getbit(key, bit)
+        done = await pipe.execute()
+        return [s for s, d in zip(slots, done) if not d]
+
+    async def run_backfill_feeder(self, scheduler):
+        """Keeps the scheduler's low-priority backfill queue topped up."""
+        last_window = int(time.time()) // STATS_WINDOW
+        while True:
+            await asyncio.sleep(BACKFILL_POLL_INTERVAL)
+            try:
+                window = int(time.time()) // STATS_WINDOW
+                if window != last_window:
+                    last_window = window
+                    await self.report_coverage()
+
+                await self.publish_frontier(scheduler.next_slot)
+                found = await self.scan_for_gaps()
+                if found:
+                    print(f"[Ledger W{self.worker_id}] Found {found} missing slots")
+                if scheduler.wants_backfill():
+                    slots = await self.claim_missing(BACKFILL_CLAIM_BATCH)
+                    scheduler.add_backfill(slots)
+            except Exception as e:
+                print(f"[Ledger W{self.worker_id}] Backfill feeder error: {e}")
+
+    # --- Coverage ---
+
+    async def report_coverage(self):
+        # Index 1 is the last complete window.
+        start, coverage, counts = (await self.window_stats(2))[1]
+        shown = "n/a" if coverage is None else f"{coverage * 100:.2f}%"
+        missing = await self.redis.zcard(self.missing_key)
+        stamp = time.strftime("%H:%M:%S", time.localtime(start))
+        print(f"[Ledger W{self.worker_id}] Window {stamp} coverage {shown} | {counts} | missing backlog: {missing}")
+
+    async def coverage(self, lo, hi):
+        """Fraction of slots in [lo, hi) that are delivered or known skipped."""
+        if hi <= lo:
+            return 1.0
+        gaps = await self.find_gaps(lo, hi)
+        return 1.0 - len(gaps) / (hi - lo)
+
+    async def window_stats(self, windows=5):
+        """Per-window outcome counters and live coverage, newest first."""
+        now = int(time.time()) // STATS_WINDOW * STATS_WINDOW
+        starts = [now - i * STATS_WINDOW for i in range(windows)]
+        pipe = self.redis.pipeline(transaction=False)
+        for start in starts:
+            pipe.hgetall(f"{LEDGER_PREFIX}:stats:{start}")
+        results = await pipe.execute()
+
+        report = []
+        for start, raw in zip(starts, results):
+            counts = {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()}
+            good = sum(counts.get(outcome, 0) for outcome in DONE_OUTCOMES)
+            lost = sum(v for k, v in counts.items()
+                       if not k.startswith("backfill_") and k not in DONE_OUTCOMES)
+            coverage = good / (good + lost) if good + lost else None
+            report.append((start, coverage, counts))
+        return report
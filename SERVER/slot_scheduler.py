@@ -0,0 +1,321 @@
+"""
+Tip-aware slot scheduler for the subscriber workers.
+
+Each worker owns every `stride`-th slot starting at its first slot, or, with
+`leases` (slot_leases.SlotLeases), whatever slot ranges it currently leases.
+Instead of firing one getBlock on a fixed timer, the scheduler polls the chain tip with
+getSlot and only requests slots the cluster has produced:
+
+  - behind the tip  -> issue requests back to back (bounded by MAX_INFLIGHT)
+  - at the tip      -> wait for the next tip update
+  - "not ready"     -> retry the slot with exponential backoff
+  - skipped slot    -> mark it and move on, never retried
+  - too far behind  -> jump forward so the lag stays bounded (the abandoned
+                       range is reported so it can be backfilled)
+  - spare capacity  -> re-fetch slots from the backfill queue (fed by the
+                       slot ledger), never more than BACKFILL_MAX_INFLIGHT
+
+fetch_fn(slot, request_id) must return one of the FETCH_* outcomes below.
+The optional batch_fetch_fn(slots, request_id) fetches several slots in one
+JSON-RPC batch and returns {slot: outcome}; it is used while catching up and
+for backfill, when per-request overhead dominates.
+"""
+
+import asyncio
+import heapq
+import json
+import time
+from collections import deque
+
+# --- Fetch Outcomes ---
+FETCH_OK = "ok"
+FETCH_NOT_READY = "not_ready"
+FETCH_SKIPPED = "skipped"
+FETCH_ERROR = "error"
+FETCH_DROPPED = "dropped"     # Fetched, but a consumer could not take it (queue full / too big)
+FETCH_UNDETECTED = "undetected"  # Delivered to the receiver, but the detector could not take it (never refetched: the rows are out)
+
+# JSON-RPC error codes returned by getBlock
+SKIPPED_SLOT_CODES = {-32007, -32009}       # Slot skipped / missing in long-term storage
+NOT_READY_CODES = {-32004, -32014}          # Block not available yet / status not yet available
+
+# --- Scheduler Tuning ---
+TIP_POLL_INTERVAL = 0.4       # Seconds between getSlot calls (~1 slot)
+MAX_INFLIGHT = 8              # Concurrent getBlock requests per worker
+RETRY_BASE_DELAY = 0.4        # First retry delay for a not-ready slot
+RETRY_MAX_DELAY = 6.4         # Backoff ceiling
+MAX_RETRIES = 8               # Give up on a slot after this many attempts
+MAX_LAG_SLOTS = 1500          # ~10 minutes; beyond this we jump forward
+STATS_INTERVAL = 10.0         # Seconds between lag reports
+BACKFILL_MAX_INFLIGHT = 2     # Backfill requests never take more than this many slots
+BACKFILL_MAX_LAG = 30         # ... and only run while live fetching is this close to tip
+BATCH_SIZE = 5                # Slots per JSON-RPC batch request
+BATCH_MIN_PENDING = 4         # Batch live slots once this many owned slots are waiting
+
+
+def classify_rpc_reply(reply):
+    """Maps a decoded getBlock JSON-RPC reply to a FETCH_* outcome."""
+    if reply.get("result") is not None:
+        return FETCH_OK
+    error = reply.get("error")
+    if error:
+        code = error.get("code")
+        if code in SKIPPED_SLOT_CODES:
+            return FETCH_SKIPPED
+        if code in NOT_READY_CODES:
+            return FETCH_NOT_READY
+        return FETCH_ERROR
+    return FETCH_NOT_READY
+
+
+class SlotScheduler:
+    def __init__(self, session, rpc, worker_id, start_slot, stride, fetch_fn,
+                 ledger=None, batch_fetch_fn=None, leases=None):
+        self.session = session
+        self.rpc = rpc              # RpcPool
+        self.worker_id = worker_id
+        self.stride = stride
+        self.fetch_fn = fetch_fn
+        self.batch_fetch_fn = batch_fetch_fn
+        self.ledger = ledger
+        self.leases = leases        # Leased ranges replace the fixed stride
+
+        self.next_slot = start_slot
+        self.tip = None
+        self.inflight = 0
+        self.request_id = 0
+
+        self._retries = []          # heap of (due_time, slot, attempt)
+        self._wake = asyncio.Event()
+        self._backfill = deque()
+        self.backfill_inflight = 0
+
+        # Counters for the lag report
+        self.done = 0
+        self.skipped = 0
+        self.given_up = 0
+        self.jumped = 0
+        self.backfilled = 0
+        self.max_lag = 0
+
+    # --- Tip Tracking ---
+
+    async def _get_tip(self):
+        payload = {"jsonrpc": "2.0", "id": "tip", "method": "getSlot"}
+        status, text, _, _ = await self.rpc.post(self.session, payload, hedge=False)
+        if status != 200:
+            return None
+        return json.loads(text).get("result")
+
+    async def _poll_tip(self):
+        while True:
+            try:
+                tip = await self._get_tip()
+                if tip is not None and (self.tip is None or tip > self.tip):
+                    self.tip = tip
+                    self._wake.set()
+            except Exception as e:
+                print(f"[Sched W{self.worker_id}] getSlot error: {e}")
+            await asyncio.sleep(TIP_POLL_INTERVAL)
+
+    def lag(self):
+        """Slots produced by the cluster that this worker has not requested yet."""
+        if self.tip is None:
+            return 0
+        if self.leases is not None and self.leases.peek() is None:
+            return 0
+        return max(0, self.tip - self.next_slot)
+
+    def notify(self):
+        """Wakes the dispatcher (e.g. a new range was leased)."""
+        self._wake.set()
+
+    # --- Dispatch ---
+
+    def _launch(self, slots, attempts, backfill=False):
+        """
+        Starts one request for `slots`: a single getBlock, or one JSON-RPC
+        batch when more than one slot is given. Counts as one in-flight request.
+        """
+        self.inflight += 1
+        if backfill:
+            self.backfill_inflight += 1
+        request_id = self.request_id
+        self.request_id += 1
+
+        if len(slots) == 1:
+            task = asyncio.create_task(self.fetch_fn(slots[0], request_id))
+        else:
+            task = asyncio.create_task(self.batch_fetch_fn(slots, request_id))
+        task.add_done_callback(lambda t: self._on_done(t, slots, attempts, backfill))
+
+    def _record(self, slot, outcome, backfill=False):
+        if self.ledger is not None:
+            self.ledger.record(slot, outcome, backfill)
+
+    def _on_done(self, task, slots, attempts, backfill):
+        self.inflight -= 1
+        if backfill:
+            self.backfill_inflight -= 1
+
+        if task.cancelled() or task.exception():
+            outcomes = {slot: FETCH_ERROR for slot in slots}
+        elif len(slots) == 1:
+            outcomes = {slots[0]: task.result()}
+        else:
+            outcomes = task.result()
+
+        for slot, attempt in zip(slots, attempts):
+            outcome = outcomes.get(slot, FETCH_ERROR)
+            if backfill:
+                self._settle_backfill(slot, outcome)
+            else:
+                self._settle(slot, attempt, outcome)
+        self._wake.set()
+
+    def _settle(self, slot, attempt, outcome):
+        if outcome in (FETCH_OK, FETCH_UNDETECTED):
+            self.done += 1
+            self._record(slot, outcome)
+        elif outcome in (FETCH_SKIPPED, FETCH_DROPPED):
+            if outcome == FETCH_SKIPPED:
+                self.skipped += 1
+            self._record(slot, outcome)
+        elif attempt + 1 >= MAX_RETRIES:
+            self.given_up += 1
+            self._record(slot, outcome)
+            print(f"[Sched W{self.worker_id}] Giving up on slot {slot} after {attempt + 1} attempts ({outcome})")
+        else:
+            delay = min(RETRY_BASE_DELAY * (2 ** attempt), RETRY_MAX_DELAY)
+            heapq.heappush(self._retries, (time.monotonic() + delay, slot, attempt + 1))
+
+    def _settle_backfill(self, slot, outcome):
+        if outcome == FETCH_OK:
+            self.backfilled += 1
+        # Failures go back into the ledger's missing set for a later pass.
+        self._record(slot, outcome, backfill=True)
+
+    def _batch_size(self):
+        """How many slots to put in the next request (1 = no batching)."""
+        if self.batch_fetch_fn is None:
+            return 1
+        if self.lag() // self.stride < BATCH_MIN_PENDING:
+            return 1
+        return BATCH_SIZE
+
+    # --- Backfill (low priority) ---
+
+    def wants_backfill(self):
+        return len(self._backfill) < BACKFILL_MAX_INFLIGHT * BATCH_SIZE * 4
+
+    def add_backfill(self, slots):
+        if slots:
+            self._backfill.extend(slots)
+            self._wake.set()
+
+    def _peek_slot(self):
+        """Next live slot this worker owns, or None while it has no leased range."""
+        if self.leases is None:
+            return self.next_slot
+        slot = self.leases.peek()
+        if slot is not None:
+            self.next_slot = slot
+        return slot
+
+    def _take_slot(self):
+        if self.leases is None:
+            self.next_slot += self.stride
+        else:
+            self.leases.take()
+
+    def _bound_lag(self):
+        lag = self.lag()
+        self.max_lag = max(self.max_lag, lag)
+        if lag <= MAX_LAG_SLOTS:
+            return
+        if self.leases is not None:
+            target = self.tip - MAX_LAG_SLOTS // 2
+            skipped = self.leases.skip_before(target)
+            print(f"[Sched W{self.worker_id}] Lag {lag} > {MAX_LAG_SLOTS}, "
+                  f"abandoning {skipped} leased slots below {target}")
+            self.jumped += skipped
+            return
+        # Jump to the newest slot we own that is MAX_LAG_SLOTS / 2 behind tip.
+        target = self.tip - MAX_LAG_SLOTS // 2
+        steps = (target - self.next_slot) // self.stride
+        new_slot = self.next_slot + steps * self.stride
+        print(f"[Sched W{self.worker_id}] Lag {lag} > {MAX_LAG_SLOTS}, "
+              f"abandoning slots {self.next_slot}..{new_slot - self.stride}")
+        self.jumped += steps
+        self.next_slot = new_slot
+
+    def _dispatch(self):
+        now = time.monotonic()
+
+        # 1. Retries that are due go first (they are the oldest slots).
+        while self._retries and self._retries[0][0] <= now and self.inflight < MAX_INFLIGHT:
+            _, slot, attempt = heapq.heappop(self._retries)
+            self._launch([slot], [attempt])
+
+        # 2. New slots up to the tip, batched while we are catching up.
+        if self.tip is None:
+            return
+        self._bound_lag()
+        while self.inflight < MAX_INFLIGHT:
+            slots = []
+            for _ in range(self._batch_size()):
+                slot = self._peek_slot()
+                if slot is None or slot > self.tip:
+                    break
+                slots.append(slot)
+                self._take_slot()
+            if not slots:
+                break
+            self._launch(slots, [0] * len(slots))
+
+        # 3. Backfill only with capacity live fetching left unused.
+        backfill_batch = 1 if self.batch_fetch_fn is None else BATCH_SIZE
+        while (self._backfill and self.inflight < MAX_INFLIGHT
+               and self.backfill_inflight < BACKFILL_MAX_INFLIGHT
+               and self.lag() <= BACKFILL_MAX_LAG and not self._retries):
+            slots = [self._backfill.popleft() for _ in range(min(backfill_batch, len(self._backfill)))]
+            self._launch(slots, [0] * len(slots), backfill=True)
+
+    def _next_deadline(self):
+        if not self._retries:
+            return STATS_INTERVAL
+        return min(STATS_INTERVAL, max(0.0, self._retries[0][0] - time.monotonic()))
+
+    def _report(self):
+        print(f"[Sched W{self.worker_id}] tip={self.tip} next={self.next_slot} lag={self.lag()} "
+              f"max_lag={self.max_lag} inflight={self.inflight} retrying={len(self._retries)} "
+              f"done={self.done} skipped={self.skipped} given_up={self.given_up} jumped={self.jumped} "
+              f"backfilled={self.backfilled} backfill_queued={len(self._backfill)}")
+        print(f"[Sched W{self.worker_id}] RPC: {self.rpc.describe()}")
+        if self.leases is not None:
+            print(f"[Sched W{self.worker_id}] Leases: {self.leases.describe()}")
+        self.max_lag = self.lag()
+
+    async def run(self):
+        tasks = [asyncio.create_task(self._poll_tip())]
+        if self.ledger is not None:
+            tasks.append(asyncio.create_task(self.ledger.run_flusher()))
+            tasks.append(asyncio.create_task(self.ledger.run_backfill_feeder(self)))
+        if self.leases is not None:
+            tasks.append(asyncio.create_task(self.leases.run(self)))
+        last_report = time.monotonic()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self._next_deadline())
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                self._dispatch()
+
+                if time.monotonic() - last_report >= STATS_INTERVAL:
+                    self._report()
+                    last_report = time.monotonic()
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,141 @@
+"""
+Per-slot latency tracing with a Prometheus-text metrics endpoint.
+
+A SlotTrace follows one slot (or one detected pool) through the pipeline and
+is stamped at every stage:
+
+    request_sent -> response_received -> queued -> shm_written          (producer)
+    shm_consumed -> detector_matched -> redis_published / http_delivered (detector)
+    flight_enriched                                                      (Flight server)
+
+Each stamp feeds two histograms:
+
+    slot_stage_seconds{stage=...}   time since the previous stamp of the slot
+    slot_age_seconds{stage=...}     time since the block was produced (blockTime)
+
+Stamps are wall-clock (time.time()) so they stay comparable across processes;
+where a slot crosses a process boundary the previous stamp travels with it
+(the detector descriptor carries the shm_written time). The Flight server only
+sees blockTime, so flight_enriched has an age but no stage delta.
+
+An observation is a bisect and two additions; `serve_metrics(port)` answers
+GET /metrics from a daemon thread, so it works in asyncio processes and in the
+threaded Flight server alike.
+"""
+
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STAGES = (
+    "request_sent", "response_received", "queued", "shm_written",
+    "shm_consumed", "detector_matched", "redis_published", "http_delivered",
+    "flight_enriched",
+)
+
+# Seconds; wide enough for sub-ms handoffs and multi-second RPC stalls
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets      # Upper bounds, in the unit observed (seconds unless given)
+        self.series = {}            # label value -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {k: list(v) for k, v in self.series.items()}
+        for value, series in sorted(snapshot.items()):
+            labels = f'{self.label}="{value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram("slot_stage_seconds", "Time since the previous pipeline stage of the slot", "stage")
+AGE_SECONDS = Histogram("slot_age_seconds", "Time since the block was produced (blockTime)", "stage")
+REGISTRY = [STAGE_SECONDS, AGE_SECONDS]
+
+
+class SlotTrace:
+    __slots__ = ("slot", "block_time", "last")
+
+    def __init__(self, slot, block_time=None, last=None):
+        self.slot = slot
+        self.block_time = block_time    # Unix seconds, when known
+        self.last = last                # Wall time of the previous stamp
+
+    def mark(self, stage, now=None):
+        if now is None:
+            now = time.time()
+        if self.last is not None:
+            STAGE_SECONDS.observe(stage, max(0.0, now - self.last))
+        if self.block_time is not None:
+            AGE_SECONDS.observe(stage, max(0.0, now - self.block_time))
+        self.last = now
+        return self
+
+    def fork(self):
+        """Independent copy for a branch of the pipeline (e.g. one per detected pool)."""
+        return SlotTrace(self.slot, self.block_time, self.last)
+
+
+def mark(trace, stage):
+    """Stamps `trace` if there is one; call sites stay one line."""
+    if trace is not None:
+        trace.mark(stage)
+
+
+def render_metrics():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """Starts the /metrics endpoint on a daemon thread. Returns the server, or None if the port is taken."""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"[Metrics] Port {port} unavailable: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[Metrics] Serving http://{host}:{port}/metrics")
+    return server
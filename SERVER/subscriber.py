@@ -1,35 +1,48 @@
 import redis
+import redis.asyncio as aioredis
 import subprocess
 import sys
 import time
 import asyncio
 import aiohttp
-import json # We'll need this to get the text
+import os
 from datetime import datetime, timezone
-from multiprocessing import shared_memory
+
+from shm_ring import open_ring_segment, ShmRingWriter, write_block
+from doorbell import RingSignals
+from slot_scheduler import (
+    SlotScheduler, classify_rpc_reply,
+    FETCH_OK, FETCH_NOT_READY, FETCH_SKIPPED, FETCH_ERROR, FETCH_DROPPED,
+)
+from slot_ledger import SlotLedger
+from slot_leases import SlotLeases, lease_run_active
+from rpc_pool import RpcPool
+from block_scan import peek_reply
 
 # --- Shared Memory Configuration ---
 SHM_NAME = "solana_json_shm"  # Same name must be used in C++
-SHM_SIZE = 10 * 1024 * 1024  # 10MB
-FLAG_OFFSET = 0
-SIZE_OFFSET = 1
-DATA_OFFSET = 9
+SHM_SIZE = 64 * 1024 * 1024  # 64MB ring (layout documented in shm_ring.py)
 # -----------------------------------
 
 REDIS_HOST = '20.46.50.39'
 REDIS_PORT = 6379
 CHANNEL_NAME = 'start-work'
 
+SLOT_LEASING = True  # Lease slot ranges through Redis (slot_leases.py) instead of the static stride below
 NUM_WORKERS = 6
-RPC_URL = "https://api.mainnet-beta.solana.com"
+# Comma-separated override, e.g. RPC_URLS=http://127.0.0.1:8899 for a local stand-in
+RPC_URLS = os.environ.get("RPC_URLS", "https://api.mainnet-beta.solana.com").split(",")
+RPC_HEDGE = len(RPC_URLS) > 1  # Duplicate slow requests to the next-best endpoint
+RPC_SHARED_LIMITS = True  # AIMD concurrency limit per endpoint, shared by all workers on this host
 
 # -------------------------
 # MODIFIED WORKER LOGIC
 # -------------------------
 
-async def fetch_block(session, slot_num, request_id, worker_id, shm_buf):
+async def fetch_block(session, rpc, slot_num, request_id, worker_id, ring, signals):
     """
-    Fetches the block and, on success, writes the data to shared memory.
+    Fetches the block and, on success, appends it to the shared memory ring.
+    Returns a FETCH_* outcome for the scheduler.
     """
     payload = {
         "jsonrpc": "2.0",
@@ -43,77 +56,82 @@ async def fetch_block(session, slot_num, request_id, worker_id, shm_buf):
     }
 
     try:
-        start = asyncio.get_event_loop().time()
-        async with session.post(RPC_URL, json=payload) as response:
-            elapsed = (asyncio.get_event_loop().time() - start) * 1000
-            now = datetime.now(timezone.utc)
-            ts = now.strftime("%H:%M:%S") + f":{int(now.microsecond/1000):03d}"
-
-            if response.status == 200:
-                # Use response.text() to get the raw string
-                json_string = await response.text()
-                result = json.loads(json_string) # Check if it's a valid result
-
-                if result.get("result") is not None:
-                    print(f"[W {worker_id} | {ts}] Got slot {slot_num} ({elapsed:.1f} ms)")
-
-                    # --- WRITE TO SHARED MEMORY ---
-                    json_bytes = json_string.encode('utf-8')
-                    data_size = len(json_bytes)
-
-                    if data_size > (SHM_SIZE - DATA_OFFSET):
-                        print(f"Error: JSON size ({data_size}) > SHM size")
-                        return
+        # The pool picks the fastest healthy endpoint and returns the raw text
+        status, json_string, elapsed, endpoint = await rpc.post(session, payload)
+        elapsed *= 1000
+        now = datetime.now(timezone.utc)
+        ts = now.strftime("%H:%M:%S") + f":{int(now.microsecond/1000):03d}"
 
-                    # 1. Wait for consumer to clear the flag (flag == 0)
-                    while shm_buf[FLAG_OFFSET] == 1:
-                        print(f"[W {worker_id}] Waiting for consumer to read...")
-                        await asyncio.sleep(0.05) # Poll gently
+        if status == 200:
+            # Blocks are not decoded here; only small error / null replies are
+            result, block_time = peek_reply(json_string)
+            if result is None:
+                outcome = FETCH_OK
+            else:
+                outcome = classify_rpc_reply(result)
+                if outcome == FETCH_OK:
+                    block_time = result["result"].get("blockTime")
 
-                    # 2. Write size (8 bytes, little-endian)
-                    shm_buf[SIZE_OFFSET:DATA_OFFSET] = data_size.to_bytes(8, 'little')
+            if outcome == FETCH_OK:
+                print(f"[W {worker_id} | {ts}] Got slot {slot_num} ({elapsed:.1f} ms)")
 
-                    # 3. Write JSON data
-                    shm_buf[DATA_OFFSET:DATA_OFFSET + data_size] = json_bytes
+                # --- WRITE TO SHARED MEMORY RING ---
+                json_bytes = json_string.encode('utf-8')
 
-                    # 4. Set flag to 1 (unread)
-                    shm_buf[FLAG_OFFSET] = 1
+                # Only blocks when every slot of the ring is still unread
+                seq = await write_block(ring, signals.space, json_bytes, slot_num, block_time, f"[W {worker_id}]")
+                if seq is None:
+                    return FETCH_DROPPED
 
-                    print(f"[W {worker_id}] Wrote {data_size} bytes to SHM.")
-                    # --------------------------------
+                print(f"[W {worker_id}] Wrote {len(json_bytes)} bytes to SHM (seq {seq}).")
+                # --------------------------------
 
-                else:
-                    print(f"[W {worker_id} | {ts}] Slot {slot_num} not ready ({elapsed:.1f} ms)")
+            elif outcome == FETCH_SKIPPED:
+                print(f"[W {worker_id} | {ts}] Slot {slot_num} was skipped ({elapsed:.1f} ms)")
+            elif outcome == FETCH_NOT_READY:
+                print(f"[W {worker_id} | {ts}] Slot {slot_num} not ready ({elapsed:.1f} ms)")
             else:
-                print(f"[W {worker_id} | {ts}] HTTP {response.status} ({elapsed:.1f} ms)")
+                print(f"[W {worker_id} | {ts}] Slot {slot_num} RPC error: {result.get('error')}")
+            return outcome
+        else:
+            print(f"[W {worker_id} | {ts}] HTTP {status} from {endpoint.url} ({elapsed:.1f} ms)")
+            return FETCH_ERROR
 
     except Exception as e:
         now = datetime.now(timezone.utc)
         ts = now.strftime("%H:%M:%S") + f":{int(now.microsecond/1000):03d}"
         print(f"[W {worker_id} | {ts}] Error for slot {slot_num}: {e}")
+        return FETCH_ERROR
 
+async def run_worker_inline(worker_id, slot, ring, signals):
+    print(f"[Worker {worker_id}] Started at slot {slot if slot is not None else 'current lease'}")
 
-async def run_worker_inline(worker_id, slot, shm_buf):
-    print(f"[Worker {worker_id}] Started at slot {slot}")
-
-    async with aiohttp.ClientSession() as session:
-        request_id = 0
+    # Shared slot ledger: records every outcome and feeds gaps back for backfill
+    r_ledger = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+    ledger = SlotLedger(r_ledger, worker_id)
 
-        # Run 5 times for this example
-        while (1):
-            now = datetime.now(timezone.utc)
-            ts = now.strftime("%H:%M:%S") + f":{int(now.microsecond/1000):03d}"
-            print(f"[Worker {worker_id} | {ts}] Sending request for slot {slot}")
+    # Slot ranges are leased from Redis as this worker needs them (None = join the run in progress)
+    leases = None
+    if SLOT_LEASING:
+        leases = SlotLeases(r_ledger, worker_id)
+        if slot is not None:
+            await leases.start_at(slot)
 
-            # Create the task, passing the shared memory buffer
-            asyncio.create_task(fetch_block(session, slot, request_id, worker_id, shm_buf))
+    # Routes each request to the fastest healthy endpoint (optionally hedged)
+    rpc = RpcPool(RPC_URLS, hedge=RPC_HEDGE, shared_limits=RPC_SHARED_LIMITS)
 
-            slot += NUM_WORKERS
-            request_id += 1
+    async with aiohttp.ClientSession() as session:
+        async def fetch(slot_num, request_id):
+            return await fetch_block(session, rpc, slot_num, request_id, worker_id, ring, signals)
 
-            await asyncio.sleep(2.4) # Original sleep
+        # Poll the tip and request our slots as soon as they exist
+        scheduler = SlotScheduler(session, rpc, worker_id, slot or 0, 1 if leases else NUM_WORKERS,
+                                  fetch, ledger, leases=leases)
+        try:
+            await scheduler.run()
+        finally:
+            await r_ledger.aclose()
 
-        await asyncio.sleep(10) # Wait for tasks to finish
         print("Worker run finished.")
 
 
@@ -128,21 +146,21 @@ def main():
     WORKER_ID = int(sys.argv[1])
     print(f"Subscriber started for Worker {WORKER_ID}")
 
-    # --- Create or connect to Shared Memory ---
-    try:
-        # Create the shared memory block
-        shm = shared_memory.SharedMemory(name=SHM_NAME, create=True, size=SHM_SIZE)
-        print(f"Created shared memory '{SHM_NAME}' ({SHM_SIZE} bytes)")
-        # Initialize flag to 0 (read/empty)
-        shm.buf[FLAG_OFFSET] = 0
-    except FileExistsError:
-        # Or attach to it if it already exists
-        shm = shared_memory.SharedMemory(name=SHM_NAME, create=False)
-        print(f"Attached to existing shared memory '{SHM_NAME}'")
+    # --- Create or connect to the Shared Memory ring ---
+    shm = open_ring_segment(SHM_NAME, SHM_SIZE)
+    # The receiver's doorbell is rung on every publish; ours when it frees space
+    signals = RingSignals(SHM_NAME, detector=False)
+    ring = ShmRingWriter(shm.buf, on_publish=signals.receiver.ring)
+    print(f"Opened shared memory ring '{SHM_NAME}' ({ring.capacity} bytes of data)")
 
     try:
         print(f"Connecting to Redis at {REDIS_HOST}:{REDIS_PORT}...")
         r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+        if SLOT_LEASING and lease_run_active(r):
+            print(f"Leases are live, worker {WORKER_ID} joins the run in progress")
+            asyncio.run(run_worker_inline(WORKER_ID, None, ring, signals))
+            return
+
         p = r.pubsub()
         p.subscribe(CHANNEL_NAME)
         print(f"Listening on channel '{CHANNEL_NAME}' for starting slot...")
@@ -154,8 +172,9 @@ def main():
                     starting_slot = int(data[0])
                     start_time = float(data[1])
 
-                    my_slot = starting_slot + WORKER_ID
-                    my_delay = WORKER_ID * 0.4
+                    # With leases every worker starts from the signal's slot; ranges spread the work
+                    my_slot = starting_slot if SLOT_LEASING else starting_slot + WORKER_ID
+                    my_delay = 0 if SLOT_LEASING else WORKER_ID * 0.4
                     my_start_time = start_time + my_delay
                     current_time = time.time()
                     wait_time = my_start_time - current_time
@@ -171,8 +190,8 @@ def main():
                     # We run this special worker to write to SHM
                     if WORKER_ID <= 5:
                         print("Running worker inline, will write to SHM...")
-                        # Pass the shm buffer to the async worker
-                        asyncio.run(run_worker_inline(WORKER_ID, my_slot, shm.buf))
+                        # Pass the shm ring to the async worker
+                        asyncio.run(run_worker_inline(WORKER_ID, my_slot, ring, signals))
                         print("Worker finished!")
                         break # Exit after one run
                     else:
@@ -0,0 +1,217 @@
+"""
+Synthetic inputs for benchmark.py: getBlock replies and receiver-shaped Arrow batches.
+
+make_block() builds a raw JSON-RPC getBlock reply laid out the way the RPC
+serialises it (keys in alphabetical order, no whitespace), so block_scan's
+`{"meta":` prefilter, the InstructionMatcher and pool_decoder all see
+realistic text. Knobs:
+
+    tx_count          transactions in the block
+    logs_per_tx       log lines per transaction (roughly)
+    v0_share          fraction of v0 transactions with lookup-table accounts
+    target_density    fraction of transactions that create a pool (one of
+                      the POOL_LAYOUTS instructions, so they decode locally)
+
+make_arrow_batch() builds a RecordBatch with the receiver's
+wallet / signature / mint / pre_balance / post_balance schema (all utf8,
+see RECEIVER/stage2_processing.cpp) plus the "timestamp:<blockTime>"
+metadata it sends; `watched_share` of the rows hit the watchlist from
+make_watchlist().
+
+Everything is driven by a seeded random.Random, so a given set of arguments
+always produces the same data.
+"""
+
+import json
+import random
+import time
+
+from pool_decoder import POOL_LAYOUTS
+
+_B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+SYSTEM_PROGRAM = "11111111111111111111111111111111"
+COMPUTE_BUDGET = "ComputeBudget111111111111111111111111111111"
+TOKEN_PROGRAM = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
+FILLER_PROGRAMS = [SYSTEM_PROGRAM, TOKEN_PROGRAM, "JUP6LkbZbjS1jKKwapdHNy74zcZ3tLUZoi5QNyVTaV4",
+                   "whirLbMiicVdio4qvUfM5KAg6Ct8VwpYzGff3uctyCc"]
+FILLER_INSTRUCTIONS = ["Transfer", "TransferChecked", "Swap", "SyncNative", "CloseAccount"]
+
+
+def b58encode(data):
+    n = int.from_bytes(data, "big")
+    out = []
+    while n:
+        n, rem = divmod(n, 58)
+        out.append(_B58_ALPHABET[rem])
+    pad = len(data) - len(data.lstrip(b"\x00"))
+    return "1" * pad + "".join(reversed(out))
+
+
+def _address(rng):
+    return b58encode(rng.getrandbits(256).to_bytes(32, "big"))
+
+
+def _filler_logs(rng, count):
+    logs = []
+    while len(logs) < count:
+        prog = rng.choice(FILLER_PROGRAMS)
+        logs.append(f"Program {prog} invoke [1]")
+        logs.append(f"Program log: Instruction: {rng.choice(FILLER_INSTRUCTIONS)}")
+        logs.append(f"Program {prog} consumed {rng.randint(300, 60000)} of 200000 compute units")
+        logs.append(f"Program {prog} success")
+    return logs[:count]
+
+
+def _transaction(rng, logs_per_tx, v0, target):
+    """Returns (tx dict, pool address or None)."""
+    static = [_address(rng) for _ in range(rng.randint(4, 12))]
+    loaded_w, loaded_r = [], []
+    instructions = [{"accounts": [], "data": b58encode(bytes([2]) + rng.randbytes(4)),
+                     "programIdIndex": len(static), "stackHeight": None}]
+    static.append(COMPUTE_BUDGET)
+    logs = [f"Program {COMPUTE_BUDGET} invoke [1]", f"Program {COMPUTE_BUDGET} success"]
+    pool_address = None
+
+    if target is not None:
+        prog_id, (name, prefix, positions) = target
+        accounts = [_address(rng) for _ in range(max(positions.values()) + 3)]
+        if v0:
+            # Pool vaults resolve through a lookup table, like most real creations
+            split = len(accounts) // 2
+            static_part, loaded_w = accounts[:split], accounts[split:]
+        else:
+            static_part = accounts
+        base = len(static)
+        static.extend(static_part)
+        static.append(prog_id)
+        prog_index = len(static) - 1
+        ix_accounts = list(range(base, base + len(static_part)))
+        instructions.append({"accounts": ix_accounts, "data": b58encode(prefix + rng.randbytes(16)),
+                             "programIdIndex": prog_index, "stackHeight": None,
+                             "_loaded": len(loaded_w)})
+        pool_address = accounts[positions["pool_address"]]
+        logs += [f"Program {prog_id} invoke [1]", f"Program log: Instruction: {name}",
+                 f"Program {prog_id} consumed 60000 of 200000 compute units", f"Program {prog_id} success"]
+
+    if v0 and not loaded_w:
+        loaded_w = [_address(rng) for _ in range(rng.randint(1, 6))]
+        loaded_r = [_address(rng) for _ in range(rng.randint(0, 4))]
+    logs += _filler_logs(rng, max(0, logs_per_tx - len(logs)))
+
+    # Loaded addresses come after every static key (writable first, then readonly)
+    for ix in instructions:
+        extra = ix.pop("_loaded", 0)
+        if extra:
+            ix["accounts"] += list(range(len(static), len(static) + extra))
+
+    n_keys = len(static) + len(loaded_w) + len(loaded_r)
+    message = {
+        "accountKeys": static,
+        "header": {"numReadonlySignedAccounts": 0, "numReadonlyUnsignedAccounts": 2, "numRequiredSignatures": 1},
+        "instructions": instructions,
+        "recentBlockhash": _address(rng),
+    }
+    if v0:
+        message["addressTableLookups"] = [{
+            "accountKey": _address(rng),
+            "readonlyIndexes": list(range(len(loaded_r))),
+            "writableIndexes": list(range(len(loaded_w))),
+        }]
+    tx = {
+        "meta": {
+            "computeUnitsConsumed": rng.randint(1000, 200000),
+            "err": None,
+            "fee": 5000,
+            "innerInstructions": [],
+            "loadedAddresses": {"readonly": loaded_r, "writable": loaded_w},
+            "logMessages": logs,
+            "postBalances": [rng.randint(0, 10 ** 12) for _ in range(n_keys)],
+            "postTokenBalances": [],
+            "preBalances": [rng.randint(0, 10 ** 12) for _ in range(n_keys)],
+            "preTokenBalances": [],
+            "rewards": [],
+            "status": {"Ok": None},
+        },
+        "transaction": {"message": message, "signatures": [b58encode(rng.randbytes(64))]},
+        "version": 0 if v0 else "legacy",
+    }
+    return tx, pool_address
+
+
+def make_block(slot=300000000, tx_count=1500, logs_per_tx=12, v0_share=0.6, target_density=0.001,
+               block_time=None, seed=0):
+    """
+    Returns (reply_text, pool_addresses): a raw getBlock reply and the pools
+    a correct detector finds in it.
+    """
+    rng = random.Random(f"{seed}:{slot}")
+    targets = [(prog_id, layout) for prog_id, layouts in POOL_LAYOUTS.items() for layout in layouts]
+    txs, pools = [], []
+    for _ in range(tx_count):
+        target = rng.choice(targets) if rng.random() < target_density else None
+        tx, pool_address = _transaction(rng, logs_per_tx, rng.random() < v0_share, target)
+        txs.append(tx)
+        if pool_address:
+            pools.append(pool_address)
+
+    result = {
+        "blockHeight": slot - 20000000,
+        "blockTime": int(time.time()) if block_time is None else block_time,
+        "blockhash": _address(rng),
+        "parentSlot": slot - 1,
+        "previousBlockhash": _address(rng),
+        "rewards": [],
+        "transactions": txs,
+    }
+    body = json.dumps(result, sort_keys=True, separators=(",", ":"))
+    return f'{{"jsonrpc":"2.0","result":{body},"id":{slot}}}', pools
+
+
+# --- Arrow Batches ---
+
+def make_watchlist(pools=200, seed=0):
+    """
+    Watchlist sets and price maps in the shape SolanaFlightServer._get_redis_data()
+    returns: (base_vaults, quote_vaults, base_mints, quote_mints, base_prices, quote_prices).
+    """
+    rng = random.Random(f"watch:{seed}")
+    base_v = [_address(rng) for _ in range(pools)]
+    quote_v = [_address(rng) for _ in range(pools)]
+    base_m = [_address(rng) for _ in range(pools)]
+    quote_m = [_address(rng) for _ in range(pools)]
+    base_p = {v: f"{rng.uniform(0.0001, 5):.8f}" for v in base_v}
+    quote_p = {v: f"{rng.uniform(0.5, 200):.8f}" for v in quote_v}
+    return set(base_v), set(quote_v), set(base_m), set(quote_m), base_p, quote_p
+
+
+def make_arrow_batch(rows=5000, watchlist=None, watched_share=0.05, block_time=None, seed=0):
+    """Returns (RecordBatch, metadata bytes) as the receiver sends them to the Flight server."""
+    import pyarrow as pa  # Only this generator needs pyarrow
+
+    rng = random.Random(f"arrow:{seed}:{rows}")
+    if watchlist is None:
+        watchlist = make_watchlist(seed=seed)
+    vaults = sorted(watchlist[0] | watchlist[1])
+    mints = sorted(watchlist[2] | watchlist[3])
+
+    wallets, signatures, tokens, pre, post = [], [], [], [], []
+    signature = b58encode(rng.randbytes(64))
+    for i in range(rows):
+        if i % 4 == 0:
+            signature = b58encode(rng.randbytes(64))  # A few balance rows per transaction
+        watched = rng.random() < watched_share
+        wallets.append(rng.choice(vaults) if watched else _address(rng))
+        tokens.append(rng.choice(mints) if watched else _address(rng))
+        signatures.append(signature)
+        before = rng.randint(0, 10 ** 12)
+        pre.append(str(before))
+        post.append(str(max(0, before + rng.randint(-10 ** 9, 10 ** 9))))
+
+    batch = pa.RecordBatch.from_arrays(
+        [pa.array(wallets, pa.utf8()), pa.array(signatures, pa.utf8()), pa.array(tokens, pa.utf8()),
+         pa.array(pre, pa.utf8()), pa.array(post, pa.utf8())],
+        names=["wallet", "signature", "mint", "pre_balance", "post_balance"],
+    )
+    stamp = int(time.time()) if block_time is None else block_time
+    return batch, f"timestamp:{stamp}".encode()
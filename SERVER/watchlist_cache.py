@@ -0,0 +1,188 @@
+"""
+In-process copy of the Redis watchlists and price maps, kept current by push.
+
+The Flight server used to fetch every watchlist set and price hash from Redis
+for every chunk. WatchlistCache loads them once and then follows Redis
+keyspace notifications for exactly those keys:
+
+  - every SADD / SREM / HSET / DEL on a watched key (pool_writer.py,
+    redis_map_editor.py, priceAPIfiller.py, init_redis_maps.py all write
+    through plain commands) marks that key dirty,
+  - dirty keys are re-read together after WATCHLIST_DEBOUNCE, so a burst of
+    price updates costs one reload, not one per update,
+  - a full resync every WATCHLIST_RESYNC_INTERVAL is the safety net for
+    lost notifications.
+
+notify-keyspace-events is server-wide configuration of the shared Redis, so
+the cache only changes it when WATCHLIST_NOTIFY=1. Otherwise it uses the
+notifications if the server already has them on, and falls back to polling
+(a full reload every WATCHLIST_POLL_INTERVAL) if not.
+
+Readers take `cache.snapshot`: an immutable WatchlistSnapshot (version, raw
+data, the value built from it, load time) that the background thread
+replaces with a single attribute assignment, so the hot path takes no lock
+and always sees one consistent version. `build` turns the raw tuple into
+whatever the reader wants (ArrowWatchlist for the Flight server) once per
+version instead of once per chunk.
+
+When Redis is unreachable (or a reload fails in any other way) the last good
+snapshot stays in place; the thread reconnects with backoff and does a full
+reload once it is back, since the notifications in between were lost.
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+
+import redis
+
+WATCHLIST_DEBOUNCE = 0.05          # Seconds to gather changes before reloading the dirty keys
+WATCHLIST_RESYNC_INTERVAL = 30.0   # Full reload even with notifications
+WATCHLIST_POLL_INTERVAL = 1.0      # Full reload period when the server sends no notifications
+WATCHLIST_RETRY_DELAY = 1.0        # Seconds after a Redis error, doubled up to WATCHLIST_RETRY_MAX
+WATCHLIST_RETRY_MAX = 30.0
+WATCHLIST_KEYSPACE_EVENTS = "Kshg"  # Keyspace channel + set, hash and generic (DEL/RENAME/EXPIRE) events
+# CONFIG SET notify-keyspace-events on the (shared) server; off = use them only if already enabled
+WATCHLIST_NOTIFY = os.environ.get("WATCHLIST_NOTIFY", "") not in ("", "0")
+
+WatchlistSnapshot = namedtuple("WatchlistSnapshot", "version data built loaded_at")
+
+
+def keyspace_events(redis_client, enable=False):
+    """
+    True if the server sends the keyspace events we need. With `enable`, adds
+    the missing event classes to notify-keyspace-events first. False if they
+    are off or the server refuses CONFIG.
+    """
+    try:
+        current = redis_client.config_get("notify-keyspace-events").get("notify-keyspace-events", "")
+        have = set(current.replace("A", "g$lshzxet"))
+        missing = "".join(c for c in WATCHLIST_KEYSPACE_EVENTS if c not in have)
+        if missing and enable:
+            redis_client.config_set("notify-keyspace-events", current + missing)
+            return True
+        return not missing
+    except redis.RedisError as e:
+        print(f"[Watchlist] Keyspace notifications unavailable ({e})")
+        return False
+
+
+class WatchlistCache:
+    def __init__(self, redis_client, keys, build=None, db=0):
+        """
+        `keys` is [(redis key, "set" | "hash"), ...]; snapshot.data holds the
+        members / mappings in the same order.
+        """
+        self.redis = redis_client
+        self.keys = list(keys)
+        self.build = build or (lambda *data: data)
+        self.channels = {f"__keyspace@{db}__:{key}": i for i, (key, _) in enumerate(self.keys)}
+        empty = tuple(set() if kind == "set" else {} for _, kind in self.keys)
+        self.snapshot = WatchlistSnapshot(0, empty, self.build(*empty), None)
+        self.stopped = False
+        self._thread = None
+        self._retry_delay = WATCHLIST_RETRY_DELAY
+
+        self.reloads = 0
+        self.notifications = 0
+        self.errors = 0
+
+    def replace(self, data):
+        """Publishes `data` as the next version (readers switch on their next access)."""
+        data = tuple(data)
+        self.snapshot = WatchlistSnapshot(self.snapshot.version + 1, data, self.build(*data), time.time())
+
+    def _read(self, indices):
+        pipe = self.redis.pipeline(transaction=False)
+        for i in indices:
+            key, kind = self.keys[i]
+            if kind == "set":
+                pipe.smembers(key)
+            else:
+                pipe.hgetall(key)
+        return pipe.execute()
+
+    def reload(self, indices=None):
+        """Re-reads the given keys (all by default); only a real change makes a new version."""
+        indices = sorted(range(len(self.keys)) if indices is None else indices)
+        values = self._read(indices)
+        current = self.snapshot
+        data = list(current.data)
+        for i, value in zip(indices, values):
+            data[i] = value
+        self.reloads += 1
+        if tuple(data) != current.data:
+            self.replace(data)
+        elif current.loaded_at is None:
+            self.snapshot = current._replace(loaded_at=time.time())
+
+    def start(self):
+        """Loads once (so the first chunks are enriched) and starts following changes."""
+        try:
+            self.reload()
+        except Exception as e:
+            self.errors += 1
+            print(f"[Watchlist] Initial load failed ({e}); enriching with empty watchlists until Redis answers")
+        self._thread = threading.Thread(target=self._run, name="watchlist-cache", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+
+    def _follow(self):
+        if keyspace_events(self.redis, enable=WATCHLIST_NOTIFY):
+            resync_interval = WATCHLIST_RESYNC_INTERVAL
+        else:
+            resync_interval = WATCHLIST_POLL_INTERVAL
+            print(f"[Watchlist] No keyspace notifications (WATCHLIST_NOTIFY=1 enables them); "
+                  f"polling every {resync_interval:.0f}s")
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(*self.channels)
+            # Subscribed first, then reloaded: nothing can change unseen in between
+            self.reload()
+            self._retry_delay = WATCHLIST_RETRY_DELAY
+            dirty = set()
+            due = None
+            last_sync = time.monotonic()
+            while not self.stopped:
+                message = pubsub.get_message(timeout=WATCHLIST_DEBOUNCE if dirty else 1.0)
+                if message is not None and message["type"] == "message":
+                    index = self.channels.get(message["channel"])
+                    if index is not None:
+                        self.notifications += 1
+                        dirty.add(index)
+                        if due is None:
+                            due = time.monotonic() + WATCHLIST_DEBOUNCE
+                now = time.monotonic()
+                if now - last_sync >= resync_interval:
+                    self.reload()
+                    last_sync = now
+                    dirty.clear()
+                    due = None
+                elif dirty and now >= due:
+                    self.reload(dirty)
+                    dirty.clear()
+                    due = None
+        finally:
+            pubsub.close()
+
+    def _run(self):
+        while not self.stopped:
+            try:
+                self._follow()
+            except Exception as e:
+                self.errors += 1
+                delay = self._retry_delay
+                kind = "Redis error" if isinstance(e, redis.RedisError) else f"Error ({type(e).__name__})"
+                print(f"[Watchlist] {kind}: {e}; keeping snapshot v{self.snapshot.version}, retrying in {delay:.0f}s")
+                time.sleep(delay)
+                self._retry_delay = min(delay * 2, WATCHLIST_RETRY_MAX)
+
+    def describe(self):
+        snap = self.snapshot
+        age = f"{time.time() - snap.loaded_at:.1f}s old" if snap.loaded_at else "never loaded"
+        return (f"v{snap.version} ({age}) | reloads {self.reloads}, "
+                f"notifications {self.notifications}, errors {self.errors}")